@@ -0,0 +1,155 @@
+"""
+Arquivamento de pedidos antigos (hot/cold).
+
+Pedidos entregues e pedidos com erro antigos saem da tabela `orders` e vão
+para `orders_archive`, em um arquivo SQLite separado anexado a cada conexão
+(`ATTACH ... AS archive`). A tabela quente fica só com o que o rastreio e o
+painel consultam no dia a dia; `order_data_json` é gravado no arquivo morto
+comprimido com zlib (BLOB).
+
+Cada lote é copiado e removido em uma transação. Com WAL a transação é
+atômica por arquivo: se o processo cair entre os dois commits, o pedido fica
+nas duas tabelas até o próximo lote, que substitui a cópia arquivada e o
+remove da tabela quente.
+"""
+import logging
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+from db import Database
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_TOTAL = metrics.counter(
+    "bagy_frenet_orders_archived_total",
+    "Pedidos movidos para o arquivo morto por status",
+    ["status"],
+)
+
+# Marca dos blobs comprimidos (JSON em texto não começa com este byte)
+COMPRESSED_PREFIX = b"\x00z"
+
+
+def compress_json(value: Optional[str]) -> Optional[bytes]:
+    """Comprime o JSON de um pedido para o arquivo morto."""
+    if value is None or isinstance(value, bytes):
+        return value
+    return COMPRESSED_PREFIX + zlib.compress(value.encode("utf-8"), 6)
+
+
+def decompress_json(value: Any) -> Any:
+    """JSON original de um blob do arquivo morto (valores em texto são devolvidos sem mudança)."""
+    if isinstance(value, bytes) and value.startswith(COMPRESSED_PREFIX):
+        return zlib.decompress(value[len(COMPRESSED_PREFIX):]).decode("utf-8")
+    return value
+
+
+class OrderArchive:
+    """Tabela orders_archive no banco anexado `alias`, com as mesmas colunas de orders."""
+
+    def __init__(self, database: Database, alias: str = "archive", compressed_columns: Tuple[str, ...] = ("order_data_json",)):
+        self.database = database
+        self.alias = alias
+        self.table = f"{alias}.orders_archive"
+        self.compressed_columns = compressed_columns
+        self.init()
+
+    def init(self):
+        """Cria a tabela do arquivo morto e acrescenta as colunas que orders ganhou desde a última execução."""
+        hot = self.database.fetchall("PRAGMA main.table_info(orders)")
+        with self.database.transaction():
+            self.database.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                id INTEGER PRIMARY KEY,
+                bagy_order_id TEXT NOT NULL UNIQUE,
+                archived_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )""")
+            existing = {row[1] for row in self.database.fetchall(f"PRAGMA {self.alias}.table_info(orders_archive)")}
+            for _, column, column_type, *_ in hot:
+                if column not in existing:
+                    self.database.execute(f"ALTER TABLE {self.table} ADD COLUMN {column} {column_type}")
+            # Mesma ordenação da listagem de /orders: (created_at, id), com ou sem filtro de status
+            self.database.execute(f"""
+            CREATE INDEX IF NOT EXISTS {self.alias}.idx_archive_created ON orders_archive(created_at, id)
+            """)
+            self.database.execute(f"""
+            CREATE INDEX IF NOT EXISTS {self.alias}.idx_archive_status_created ON orders_archive(status, created_at, id)
+            """)
+            # Totais por status mantidos por triggers (stats() em O(1) para o /health)
+            self.database.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.alias}.orders_archive_counts (
+                status TEXT PRIMARY KEY,
+                total INTEGER NOT NULL DEFAULT 0
+            )""")
+            self.database.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {self.alias}.trg_archive_count_insert AFTER INSERT ON orders_archive BEGIN
+                INSERT INTO orders_archive_counts(status, total) VALUES (new.status, 1)
+                ON CONFLICT(status) DO UPDATE SET total = total + 1;
+            END""")
+            self.database.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {self.alias}.trg_archive_count_delete AFTER DELETE ON orders_archive BEGIN
+                UPDATE orders_archive_counts SET total = total - 1 WHERE status = old.status;
+            END""")
+
+    def hot_columns(self) -> List[str]:
+        return [row[1] for row in self.database.fetchall("PRAGMA main.table_info(orders)")]
+
+    def archive_batch(self, delivered_before: str, error_before: str, limit: int = 500) -> Dict[str, Dict[str, int]]:
+        """
+        Move até `limit` pedidos 'delivered' atualizados pela última vez antes de
+        delivered_before e 'error' antes de error_before (updated_at: um pedido antigo
+        entregue ou que falhou agora não é arquivado na hora). Pedidos com atualização
+        pendente na outbox da Bagy ficam na tabela quente.
+
+        Retorna {"moved": {status: quantidade}, "replaced": {status: quantidade}}, em que
+        replaced são cópias arquivadas antes e substituídas agora.
+
+        Participa da transação em andamento, se houver.
+        """
+        con = self.database.connection()
+        con.create_function("archive_compress", 1, compress_json, deterministic=True)
+        columns = self.hot_columns()
+        source = ", ".join(f"archive_compress({c})" if c in self.compressed_columns else c for c in columns)
+
+        with self.database.transaction():
+            rows = self.database.fetchall("""
+            SELECT id, status FROM main.orders
+            WHERE ((status = 'delivered' AND updated_at < ?) OR (status = 'error' AND updated_at < ?))
+              AND NOT EXISTS (SELECT 1 FROM main.fulfillment_outbox f WHERE f.order_id = orders.bagy_order_id)
+            LIMIT ?
+            """, (delivered_before, error_before, limit))
+            if not rows:
+                return {"moved": {}, "replaced": {}}
+            ids = [row[0] for row in rows]
+            placeholders = ",".join("?" for _ in ids)
+            # Cópia anterior do mesmo pedido (lote interrompido ou pedido que voltou à tabela quente)
+            replaced = self.database.fetchall(f"""
+            DELETE FROM {self.table} WHERE bagy_order_id IN (
+                SELECT bagy_order_id FROM main.orders WHERE id IN ({placeholders})
+            )
+            RETURNING status""", ids)
+            self.database.execute(f"""
+            INSERT INTO {self.table}({", ".join(columns)})
+            SELECT {source} FROM main.orders WHERE id IN ({placeholders})
+            """, ids)
+            self.database.execute(f"DELETE FROM main.orders WHERE id IN ({placeholders})", ids)
+
+        result: Dict[str, Dict[str, int]] = {"moved": {}, "replaced": {}}
+        for key, statuses in (("moved", rows), ("replaced", replaced)):
+            for status in statuses:
+                result[key][status[-1]] = result[key].get(status[-1], 0) + 1
+        for status, count in result["moved"].items():
+            ARCHIVED_TOTAL.labels(status).inc(count)
+        return result
+
+    def status_of(self, order_id: str) -> Optional[str]:
+        """Status de um pedido arquivado (None se não estiver no arquivo morto)."""
+        row = self.database.fetchone(f"SELECT status FROM {self.table} WHERE bagy_order_id = ?", (order_id,))
+        return row[0] if row else None
+
+    def stats(self) -> Dict[str, Any]:
+        """Pedidos arquivados por status (para /health)."""
+        rows = self.database.fetchall(f"SELECT status, total FROM {self.alias}.orders_archive_counts WHERE total != 0")
+        by_status = {status: count for status, count in rows}
+        return {"total": sum(by_status.values()), "by_status": by_status}
@@ -0,0 +1,8 @@
+"""
+Benchmarks offline do webhook Bagy-Frenet.
+
+Os scripts deste pacote usam servidores locais (bench/stubs.py) no lugar
+das APIs reais da Bagy e da Frenet. Execute a partir da raiz do projeto:
+
+    python -m bench.bench_tracking_batch --orders 5000
+"""
@@ -0,0 +1,145 @@
+"""
+Benchmark do arquivo morto: consultas da tabela quente antes e depois de arquivar.
+
+Para cada tamanho, cria um banco em que `--history-ratio` dos pedidos são entregas
+antigas (com `order_data_json` do tamanho de um pedido real, incluindo a resposta
+da Frenet) e mede, antes e depois de `archive_sweep()`:
+
+- a busca dos pedidos vencidos (db_pending)
+- a primeira página de /orders com status=shipped (só tabela quente) e status=all
+  (tabela quente + arquivo morto, todas as colunas)
+- `--pages` páginas seguidas de status=all com fields=summary (cursor)
+- o espaço ocupado por orders (páginas em uso) e o tamanho do arquivo morto
+
+    python -m bench.bench_archive --rows 10000,100000 --history-ratio 0.9
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from archive import OrderArchive
+from bench.bench_payload import synthetic_order
+from bench.results import emit, latency_summary
+from db import Database
+from outbox import FulfillmentOutbox
+from payload import build_order_data
+from tracking_events import TrackingEventLog
+
+SEED_CHUNK = 20000
+
+
+def seed_history(db_path: str, rows: int, history_ratio: float, timestamp) -> int:
+    """Preenche `rows` pedidos; retorna quantos são entregas antigas (candidatas ao arquivo morto)."""
+    history_every = max(1, round(1 / (1 - history_ratio))) if history_ratio < 1 else 0
+    old, recent, past = timestamp(-200 * 86400), timestamp(-86400), timestamp(-60)
+    order_data = build_order_data(synthetic_order(1, 3))
+    order_data["frenet_response"] = {"OrderId": "FR-1", "ShippingServices": [{"Carrier": "Loggi", "Price": 12.5}] * 8}
+    blob = json.dumps(order_data, ensure_ascii=False)
+    history = 0
+    with sqlite3.connect(db_path) as con:
+        for start in range(0, rows, SEED_CHUNK):
+            chunk = []
+            for i in range(start, min(start + SEED_CHUNK, rows)):
+                if history_every and i % history_every == 0:
+                    chunk.append((f"ARCH-{i}", f"BR{i:09d}", "shipped", past, recent, blob))
+                else:
+                    chunk.append((f"ARCH-{i}", f"BR{i:09d}", "delivered", past, old, blob))
+                    history += 1
+            con.executemany("""
+            INSERT INTO orders(bagy_order_id, tracking_code, status, next_check_at, created_at, order_data_json)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, chunk)
+        con.commit()
+    return history
+
+
+def timed(fn: Callable[[], Any], repeats: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return latency_summary(samples)
+
+
+def walk_pages(app, pages: int):
+    cursor = None
+    for _ in range(pages):
+        _, cursor = app.db_list_orders(status="all", fields=list(app.ORDER_SUMMARY_FIELDS), limit=100, cursor=cursor)
+        if not cursor:
+            return
+
+
+def measure(app, repeats: int, pages: int) -> Dict[str, Any]:
+    used = app.database.fetchone(
+        "SELECT (page_count - freelist_count) * page_size FROM pragma_page_count(), pragma_freelist_count(), pragma_page_size()"
+    )[0]
+    return {
+        "pending_query_ms": timed(app.db_pending, repeats),
+        "orders_shipped_page_ms": timed(lambda: app.db_list_orders(status="shipped", limit=100), repeats),
+        "orders_all_page_ms": timed(lambda: app.db_list_orders(status="all", limit=100), repeats),
+        "orders_all_walk_ms": timed(lambda: walk_pages(app, pages), max(1, repeats // 5)),
+        "hot_rows": app.database.fetchone("SELECT COUNT(*) FROM main.orders")[0],
+        "hot_bytes_used": used,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10000,100000", help="tamanhos da tabela orders")
+    parser.add_argument("--history-ratio", type=float, default=0.9, help="fração de entregas antigas")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pages", type=int, default=20, help="páginas percorridas com cursor")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bench-archive-")
+    os.environ.update({
+        "DB_PATH": os.path.join(workdir, "init.db"),
+        "BAGY_TOKEN": "bench",
+        "FRENET_TOKEN": "bench",
+        "TRACKER_ENABLED": "false",
+        "ARCHIVE_ENABLED": "true",
+        "ARCHIVE_BATCH_SIZE": str(args.batch_size),
+    })
+    logging.disable(logging.ERROR)
+    import main as app
+
+    for rows in [int(x) for x in args.rows.split(",")]:
+        app.DB_PATH = os.path.join(workdir, f"archive-{rows}.db")
+        app.ARCHIVE_DB_PATH = os.path.join(workdir, f"archive-{rows}-archive.db")
+        app.database = Database(app.DB_PATH, attach={"archive": app.ARCHIVE_DB_PATH})
+        app.db_init()
+        app.fulfillment_outbox = FulfillmentOutbox(app.database)
+        app.tracking_event_log = TrackingEventLog(app.database)
+        app.order_archive = OrderArchive(app.database)
+        app.stats_cache.invalidate()
+
+        history = seed_history(app.DB_PATH, rows, args.history_ratio, app.db_timestamp)
+        before = measure(app, args.repeats, args.pages)
+
+        started = time.perf_counter()
+        archived = app.archive_sweep()
+        archive_seconds = time.perf_counter() - started
+
+        after = measure(app, args.repeats, args.pages)
+        emit({
+            "benchmark": "archive",
+            "rows": rows,
+            "history": history,
+            "archived": sum(archived.values()),
+            "archive_seconds": round(archive_seconds, 3),
+            "archive_rows_per_second": round(sum(archived.values()) / archive_seconds) if archive_seconds else None,
+            "archive_file_bytes": os.path.getsize(app.ARCHIVE_DB_PATH),
+            "before": before,
+            "after": after,
+        })
+
+
+if __name__ == "__main__":
+    main()
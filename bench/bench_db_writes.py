@@ -0,0 +1,105 @@
+"""
+Benchmark de escrita no SQLite: conexão por operação (modo antigo) vs. db.Database.
+
+Várias threads gravam pedidos ao mesmo tempo, como as threads do gunicorn
+junto com o worker de rastreio. O modo antigo abre uma conexão por operação
+com o journal padrão; o novo reaproveita a conexão da thread com WAL,
+synchronous=NORMAL e busy_timeout.
+
+    python -m bench.bench_db_writes --threads 8 --writes 2000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from bench.results import emit
+from db import Database
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bagy_order_id TEXT UNIQUE NOT NULL,
+    tracking_code TEXT,
+    status TEXT NOT NULL DEFAULT 'created',
+    retry_count INTEGER DEFAULT 0,
+    last_error TEXT,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+)"""
+
+UPSERT = """
+INSERT INTO orders(bagy_order_id, tracking_code, status, updated_at)
+VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+ON CONFLICT(bagy_order_id) DO UPDATE SET
+    tracking_code = COALESCE(excluded.tracking_code, tracking_code),
+    status = excluded.status,
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+
+def write_legacy(path: str, order_id: str, errors: list):
+    try:
+        with sqlite3.connect(path) as con:
+            con.execute("SELECT retry_count FROM orders WHERE bagy_order_id = ?", (order_id,)).fetchone()
+            con.execute(UPSERT, (order_id, "BR" + order_id, "shipped"))
+            con.commit()
+    except sqlite3.OperationalError as e:
+        errors.append(str(e))
+
+
+def write_pooled(database: Database, order_id: str, errors: list):
+    try:
+        with database.transaction():
+            database.fetchone("SELECT retry_count FROM orders WHERE bagy_order_id = ?", (order_id,))
+            database.execute(UPSERT, (order_id, "BR" + order_id, "shipped"))
+    except sqlite3.OperationalError as e:
+        errors.append(str(e))
+
+
+def run(mode: str, threads: int, writes: int) -> dict:
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-db-"), "bench.db")
+    with sqlite3.connect(path) as con:
+        con.execute(SCHEMA)
+    database = Database(path)
+    errors: list = []
+
+    def worker(index: int):
+        for i in range(writes):
+            order_id = f"{index}-{i}"
+            if mode == "legacy":
+                write_legacy(path, order_id, errors)
+            else:
+                write_pooled(database, order_id, errors)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    duration = time.perf_counter() - started
+    total = threads * writes
+    return {
+        "benchmark": "db_writes",
+        "mode": mode,
+        "threads": threads,
+        "writes": total,
+        "duration_seconds": round(duration, 3),
+        "writes_per_second": round(total / duration, 1),
+        "errors": len(errors),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=1000, help="gravações por thread")
+    args = parser.parse_args(argv)
+    for mode in ("legacy", "pooled"):
+        emit(run(mode, args.threads, args.writes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark da outbox de fulfillment: entrega em massa de pedidos.
+
+Simula uma transportadora marcando `--orders` pedidos como entregues de uma vez.
+Mede quanto tempo o rastreio fica ocupado gravando os resultados (pedidos +
+outbox em uma transação) e quanto tempo o dispatcher leva para drenar a outbox
+contra o servidor local da Bagy, comparado com um PUT sequencial por pedido.
+
+    python -m bench.bench_fulfillment_outbox --orders 2000 --latency 0.05 --concurrency 16 --rate 200
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from bench.results import emit
+from bench.stubs import StubServer
+from tracking_events import observation_from_response
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.02, help="latência simulada por requisição (s)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=1000, help="requisições/segundo à Bagy")
+    parser.add_argument("--sequential-sample", type=int, default=100,
+                        help="pedidos enviados um a um para estimar o modo sequencial")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bench-outbox-")
+    with StubServer(latency=args.latency) as stub:
+        os.environ.update({
+            "DB_PATH": os.path.join(workdir, "bench.db"),
+            "BAGY_TOKEN": "bench",
+            "FRENET_TOKEN": "bench",
+            "BAGY_BASE": stub.url(),
+            "FULFILLMENT_CONCURRENCY": str(args.concurrency),
+            "FULFILLMENT_RATE_LIMIT": str(args.rate),
+        })
+        logging.disable(logging.WARNING)
+        import main as app
+
+        # Modo antigo: um PUT síncrono por pedido dentro do loop de rastreio
+        sample = min(args.sequential_sample, args.orders)
+        started = time.monotonic()
+        for i in range(sample):
+            app.bagy_mark_delivered(f"SEQ-{i}")
+        sequential = (time.monotonic() - started) / sample * args.orders
+        stub.reset_counters()
+
+        # Outbox: entregas gravadas pelo rastreio em uma transação, envio em background
+        orders = [(f"BENCH-{i}", f"BR{i:09d}") for i in range(args.orders)]
+        app.db_save_many([(order_id, code, "shipped", None) for order_id, code in orders])
+        delivered = observation_from_response({"CurrentStatus": "Objeto entregue ao destinatário"})
+        started = time.monotonic()
+        app.db_apply_observations([(order_id, code, delivered) for order_id, code in orders])
+        # Transições repetidas do mesmo pedido são descartadas
+        app.fulfillment_outbox.enqueue_many([(order_id, "delivered", code) for order_id, code in orders])
+        enqueue_seconds = time.monotonic() - started
+
+        started = time.monotonic()
+        while app.fulfillment_dispatcher.drain_once():
+            pass
+        drain_seconds = time.monotonic() - started
+
+        emit({
+            "benchmark": "fulfillment_outbox",
+            "orders": args.orders,
+            "latency": args.latency,
+            "concurrency": args.concurrency,
+            "rate_limit": args.rate,
+            "sequential_estimate_seconds": round(sequential, 3),
+            "tracker_blocked_seconds": round(enqueue_seconds, 3),
+            "drain_seconds": round(drain_seconds, 3),
+            "drain_per_second": round(args.orders / drain_seconds, 1) if drain_seconds else None,
+            "upstream_requests": dict(stub.counters),
+            "outbox": app.fulfillment_outbox.stats(),
+        })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Custo do logging por pedido na thread da requisição.
+
+Reproduz as linhas que o webhook e o envio à Frenet logam por pedido e
+compara o modo anterior (f-strings, payload e resposta completos em INFO,
+StreamHandler síncrono) com logconfig: argumentos preguiçosos, QueueHandler
+(ou síncrono, `text_sync`) e os níveis INFO/QUIET, em texto e JSON. A saída
+vai para um arquivo temporário, para incluir o custo de escrita; com a fila,
+o listener disputa o GIL com a thread medida.
+
+    python -m bench.bench_logging --orders 20000
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict
+
+import logconfig
+from bench.bench_payload import synthetic_order
+from bench.results import emit
+from payload import build_order_data, build_shipment_payload
+
+logger = logging.getLogger("bench.logging")
+
+
+def legacy_order_logs(pedido: Dict[str, Any], payload: Dict[str, Any], response: Dict[str, Any]):
+    """Linhas por pedido antes do logconfig (f-strings formatadas sempre)."""
+    order_id, order_code = pedido["id"], pedido["code"]
+    logger.info(f"📥 Webhook POST recebido para pedido {order_id} (código: {order_code})")
+    logger.info(f"📦 Payload completo: {pedido}")
+    logger.info(f"🔢 Pedido - ID: {order_id}, Código: {order_code}")
+    logger.info(f"📊 Status do fulfillment: '{pedido['fulfillment_status']}'")
+    logger.info(f"✅ Pedido #{order_code} (ID: {order_id}) está FATURADO, processando...")
+    logger.info(f"📋 Enviando pedido #{order_code} (ID: {order_id}) para Frenet...")
+    logger.info(f"📤 Enviando para Frenet Shipments API...")
+    logger.info(f"📍 Origem: 03320-001 → Destino: {payload['RecipientZipCode']}")
+    logger.info(f"💰 Valor: R$ {payload['InvoiceValue']} | Peso: {payload['PackageWeight']}kg")
+    logger.info(f"👤 Cliente: {payload['RecipientName']} | Pedido: {order_code}")
+    logger.debug(f"Payload Frenet: {payload}")
+    logger.info(f"📥 Resposta Frenet: {response}")
+    logger.info(f"✅ Pedido #{order_code} criado na Frenet com sucesso!")
+    logger.info(f"🆔 ID Frenet: {response['OrderId']}")
+    logger.info(f"✅ Pedido #{order_code} (ID: {order_id}) enviado para Frenet com sucesso!")
+
+
+def current_order_logs(pedido: Dict[str, Any], payload: Dict[str, Any], response: Dict[str, Any]):
+    """Linhas por pedido com argumentos preguiçosos, dumps no logger 'payloads' e a linha de resumo."""
+    order_id, order_code = pedido["id"], pedido["code"]
+    logger.info("📥 Webhook POST recebido para pedido %s (código: %s)", order_id, order_code)
+    logconfig.payload_logger.debug("📦 Payload completo: %s", pedido)
+    logger.info("🔢 Pedido - ID: %s, Código: %s", order_id, order_code)
+    logger.info("📊 Status do fulfillment: '%s'", pedido["fulfillment_status"])
+    logger.info("✅ Pedido #%s (ID: %s) está FATURADO, processando...", order_code, order_id)
+    logger.info("📋 Enviando pedido #%s (ID: %s) para Frenet...", order_code, order_id)
+    logger.info("📤 Enviando para Frenet Shipments API...")
+    logger.info("📍 Origem: %s → Destino: %s", "03320-001", payload["RecipientZipCode"])
+    logger.info("💰 Valor: R$ %s | Peso: %skg", payload["InvoiceValue"], payload["PackageWeight"])
+    logger.info("👤 Cliente: %s | Pedido: %s", payload["RecipientName"], order_code)
+    logconfig.payload_logger.debug("📤 Payload Frenet: %s", payload)
+    logconfig.payload_logger.debug("📥 Resposta Frenet: %s", response)
+    logger.info("✅ Pedido #%s criado na Frenet com sucesso!", order_code)
+    logger.info("🆔 ID Frenet: %s", response["OrderId"])
+    logger.log(logconfig.SUMMARY, "📦 Pedido #%s (ID: %s) %s - HTTP %s em %sms", order_code, order_id,
+               "processed", 200, 12.3, extra={"order_id": order_id, "order_code": order_code, "outcome": "processed"})
+
+
+def measure(log_fn: Callable, orders, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for pedido, payload, response in orders:
+            log_fn(pedido, payload, response)
+        best = min(best, time.perf_counter() - started)
+    return best / len(orders) * 1e6
+
+
+def setup_legacy(path: str):
+    """Configuração anterior: basicConfig com StreamHandler síncrono."""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(open(path, "a", encoding="utf-8"))
+    handler.setFormatter(logging.Formatter(logconfig.TEXT_FORMAT, datefmt=logconfig.TEXT_DATEFMT))
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--queue-size", type=int, default=0, help="0 = fila sem limite (nenhum registro descartado)")
+    args = parser.parse_args(argv)
+
+    orders = []
+    for i in range(args.orders):
+        pedido = synthetic_order(i, 3)
+        payload = build_shipment_payload(build_order_data(pedido), 12.5)
+        orders.append((pedido, payload, {"OrderId": f"FR-{i}", "OrderNumber": pedido["code"]}))
+
+    workdir = tempfile.mkdtemp(prefix="bench-logging-")
+    stderr = sys.stderr
+    cases = [
+        ("legacy", None, None),
+        ("text_sync", "INFO", "text"),
+        ("text", "INFO", "text"),
+        ("json", "INFO", "json"),
+        ("quiet", "QUIET", "text"),
+        ("quiet_json", "QUIET", "json"),
+    ]
+    for name, level, fmt in cases:
+        path = os.path.join(workdir, f"{name}.log")
+        if level is None:
+            setup_legacy(path)
+            log_fn = legacy_order_logs
+        else:
+            sys.stderr = open(path, "a", encoding="utf-8")
+            logconfig.configure_logging(level=level, fmt=fmt, use_queue=not name.endswith("_sync"),
+                                        queue_size=args.queue_size)
+            log_fn = current_order_logs
+        try:
+            per_order_us = measure(log_fn, orders, args.rounds)
+        finally:
+            logconfig.stop_logging()
+            sys.stderr = stderr
+        emit({
+            "benchmark": "logging",
+            "mode": name,
+            "orders": args.orders,
+            "caller_us_per_order": round(per_order_us, 2),
+            "orders_per_second": round(1e6 / per_order_us),
+            "log_bytes_per_order": round(os.path.getsize(path) / (args.orders * args.rounds)),
+        })
+
+
+if __name__ == "__main__":
+    main()
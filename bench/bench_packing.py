@@ -0,0 +1,98 @@
+"""
+Benchmark do cálculo de pacotes: catálogo de SKUs e cubagem por pedido.
+
+- `catalog_refresh`: sincronização do catálogo com a listagem de produtos do
+  servidor local (`--products` produtos, cada um com duas variações)
+- `pack_items`: pacote de cada pedido com o catálogo em memória (o cálculo
+  feito por send_to_frenet_shipments e pelo POST /quote)
+
+Os pedidos têm de 1 a `--max-items` itens; `--unknown-ratio` dos itens usa SKUs
+fora do catálogo (peso do pedido, sem volume).
+
+    python -m bench.bench_packing --orders 20000 --products 2000 --max-items 8
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import packing
+from bench.results import emit
+from bench.stubs import StubServer, stub_environment
+
+
+def synthetic_orders(count: int, products: int, max_items: int, unknown_ratio: float, seed: int = 7) -> List[List[Dict[str, Any]]]:
+    """Itens (formato de build_order_data, peso em gramas) de `count` pedidos."""
+    rng = random.Random(seed)
+    orders = []
+    for _ in range(count):
+        items = []
+        for _ in range(rng.randint(1, max_items)):
+            if rng.random() < unknown_ratio:
+                sku = f"AVULSO-{rng.randrange(10**6)}"
+            else:
+                sku = f"SKU-{rng.randrange(products)}{rng.choice(('', '-P', '-G'))}"
+            items.append({"sku": sku, "name": "Produto", "quantity": rng.randint(1, 3), "weight": 500, "price": 50})
+        orders.append(items)
+    return orders
+
+
+def timed(fn) -> Dict[str, Any]:
+    started = time.perf_counter()
+    result = fn()
+    return {"result": result, "seconds": time.perf_counter() - started}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--products", type=int, default=2000, help="produtos no catálogo da Bagy")
+    parser.add_argument("--max-items", type=int, default=8, help="itens por pedido (1 a N)")
+    parser.add_argument("--unknown-ratio", type=float, default=0.1, help="fração de itens fora do catálogo")
+    parser.add_argument("--latency", type=float, default=0.01, help="latência simulada de cada página (s)")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bench-packing-")
+    with StubServer(latency=args.latency, products=args.products) as stub:
+        os.environ.update({
+            "DB_PATH": os.path.join(workdir, "packing.db"),
+            "BAGY_TOKEN": "bench",
+            "FRENET_TOKEN": "bench",
+            "TRACKER_ENABLED": "false",
+            **stub_environment(stub),
+        })
+        logging.disable(logging.ERROR)
+        import main as app
+
+        refresh = timed(app.catalog_sweep)
+        emit({
+            "benchmark": "packing",
+            "mode": "catalog_refresh",
+            "products": args.products,
+            "skus": refresh["result"]["skus"],
+            "pages": refresh["result"]["pages"],
+            "upstream_requests": dict(stub.counters),
+            "duration_seconds": round(refresh["seconds"], 3),
+            "skus_per_second": round(refresh["result"]["skus"] / refresh["seconds"]),
+        })
+
+    orders = synthetic_orders(args.orders, args.products, args.max_items, args.unknown_ratio)
+    run = timed(lambda: [app.order_package(items) for items in orders])
+    packages = run["result"]
+    emit({
+        "benchmark": "packing",
+        "mode": "pack_items",
+        "orders": args.orders,
+        "items": sum(len(items) for items in orders),
+        "estimated": sum(package.estimated for package in packages),
+        "fixed_package": sum(package.dimensions == packing.DEFAULT_PACKAGE for package in packages),
+        "duration_seconds": round(run["seconds"], 3),
+        "orders_per_second": round(args.orders / run["seconds"]),
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Microbenchmark da montagem do payload da Frenet Shipments.
+
+Compara payload.build_order_data + build_shipment_payload com a montagem antiga
+de send_to_frenet_shipments (payload e dados gravados montados separadamente,
+com vários `.get()` por campo e o payload formatado no log de debug mesmo com
+o nível INFO), verifica que os dois produzem o mesmo payload (exceto o peso, que
+agora conta a quantidade dos itens) e imprime payloads montados por segundo.
+
+    python -m bench.bench_payload --orders 20000 --items 3
+"""
+import argparse
+import logging
+import random
+import time
+from typing import Any, Dict
+
+from bench.results import emit
+from payload import build_order_data, build_shipment_payload
+
+logger = logging.getLogger("bench.payload")
+
+# Campos que mudaram de propósito desde a montagem antiga (packing.py soma quantidade × peso)
+CHANGED_FIELDS = ("PackageWeight",)
+
+
+def synthetic_order(i: int, items: int) -> Dict[str, Any]:
+    return {
+        "id": str(100000 + i),
+        "code": f"B{i}",
+        "fulfillment_status": "invoiced",
+        "total": 0 if i % 3 else 129.9,
+        "shipping_cost": 12.5,
+        "customer": {
+            "name": f"Cliente {i}",
+            "cpf": f"{i % 1000:03d}.456.789-{i % 100:02d}",
+            "email": f"cliente{i}@exemplo.com",
+            "phone": f"(11) 9{i % 10000:04d}-{i % 10000:04d}",
+        },
+        "address": {
+            "zipcode": f"0{i % 10000:04d}-100",
+            "street": "Av. Paulista",
+            "number": str(i % 3000),
+            "complement": "Apto 1" if i % 2 else "",
+            "district": "Bela Vista",
+            "city": "São Paulo",
+            "state": "SP",
+        },
+        "items": [
+            {"sku": f"SKU-{j}", "name": f"Produto {j}", "quantity": 1 + j % 2,
+             "weight": 300 + 50 * j, "price": round(random.uniform(10, 200), 2)}
+            for j in range(items)
+        ],
+    }
+
+
+def legacy_build_payload(pedido: Dict[str, Any], force_value: float = 10.0) -> Dict[str, Any]:
+    """Montagem anterior de send_to_frenet_shipments: payload + dados gravados (referência para comparação)."""
+    addr = pedido.get("address", {}) or pedido.get("shipping_address", {})
+    cust = pedido.get("customer", {})
+    items = pedido.get("items", []) or []
+    if not items:
+        items = [{"weight": 1, "length": 20, "height": 10, "width": 15, "quantity": 1}]
+    total_weight = sum(float(it.get("weight", 500)) for it in items) / 1000
+    total_weight = max(total_weight, 0.1)
+    invoice_value = float(pedido.get("total", 0)) or sum(
+        float(it.get("price", 0)) * int(it.get("quantity", 1)) for it in items
+    )
+    recipient_zipcode = addr.get("zipcode", "").replace("-", "").replace(".", "").strip()
+    recipient_name = cust.get("name", "Cliente")
+    recipient_phone = cust.get("phone", "").replace("(", "").replace(")", "").replace("-", "").replace(" ", "").strip()
+    recipient_email = cust.get("email", "")
+    recipient_cpf = cust.get("cpf", cust.get("document", "")).replace(".", "").replace("-", "").strip()
+    payload = {
+        "OrderNumber": str(pedido.get("code", "UNKNOWN")),
+        "RecipientDocument": recipient_cpf if recipient_cpf else "",
+        "RecipientName": recipient_name,
+        "RecipientEmail": recipient_email,
+        "RecipientPhone": recipient_phone,
+        "RecipientZipCode": recipient_zipcode,
+        "RecipientAddress": addr.get("street", addr.get("address", "")),
+        "RecipientAddressNumber": addr.get("number", "S/N"),
+        "RecipientAddressComplement": addr.get("complement", ""),
+        "RecipientAddressDistrict": addr.get("district", addr.get("neighborhood", "")),
+        "RecipientCity": addr.get("city", ""),
+        "RecipientState": addr.get("state", ""),
+        "RecipientCountry": "BR",
+        "PackageHeight": 10,
+        "PackageWidth": 15,
+        "PackageLength": 20,
+        "PackageWeight": total_weight,
+        "InvoiceValue": invoice_value,
+        "ShippingQuoteValue": float(pedido.get("shipping_cost", force_value)),
+        "Items": [
+            {
+                "SKU": it.get("sku", f"ITEM-{idx}"),
+                "Description": it.get("name", "Produto"),
+                "Quantity": int(it.get("quantity", 1)),
+                "Price": float(it.get("price", 0)),
+            }
+            for idx, it in enumerate(items, 1)
+        ],
+    }
+    order_data = {
+        "order_id": pedido.get("id"),
+        "order_code": pedido.get("code"),
+        "customer": {"name": recipient_name, "cpf": recipient_cpf, "email": recipient_email, "phone": recipient_phone},
+        "address": {
+            "zipcode": recipient_zipcode,
+            "street": addr.get("street", addr.get("address", "")),
+            "number": addr.get("number", "S/N"),
+            "complement": addr.get("complement", ""),
+            "neighborhood": addr.get("district", addr.get("neighborhood", "")),
+            "city": addr.get("city", ""),
+            "state": addr.get("state", ""),
+        },
+        "items": [
+            {"name": it.get("name", "Produto"), "quantity": it.get("quantity", 1),
+             "weight": it.get("weight", 500), "price": it.get("price", 0)}
+            for it in items
+        ],
+        "total_value": invoice_value,
+        "shipping_cost": float(pedido.get("shipping_cost", 0)),
+    }
+    logger.debug(f"Payload Frenet: {payload}")
+    return payload, order_data
+
+
+def current_build_payload(pedido: Dict[str, Any], force_value: float = 10.0):
+    order_data = build_order_data(pedido)
+    payload = build_shipment_payload(order_data, float(pedido.get("shipping_cost", force_value)))
+    logger.debug("Payload Frenet: %s", payload)
+    return payload, order_data
+
+
+def measure(fn, orders, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for order in orders:
+            fn(order)
+        best = min(best, time.perf_counter() - started)
+    return len(orders) / best
+
+
+def comparable(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in payload.items() if key not in CHANGED_FIELDS}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--items", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    random.seed(42)
+    orders = [synthetic_order(i, args.items) for i in range(args.orders)]
+    mismatches = sum(1 for order in orders if comparable(legacy_build_payload(order)[0]) != comparable(current_build_payload(order)[0]))
+
+    legacy = measure(legacy_build_payload, orders, args.rounds)
+    current = measure(current_build_payload, orders, args.rounds)
+    emit({
+        "benchmark": "payload",
+        "orders": args.orders,
+        "items_per_order": args.items,
+        "legacy_payloads_per_second": round(legacy),
+        "payloads_per_second": round(current),
+        "speedup": round(current / legacy, 2),
+        "mismatches": mismatches,
+    })
+
+
+if __name__ == "__main__":
+    main()
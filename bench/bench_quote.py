@@ -0,0 +1,101 @@
+"""
+Benchmark da cotação de frete: latência por origem da resposta e chamadas à Frenet.
+
+Gera `--requests` cotações para destinos sorteados com distribuição concentrada
+(poucas regiões recebem a maior parte dos pedidos, como no checkout real),
+pesos e dimensões variados, contra o servidor local de cotação. Mede:
+
+- `cold`: cache vazio; faixas novas vão à API, as repetidas saem da memória
+- `warm`: as mesmas cotações com o cache em memória preenchido
+- `restart`: outro QuoteEngine sobre o mesmo banco (memória vazia, faixas no SQLite)
+
+    python -m bench.bench_quote --requests 5000 --destinations 2000 --latency 0.02
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+from bench.results import emit, latency_summary
+from bench.stubs import StubServer, stub_environment
+from quote import QuoteEngine
+
+
+def synthetic_requests(count: int, destinations: int, seed: int = 7) -> List[Tuple[str, float, Tuple[int, int, int]]]:
+    """Cotações (cep, peso, dimensões); os destinos seguem uma distribuição de Pareto."""
+    rng = random.Random(seed)
+    ceps = [f"{rng.randrange(1000, 99999):05d}{rng.randrange(1000):03d}" for _ in range(destinations)]
+    requests = []
+    for _ in range(count):
+        index = min(int(rng.paretovariate(1.2)) - 1, destinations - 1)
+        weight = round(rng.uniform(0.1, 5.0), 3)
+        dims = (rng.randint(2, 30), rng.randint(10, 40), rng.randint(15, 50))
+        requests.append((ceps[index], weight, dims))
+    return requests
+
+
+def run_pass(engine: QuoteEngine, requests) -> Dict[str, Any]:
+    samples: Dict[str, List[float]] = defaultdict(list)
+    started = time.perf_counter()
+    for cep, weight, dims in requests:
+        call_started = time.perf_counter()
+        result = engine.quote(cep, weight, dims)
+        samples[result["source"]].append(time.perf_counter() - call_started)
+    duration = time.perf_counter() - started
+    return {
+        "duration_seconds": round(duration, 3),
+        "quotes_per_second": round(len(requests) / duration),
+        "by_source": {source: latency_summary(values) for source, values in sorted(samples.items())},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--destinations", type=int, default=2000, help="CEPs distintos")
+    parser.add_argument("--latency", type=float, default=0.02, help="latência simulada da cotação (s)")
+    parser.add_argument("--cep-prefix", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bench-quote-")
+    with StubServer(latency=args.latency) as stub:
+        os.environ.update({
+            "DB_PATH": os.path.join(workdir, "quote.db"),
+            "BAGY_TOKEN": "bench",
+            "FRENET_TOKEN": "bench",
+            "TRACKER_ENABLED": "false",
+            "QUOTE_CEP_PREFIX": str(args.cep_prefix),
+            **stub_environment(stub),
+        })
+        logging.disable(logging.ERROR)
+        import main as app
+
+        requests = synthetic_requests(args.requests, args.destinations)
+        engines = {"cold": app.quote_engine, "warm": app.quote_engine}
+        for name in ("cold", "warm", "restart"):
+            engine = engines.get(name) or QuoteEngine(
+                app.frenet_quote, database=app.database, ttl=app.QUOTE_CACHE_TTL, cache_size=app.QUOTE_CACHE_SIZE,
+                cep_prefix=app.QUOTE_CEP_PREFIX, weight_step=app.QUOTE_WEIGHT_STEP,
+                dimension_step=app.QUOTE_DIMENSION_STEP
+            )
+            stub.reset_counters()
+            result = run_pass(engine, requests)
+            emit({
+                "benchmark": "quote",
+                "pass": name,
+                "requests": args.requests,
+                "destinations": args.destinations,
+                "cep_prefix": args.cep_prefix,
+                "latency": args.latency,
+                **result,
+                "upstream_requests": dict(stub.counters),
+                "cached_ranges": engine.stats()["cache"]["size"],
+            })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark do reenvio em lote (replay.py) depois de uma indisponibilidade da Frenet.
+
+Cria `--orders` pedidos no fallback local (status 'pending' sem resposta da Frenet) e
+os reenvia ao servidor local de shipments em duas passagens com o mesmo nome de
+checkpoint:
+
+- `interrupted`: para depois de `--interrupt-after` pedidos (como um Ctrl+C)
+- `resume`: retoma a execução; os pedidos já enviados são pulados pelo checkpoint
+  (a seleção inclui os já aceitos pela Frenet, como `--include-sent`)
+
+Cada passagem mede a vazão e conta as chamadas à Frenet; no fim, confere que
+todos os pedidos foram enviados exatamente uma vez.
+
+    python -m bench.bench_replay --orders 10000 --concurrency 16 --rate 0 --latency 0.05
+"""
+import argparse
+import logging
+import os
+import tempfile
+
+from bench.bench_payload import synthetic_order
+from bench.results import emit
+from bench.stubs import StubServer, stub_environment
+from payload import build_order_data
+from replay import ReplayCheckpoint, ReplayRunner, count_orders, order_saver, select_orders
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--interrupt-after", type=int, default=None, help="pedidos da 1ª passagem (padrão: metade)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=0, help="envios por segundo (0 = sem limite)")
+    parser.add_argument("--latency", type=float, default=0.05, help="latência simulada da Frenet (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bench-replay-")
+    with StubServer(latency=args.latency, error_rate=args.error_rate) as stub:
+        os.environ.update({
+            "DB_PATH": os.path.join(workdir, "replay.db"),
+            "BAGY_TOKEN": "bench",
+            "FRENET_TOKEN": "bench",
+            "TRACKER_ENABLED": "false",
+            "RETRY_BASE_DELAY": "0.05",
+            "HTTP_POOL_MAXSIZE": str(max(args.concurrency, 20)),
+            **stub_environment(stub),
+        })
+        logging.disable(logging.ERROR)
+        import main as app
+
+        with app.database.transaction():
+            for i in range(args.orders):
+                order_data = build_order_data(synthetic_order(i, 3))
+                app.db_save(order_data["order_id"], tracking=None, status="pending", order_data=order_data)
+
+        save = order_saver(app.database, app.db_save, app.db_save_many)
+        checkpoint = ReplayCheckpoint(app.database, "bench")
+        statuses = ["pending", "error"]
+        passes = (("interrupted", args.interrupt_after or args.orders // 2), ("resume", None))
+        for name, limit in passes:
+            stub.reset_counters()
+            runner = ReplayRunner(app.send_to_frenet_shipments, checkpoint, save, concurrency=args.concurrency,
+                                  rate=args.rate, max_failures=0, progress_interval=3600)
+            total = count_orders(app.database, statuses, include_sent=True)
+            report = runner.run(select_orders(app.database, statuses, include_sent=True), total=total, limit=limit)
+            emit({
+                "benchmark": "replay",
+                "pass": name,
+                "orders": args.orders,
+                "concurrency": args.concurrency,
+                "rate": args.rate,
+                "latency": args.latency,
+                "error_rate": args.error_rate,
+                "selected": total,
+                **{key: report[key] for key in ("sent", "failed", "skipped", "duration_seconds", "orders_per_second")},
+                "upstream_requests": dict(stub.counters),
+            })
+
+        emit({
+            "benchmark": "replay",
+            "pass": "check",
+            "orders": args.orders,
+            "checkpoint": checkpoint.stats(),
+            "not_sent": count_orders(app.database, statuses),
+        })
+
+
+if __name__ == "__main__":
+    main()
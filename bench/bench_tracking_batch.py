@@ -0,0 +1,114 @@
+"""
+Benchmark do rastreio em lote contra o servidor local de rastreio.
+
+Mede, para cada tamanho de lote, a duração da varredura, a vazão e o número
+de chamadas à API de rastreio. Tamanho 0 usa o modo um-a-um. Cada tamanho
+roda duas passadas: a primeira (`first`) registra as mudanças de rastreio; a
+segunda (`unchanged`) consulta de novo os pedidos não entregues, que recebem a
+mesma resposta e só são reagendados. `apply_ms` é o tempo gravando os
+resultados no banco.
+
+    python -m bench.bench_tracking_batch --orders 5000 --batch-sizes 0,10,50,200 --latency 0.05
+    python -m bench.bench_tracking_batch --bulk   # simula um endpoint de rastreio em lote
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+from bench.results import emit, latency_summary
+from bench.stubs import StubServer
+from db import Database
+from outbox import FulfillmentOutbox
+from tracking_events import TrackingEventLog
+
+
+def seed_orders(db_path: str, count: int):
+    """Cria `count` pedidos enviados com código de rastreio."""
+    with sqlite3.connect(db_path) as con:
+        con.executemany(
+            "INSERT INTO orders(bagy_order_id, tracking_code, status) VALUES (?, ?, 'shipped')",
+            [(f"BENCH-{i}", f"BR{i:09d}") for i in range(count)],
+        )
+        con.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--batch-sizes", default="0,10,50,200")
+    parser.add_argument("--latency", type=float, default=0.02, help="latência simulada por requisição (s)")
+    parser.add_argument("--delivered-ratio", type=float, default=0.2)
+    parser.add_argument("--bulk", action="store_true", help="usa o endpoint de rastreio em lote do stub")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bench-tracking-")
+    with StubServer(latency=args.latency, delivered_ratio=args.delivered_ratio) as stub:
+        os.environ.update({
+            "DB_PATH": os.path.join(workdir, "init.db"),
+            "BAGY_TOKEN": "bench",
+            "FRENET_TOKEN": "bench",
+            "BAGY_BASE": stub.url(),
+            "TRACKING_API_URL": stub.url("/tracking/trackinginfo"),
+            "TRACKER_RATE_LIMIT": os.getenv("TRACKER_RATE_LIMIT", "1000"),
+        })
+        logging.disable(logging.INFO)
+        import main as app
+
+        if args.bulk:
+            app.TRACKING_BULK_URL = stub.url("/tracking/bulk")
+
+        apply_times = []
+        apply_observations = app.db_apply_observations
+
+        def timed_apply(observed):
+            started = time.perf_counter()
+            try:
+                return apply_observations(observed)
+            finally:
+                apply_times.append(time.perf_counter() - started)
+
+        app.db_apply_observations = timed_apply
+
+        for batch_size in [int(x) for x in args.batch_sizes.split(",")]:
+            app.DB_PATH = os.path.join(workdir, f"batch-{batch_size}.db")
+            app.database = Database(app.DB_PATH)
+            app.db_init()
+            app.fulfillment_outbox = FulfillmentOutbox(app.database)
+            app.tracking_event_log = TrackingEventLog(app.database)
+            seed_orders(app.DB_PATH, args.orders)
+
+            for sweep_pass in ("first", "unchanged"):
+                if sweep_pass == "unchanged":
+                    app.database.execute("UPDATE orders SET next_check_at = '1970-01-01 00:00:00' WHERE status != 'delivered'")
+                stub.reset_counters()
+                apply_times.clear()
+
+                pending = app.db_pending()
+                if batch_size > 0:
+                    result = app.tracking_engine.sweep_batches(pending, batch_size, app.track_batch)
+                else:
+                    result = app.tracking_engine.sweep(pending)
+
+                emit({
+                    "benchmark": "tracking_batch",
+                    "pass": sweep_pass,
+                    "batch_size": batch_size,
+                    "bulk": args.bulk,
+                    "orders": len(pending),
+                    "duration_seconds": result["duration_seconds"],
+                    "throughput_per_second": result["throughput_per_second"],
+                    "delivered": result["delivered"],
+                    "errors": result["errors"],
+                    "apply_ms": latency_summary(apply_times),
+                    "apply_ms_total": round(sum(apply_times) * 1000, 1),
+                    "tracking_events": app.tracking_event_log.stats()["total"],
+                    "upstream_requests": dict(stub.counters),
+                    "fulfillment_enqueued": app.fulfillment_outbox.stats()["pending"],
+                })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark do rastreio sharded: vazão da varredura conforme o número de processos.
+
+Para cada quantidade de workers, cria um banco com `--orders` pedidos vencidos e
+sobe N processos que executam `sharded_tracking_sweep()` ao mesmo tempo contra o
+servidor local de rastreio. Cada processo reserva lotes com `db_claim_pending()`;
+o resultado traz a vazão total, a escala em relação a 1 worker e quantos pedidos
+foram verificados mais de uma vez (deve ser 0).
+
+A concorrência por processo é fixa (`--concurrency`), então a vazão de um worker
+é limitada pela latência da API e cresce com o número de processos.
+
+    python -m bench.bench_tracking_shards --workers 1,2,4,8 --orders 4000 --latency 0.02
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from bench.bench_tracking_sweep import seed_orders
+from bench.results import emit
+from bench.stubs import StubServer, stub_environment
+from db import Database
+
+
+def run_worker(db_path: str, start_at: float, ids_path: str):
+    """Processo worker: espera start_at, executa uma varredura sharded e grava os pedidos verificados."""
+    os.environ["DB_PATH"] = db_path
+    import main as app
+
+    checked: List[str] = []
+    track_batch = app.track_batch
+
+    def recording_batch(batch):
+        checked.extend(order_id for order_id, _ in batch)
+        return track_batch(batch)
+
+    delay = start_at - time.time()
+    if delay > 0:
+        time.sleep(delay)
+    result = app.tracking_engine.sweep_claimed(
+        lambda: app.db_claim_pending(f"bench:{os.getpid()}", app.TRACKING_BATCH_SIZE, app.TRACKER_ROW_LEASE),
+        recording_batch,
+    )
+    with open(ids_path, "w", encoding="utf-8") as f:
+        json.dump({"finished_at": time.time(), "batches": result["batches"], "checked": checked}, f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4,8", help="quantidades de processos")
+    parser.add_argument("--orders", type=int, default=4000, help="pedidos vencidos por execução")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4, help="requisições simultâneas por processo")
+    parser.add_argument("--latency", type=float, default=0.02, help="latência simulada por requisição (s)")
+    parser.add_argument("--delivered-ratio", type=float, default=0.2)
+    parser.add_argument("--worker", nargs=3, metavar=("DB", "START_AT", "IDS"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        logging.disable(logging.ERROR)
+        run_worker(args.worker[0], float(args.worker[1]), args.worker[2])
+        return
+
+    workdir = tempfile.mkdtemp(prefix="bench-shards-")
+    with StubServer(latency=args.latency, delivered_ratio=args.delivered_ratio) as stub:
+        os.environ.update({
+            "DB_PATH": os.path.join(workdir, "init.db"),
+            "BAGY_TOKEN": "bench",
+            "FRENET_TOKEN": "bench",
+            "TRACKER_MODE": "sharded",
+            "TRACKER_ENABLED": "false",
+            "TRACKING_BATCH_SIZE": str(args.batch_size),
+            "TRACKER_CONCURRENCY": str(args.concurrency),
+            "TRACKER_HOST_CONCURRENCY": str(args.concurrency),
+            "TRACKER_RATE_LIMIT": "100000",
+            "LOG_LEVEL": "WARNING",
+            **stub_environment(stub),
+        })
+        logging.disable(logging.ERROR)
+        import main as app
+
+        baseline = None
+        for workers in [int(x) for x in args.workers.split(",")]:
+            db_path = os.path.join(workdir, f"shards-{workers}.db")
+            app.database = Database(db_path)
+            app.db_init()
+            seed_orders(db_path, args.orders, 1.0, app.db_timestamp)
+
+            stub.reset_counters()
+            start_at = time.time() + 3.0  # tempo para os processos importarem o main
+            ids_paths = [os.path.join(workdir, f"ids-{workers}-{i}.json") for i in range(workers)]
+            procs = [
+                subprocess.Popen([sys.executable, "-m", "bench.bench_tracking_shards", "--worker", db_path, str(start_at), path])
+                for path in ids_paths
+            ]
+            for proc in procs:
+                if proc.wait() != 0:
+                    raise RuntimeError(f"worker falhou (código {proc.returncode})")
+
+            reports: List[Dict[str, Any]] = []
+            for path in ids_paths:
+                with open(path, encoding="utf-8") as f:
+                    reports.append(json.load(f))
+            checked = [order_id for report in reports for order_id in report["checked"]]
+            duration = max(report["finished_at"] for report in reports) - start_at
+            throughput = len(checked) / duration if duration > 0 else 0.0
+            baseline = baseline or throughput
+
+            emit({
+                "benchmark": "tracking_shards",
+                "workers": workers,
+                "orders": args.orders,
+                "batch_size": args.batch_size,
+                "concurrency_per_worker": args.concurrency,
+                "checked": len(checked),
+                "duplicates": len(checked) - len(set(checked)),
+                "batches_per_worker": [report["batches"] for report in reports],
+                "duration_seconds": round(duration, 3),
+                "throughput_per_second": round(throughput, 1),
+                "scaling": round(throughput / baseline, 2) if baseline else None,
+                "upstream_requests": dict(stub.counters),
+            })
+
+
+if __name__ == "__main__":
+    main()
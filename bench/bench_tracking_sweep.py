@@ -0,0 +1,132 @@
+"""
+Benchmark da varredura de rastreio sobre tabelas `orders` sintéticas (10 mil a 1 milhão de linhas).
+
+Para cada tamanho, cria um banco com pedidos entregues, enviados com
+verificação futura e uma fração `--due-ratio` de pedidos vencidos, e mede:
+
+- a busca dos pedidos vencidos (db_pending), repetida `--query-repeats` vezes
+- a varredura em lotes contra o servidor local de rastreio (latência por lote,
+  vazão e chamadas à API), limitada a `--sweep-limit` pedidos
+
+    python -m bench.bench_tracking_sweep --rows 10000,100000,1000000 --due-ratio 0.02
+    python -m bench.bench_tracking_sweep --rows 100000 --batch-size 50 --bulk --latency 0.05
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from typing import List, Tuple
+
+from bench.results import emit, latency_summary
+from bench.stubs import StubServer, stub_environment
+from db import Database
+from outbox import FulfillmentOutbox
+from tracking_events import TrackingEventLog
+
+SEED_CHUNK = 50000
+
+
+def seed_orders(db_path: str, rows: int, due_ratio: float, timestamp) -> int:
+    """Preenche `rows` pedidos; retorna quantos estão vencidos para verificação."""
+    due_every = max(1, round(1 / due_ratio)) if due_ratio > 0 else 0
+    past, future = timestamp(-60), timestamp(86400)
+    due = 0
+    with sqlite3.connect(db_path) as con:
+        for start in range(0, rows, SEED_CHUNK):
+            chunk = []
+            for i in range(start, min(start + SEED_CHUNK, rows)):
+                if due_every and i % due_every == 0:
+                    chunk.append((f"SWEEP-{i}", f"BR{i:09d}", "shipped", past))
+                    due += 1
+                elif i % 3 == 0:
+                    chunk.append((f"SWEEP-{i}", f"BR{i:09d}", "delivered", past))
+                else:
+                    chunk.append((f"SWEEP-{i}", f"BR{i:09d}", "shipped", future))
+            con.executemany(
+                "INSERT INTO orders(bagy_order_id, tracking_code, status, next_check_at) VALUES (?, ?, ?, ?)",
+                chunk,
+            )
+        con.commit()
+    return due
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10000,100000,1000000", help="tamanhos da tabela orders")
+    parser.add_argument("--due-ratio", type=float, default=0.02, help="fração de pedidos vencidos")
+    parser.add_argument("--sweep-limit", type=int, default=20000, help="máximo de pedidos verificados por varredura")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--bulk", action="store_true", help="usa o endpoint de rastreio em lote do stub")
+    parser.add_argument("--latency", type=float, default=0.0, help="latência simulada por requisição (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--delivered-ratio", type=float, default=0.2)
+    parser.add_argument("--query-repeats", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bench-sweep-")
+    with StubServer(latency=args.latency, delivered_ratio=args.delivered_ratio, error_rate=args.error_rate) as stub:
+        os.environ.update({
+            "DB_PATH": os.path.join(workdir, "init.db"),
+            "BAGY_TOKEN": "bench",
+            "FRENET_TOKEN": "bench",
+            "TRACKER_RATE_LIMIT": os.getenv("TRACKER_RATE_LIMIT", "100000"),
+            "TRACKER_HOST_CONCURRENCY": os.getenv("TRACKER_HOST_CONCURRENCY", "16"),
+            **stub_environment(stub),
+        })
+        logging.disable(logging.ERROR)
+        import main as app
+
+        if args.bulk:
+            app.TRACKING_BULK_URL = stub.url("/tracking/bulk")
+
+        for rows in [int(x) for x in args.rows.split(",")]:
+            app.DB_PATH = os.path.join(workdir, f"sweep-{rows}.db")
+            app.database = Database(app.DB_PATH)
+            app.db_init()
+            app.fulfillment_outbox = FulfillmentOutbox(app.database)
+            app.tracking_event_log = TrackingEventLog(app.database)
+
+            started = time.perf_counter()
+            due = seed_orders(app.DB_PATH, rows, args.due_ratio, app.db_timestamp)
+            seed_seconds = time.perf_counter() - started
+
+            query_times = []
+            for _ in range(args.query_repeats):
+                started = time.perf_counter()
+                pending = app.db_pending()
+                query_times.append(time.perf_counter() - started)
+
+            batch_times: List[float] = []
+
+            def timed_batch(batch: List[Tuple[str, str]]) -> Tuple[int, int]:
+                batch_started = time.perf_counter()
+                try:
+                    return app.track_batch(batch)
+                finally:
+                    batch_times.append(time.perf_counter() - batch_started)
+
+            stub.reset_counters()
+            sweep = app.tracking_engine.sweep_batches(pending[:args.sweep_limit], args.batch_size, timed_batch)
+
+            emit({
+                "benchmark": "tracking_sweep",
+                "rows": rows,
+                "due": due,
+                "batch_size": args.batch_size,
+                "bulk": args.bulk,
+                "seed_seconds": round(seed_seconds, 3),
+                "pending_query_ms": latency_summary(query_times),
+                "checked": sweep["checked"],
+                "delivered": sweep["delivered"],
+                "errors": sweep["errors"],
+                "duration_seconds": sweep["duration_seconds"],
+                "throughput_per_second": sweep["throughput_per_second"],
+                "batch_latency_ms": latency_summary(batch_times),
+                "upstream_requests": dict(stub.counters),
+            })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Teste de carga do /webhook (POST e GET) contra os servidores locais da Bagy e da Frenet.
+
+Sobe o main.py em um servidor WSGI com threads (ou usa `--target` para um
+servidor já rodando, apontado para `python -m bench.stubs`) e dispara
+`--requests` requisições por método com `--concurrency` clientes keep-alive.
+Uma fração `--redelivery-ratio` repete pedidos já enviados, como os reenvios
+da Bagy. Imprime latência p50/p95/p99, vazão e status HTTP por método e, no
+modo assíncrono, o tempo até a fila terminar de enviar os pedidos à Frenet.
+
+    python -m bench.bench_webhook --requests 2000 --concurrency 16 --latency 0.05
+    python -m bench.bench_webhook --methods post --sync --error-rate 0.05
+    python -m bench.bench_webhook --target http://localhost:3000 --methods get
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from bench.results import emit, latency_summary
+from bench.stubs import StubServer, stub_environment
+
+# (método, caminho, corpo)
+Request = Tuple[str, str, Optional[Dict[str, Any]]]
+
+
+def webhook_order(order_id: str) -> Dict[str, Any]:
+    """Pedido faturado no formato do webhook da Bagy (evento + dados)."""
+    return {
+        "event": "order.invoiced",
+        "data": {
+            "id": order_id,
+            "code": f"B{order_id}",
+            "fulfillment_status": "invoiced",
+            "total": 129.9,
+            "shipping_cost": 12.5,
+            "customer": {"name": "Cliente Teste", "cpf": "123.456.789-00", "email": "cliente@exemplo.com",
+                         "phone": "(11) 99999-9999"},
+            "address": {"zipcode": "01310-100", "street": "Av. Paulista", "number": "1000",
+                        "district": "Bela Vista", "city": "São Paulo", "state": "SP"},
+            "items": [{"sku": "SKU-1", "name": "Produto", "quantity": 1, "weight": 500, "price": 129.9}],
+        },
+    }
+
+
+def build_requests(method: str, total: int, redelivery_ratio: float, run_id: str) -> List[Request]:
+    """Sequência de requisições: pedidos novos intercalados com reenvios de pedidos anteriores."""
+    plan: List[Request] = []
+    sent: List[str] = []
+    for i in range(total):
+        if sent and random.random() < redelivery_ratio:
+            order_id = random.choice(sent)
+        else:
+            order_id = f"{run_id}-{method}-{i}"
+            sent.append(order_id)
+        if method == "post":
+            plan.append(("POST", "/webhook", webhook_order(order_id)))
+        else:
+            plan.append(("GET", f"/webhook?order={order_id}", None))
+    return plan
+
+
+def run_load(base_url: str, plan: List[Request], concurrency: int, timeout: float) -> Dict[str, Any]:
+    """Executa o plano com `concurrency` clientes e coleta latência e status de cada requisição."""
+    local = threading.local()
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def send(item: Request):
+        method, path, body = item
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            status = str(session.request(method, base_url + path, json=body, timeout=timeout).status_code)
+        except requests.RequestException as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, plan))
+    duration = time.perf_counter() - started
+    return {
+        "duration_seconds": round(duration, 3),
+        "requests_per_second": round(len(plan) / duration, 1),
+        "latency_ms": latency_summary(latencies),
+        "status_codes": dict(sorted(statuses.items())),
+    }
+
+
+def wait_queue_drained(app, timeout: float) -> Optional[float]:
+    """Espera a fila de webhooks esvaziar. Retorna os segundos esperados (None se estourou o timeout)."""
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        stats = app.webhook_queue.stats()
+        if not stats["queued"] and not stats["running"]:
+            return round(time.monotonic() - started, 3)
+        time.sleep(0.05)
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000, help="requisições por método")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--methods", default="post,get")
+    parser.add_argument("--redelivery-ratio", type=float, default=0.1, help="fração de reenvios de pedidos já enviados")
+    parser.add_argument("--latency", type=float, default=0.02, help="latência simulada das APIs externas (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de respostas 503 das APIs externas")
+    parser.add_argument("--sync", action="store_true", help="processa o pedido dentro da requisição (WEBHOOK_ASYNC=false)")
+    parser.add_argument("--target", default="", help="URL de um servidor já rodando (não sobe stub nem app)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="timeout por requisição (s)")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    run_id = f"LOAD{int(time.time())}"
+    methods = [m.strip().lower() for m in args.methods.split(",") if m.strip()]
+
+    if args.target:
+        for method in methods:
+            plan = build_requests(method, args.requests, args.redelivery_ratio, run_id)
+            emit({"benchmark": "webhook", "method": method, "target": args.target, "concurrency": args.concurrency,
+                  "requests": len(plan), **run_load(args.target.rstrip("/"), plan, args.concurrency, args.timeout)})
+        return
+
+    from werkzeug.serving import make_server
+
+    workdir = tempfile.mkdtemp(prefix="bench-webhook-")
+    with StubServer(latency=args.latency, error_rate=args.error_rate) as stub:
+        os.environ.update({
+            "DB_PATH": os.path.join(workdir, "bench.db"),
+            "BAGY_TOKEN": "bench",
+            "FRENET_TOKEN": "bench",
+            "WEBHOOK_ASYNC": "false" if args.sync else "true",
+            "QUEUE_RETRY_DELAY": "1",
+            "RETRY_BASE_DELAY": "0.05",
+            "TRACKER_ENABLED": "false",
+            **stub_environment(stub),
+        })
+        # Falhas injetadas geram logs de erro esperados
+        logging.disable(logging.ERROR)
+        import main as app
+
+        app.start_background_workers()
+        server = make_server("127.0.0.1", 0, app.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True, name="BenchWebhookServer").start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        try:
+            for method in methods:
+                plan = build_requests(method, args.requests, args.redelivery_ratio, run_id)
+                stub.reset_counters()
+                result = run_load(base_url, plan, args.concurrency, args.timeout)
+                drain = None if args.sync else wait_queue_drained(app, args.drain_timeout)
+                emit({
+                    "benchmark": "webhook",
+                    "method": method,
+                    "mode": "sync" if args.sync else "async",
+                    "concurrency": args.concurrency,
+                    "requests": len(plan),
+                    "unique_orders": len({path if body is None else body["data"]["id"] for _, path, body in plan}),
+                    "upstream_latency": args.latency,
+                    "error_rate": args.error_rate,
+                    **result,
+                    "queue_drain_seconds": drain,
+                    "upstream_requests": dict(stub.counters),
+                })
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
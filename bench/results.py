@@ -0,0 +1,46 @@
+"""
+Resultados dos benchmarks em formato de máquina.
+
+Cada benchmark imprime uma linha JSON por caso; `emit` também acrescenta a
+linha ao arquivo de `BENCH_OUTPUT` (JSON Lines), usado por `bench.suite` para
+comparar com uma execução de referência.
+"""
+import json
+import math
+import os
+import sys
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+    """Percentil por posição mais próxima (amostras já ordenadas)."""
+    if not sorted_samples:
+        return 0.0
+    index = max(0, math.ceil(pct / 100 * len(sorted_samples)) - 1)
+    return sorted_samples[index]
+
+
+def latency_summary(samples: Iterable[float]) -> Dict[str, float]:
+    """p50/p95/p99, média e máximo em milissegundos a partir de durações em segundos."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0, "max_ms": 0.0}
+    return {
+        "count": len(ordered),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def emit(result: Dict[str, Any], output: Optional[str] = None):
+    """Imprime o resultado como uma linha JSON e acrescenta ao arquivo de saída, se houver."""
+    line = json.dumps(result, ensure_ascii=False)
+    print(line)
+    sys.stdout.flush()
+    output = output or os.getenv("BENCH_OUTPUT")
+    if output:
+        with open(output, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
@@ -0,0 +1,280 @@
+"""
+Servidores locais que imitam as APIs da Bagy e da Frenet para benchmarks.
+
+Uso:
+
+    with StubServer(latency=0.05, error_rate=0.01) as stub:
+        os.environ["TRACKING_API_URL"] = stub.url("/tracking/trackinginfo")
+        ...
+
+Ou como processo separado, para testes de carga contra um servidor rodando:
+
+    python -m bench.stubs --port 8081 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+
+class StubServer:
+    """
+    Servidor HTTP local (keep-alive) com as rotas de shipments/rastreio/cotação da Frenet e
+    pedidos/fulfillment/produtos da Bagy (`products` produtos no catálogo).
+
+    `latency` ± `jitter` é aplicada a cada requisição; a fração `error_rate` das
+    requisições responde 503 (com `Retry-After`, se informado).
+    """
+
+    def __init__(self, latency: float = 0.0, delivered_ratio: float = 0.2, host: str = "127.0.0.1", port: int = 0,
+                 error_rate: float = 0.0, jitter: float = 0.0, retry_after: Optional[float] = None,
+                 products: int = 1000):
+        self.latency = latency
+        self.products = products
+        self.delivered_ratio = delivered_ratio
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.retry_after = retry_after
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="StubServer")
+
+    # === ciclo de vida ===
+    def start(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def url(self, path: str = "") -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    # === comportamento simulado ===
+    def count(self, route: str):
+        with self._lock:
+            self.counters[route] = self.counters.get(route, 0) + 1
+
+    def reset_counters(self):
+        with self._lock:
+            self.counters = {}
+
+    def delay(self):
+        """Latência simulada da requisição."""
+        delay = self.latency + (random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def should_fail(self) -> bool:
+        """Sorteia uma falha transitória (503) conforme error_rate."""
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+    def tracking_status(self, code: str) -> str:
+        """Status determinístico por código: a fração delivered_ratio aparece como entregue."""
+        bucket = zlib.crc32(code.encode()) % 100
+        return "Entregue" if bucket < self.delivered_ratio * 100 else "Em trânsito"
+
+    def tracking_info(self, code: str) -> Dict[str, Any]:
+        status = self.tracking_status(code)
+        events = [{"EventDescription": "Objeto postado", "EventLocation": "São Paulo/SP"}]
+        if status != "Em trânsito":
+            events.append({"EventDescription": status, "EventLocation": "São Paulo/SP"})
+        return {"TrackingNumber": code, "CurrentStatus": status, "TrackingEvents": events}
+
+    def bagy_order(self, order_id: str) -> Dict[str, Any]:
+        """Pedido faturado fictício, estável por ID."""
+        return {
+            "id": order_id,
+            "code": f"B{order_id}",
+            "fulfillment_status": "invoiced",
+            "customer": {"name": "Cliente Teste", "email": "cliente@exemplo.com", "phone": "11999999999"},
+            "address": {"zipcode": "01310-100", "street": "Av. Paulista", "number": "1000",
+                        "city": "São Paulo", "state": "SP"},
+            "items": [{"name": "Produto", "quantity": 1, "weight": 0.5, "price": 50}],
+            "total": 50,
+        }
+
+    def product(self, index: int) -> Dict[str, Any]:
+        """Produto fictício estável por índice (peso em kg, dimensões em cm), com duas variações."""
+        rng = random.Random(index)
+        height, width, depth = rng.randint(1, 30), rng.randint(5, 40), rng.randint(10, 60)
+        weight = round(rng.uniform(0.05, 4.0), 3)
+        return {
+            "id": index,
+            "sku": f"SKU-{index}",
+            "name": f"Produto {index}",
+            "weight": weight,
+            "height": height,
+            "width": width,
+            "depth": depth,
+            "variations": [
+                {"sku": f"SKU-{index}-P"},
+                {"sku": f"SKU-{index}-G", "weight": round(weight * 1.3, 3), "height": height + 2},
+            ],
+        }
+
+    def products_page(self, page: int, limit: int) -> Dict[str, Any]:
+        """Página da listagem de produtos da Bagy."""
+        start = (max(page, 1) - 1) * limit
+        return {"data": [self.product(i) for i in range(start, min(start + limit, self.products))]}
+
+    def shipment(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Resposta da criação de pedido na Frenet Shipments."""
+        order_number = str(payload.get("OrderNumber", ""))
+        return {"OrderId": f"FR-{zlib.crc32(order_number.encode()):08x}", "OrderNumber": order_number}
+
+    def quote(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Cotação determinística: preço pela região do CEP (primeiro dígito) e pelo peso cubado."""
+        region = int(str(body.get("RecipientCEP") or "0")[:1] or 0)
+        item = (body.get("ShippingItemArray") or [{}])[0]
+        cubed = float(item.get("Height", 0)) * float(item.get("Width", 0)) * float(item.get("Length", 0)) / 6000
+        weight = max(float(item.get("Weight", 0)), cubed)
+        base = 12.0 + 2.5 * region + 4.0 * weight
+        return {"ShippingSevicesArray": [
+            {"ServiceCode": "LOG_DRPOFF", "ServiceDescription": "Loggi Drop Off", "Carrier": "Loggi",
+             "ShippingPrice": f"{base:.2f}", "DeliveryTime": str(2 + region // 3), "Error": False},
+            {"ServiceCode": "04014", "ServiceDescription": "SEDEX", "Carrier": "Correios",
+             "ShippingPrice": f"{base * 1.6:.2f}", "DeliveryTime": str(1 + region // 4), "Error": False},
+        ]}
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _body(self) -> Any:
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                return json.loads(raw) if raw else {}
+
+            def _reply(self, status: int, data: Any, headers: Optional[Dict[str, str]] = None):
+                raw = json.dumps(data).encode() if status != 304 else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def _simulate(self) -> bool:
+                """Aplica a latência e, se sorteado, responde 503. Retorna True se a requisição falhou."""
+                stub.delay()
+                if not stub.should_fail():
+                    return False
+                stub.count("injected_error")
+                headers = {"Retry-After": f"{stub.retry_after:g}"} if stub.retry_after is not None else None
+                self._reply(503, {"error": "service unavailable"}, headers)
+                return True
+
+            def do_GET(self):
+                if self._simulate():
+                    return
+                if self.path.startswith("/orders/"):
+                    order = stub.bagy_order(self.path.rsplit("/", 1)[-1])
+                    etag = '"%08x"' % zlib.crc32(json.dumps(order, sort_keys=True).encode())
+                    if self.headers.get("If-None-Match") == etag:
+                        stub.count("bagy_order_not_modified")
+                        return self._reply(304, None, {"ETag": etag})
+                    stub.count("bagy_order")
+                    return self._reply(200, order, {"ETag": etag})
+                if self.path.startswith("/products"):
+                    stub.count("bagy_products")
+                    query = parse_qs(urlsplit(self.path).query)
+                    page = int((query.get("page") or ["1"])[0])
+                    limit = int((query.get("limit") or ["100"])[0])
+                    return self._reply(200, stub.products_page(page, limit))
+                stub.count("not_found")
+                self._reply(404, {"error": "not found"})
+
+            def do_POST(self):
+                body = self._body()
+                if self._simulate():
+                    return
+                if self.path.rstrip("/").endswith("/shipments"):
+                    stub.count("frenet_shipments")
+                    return self._reply(200, stub.shipment(body))
+                if self.path.startswith("/shipping/quote"):
+                    stub.count("frenet_quote")
+                    return self._reply(200, stub.quote(body))
+                if self.path.startswith("/tracking/bulk"):
+                    stub.count("tracking_bulk")
+                    codes: List[str] = body.get("TrackingNumbers", [])
+                    return self._reply(200, [stub.tracking_info(code) for code in codes])
+                if self.path.startswith("/tracking"):
+                    stub.count("tracking")
+                    return self._reply(200, stub.tracking_info(body.get("TrackingNumber", "")))
+                stub.count("not_found")
+                self._reply(404, {"error": "not found"})
+
+            def do_PUT(self):
+                self._body()
+                if self._simulate():
+                    return
+                if self.path.startswith("/orders/"):
+                    stub.count("bagy_fulfillment")
+                    return self._reply(200, {})
+                stub.count("not_found")
+                self._reply(404, {"error": "not found"})
+
+        return Handler
+
+
+def stub_environment(stub: StubServer) -> Dict[str, str]:
+    """Variáveis de ambiente que apontam o main.py para o stub."""
+    return {
+        "BAGY_BASE": stub.url(),
+        "FRENET_SHIPMENTS_URL": stub.url("/v1/shipments"),
+        "TRACKING_API_URL": stub.url("/tracking/trackinginfo"),
+        "SHIPPING_API_URL": stub.url("/shipping/quote"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05, help="latência por requisição (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="variação da latência (± s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração das requisições que responde 503")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After das respostas 503 (s)")
+    parser.add_argument("--delivered-ratio", type=float, default=0.2)
+    parser.add_argument("--products", type=int, default=1000, help="produtos no catálogo da Bagy")
+    args = parser.parse_args(argv)
+
+    stub = StubServer(latency=args.latency, delivered_ratio=args.delivered_ratio, host=args.host, port=args.port,
+                      error_rate=args.error_rate, jitter=args.jitter, retry_after=args.retry_after,
+                      products=args.products)
+    print("Variáveis para apontar o servidor para o stub:")
+    for name, path in stub_environment(stub).items():
+        print(f"  {name}={path}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
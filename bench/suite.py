@@ -0,0 +1,145 @@
+"""
+Executa o conjunto de benchmarks e compara com uma execução de referência.
+
+Cada benchmark roda em um processo separado (o main.py lê a configuração na
+importação). Os resultados vão para `--output` em JSON Lines; com `--baseline`,
+as métricas de vazão (`*_per_second`) e os percentis p95/p99 de latência são
+comparados com a referência e o comando sai com código 1 se algum piorou além
+de `--tolerance`.
+
+    python -m bench.suite --output bench-results.jsonl
+    python -m bench.suite --profile full --output atual.jsonl --baseline referencia.jsonl --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Argumentos de cada benchmark por perfil: "quick" roda em segundos, "full" cobre tabelas de até 1M linhas
+PROFILES: Dict[str, List[Tuple[str, List[str]]]] = {
+    "quick": [
+        ("bench.bench_payload", ["--orders", "5000", "--rounds", "3"]),
+        ("bench.bench_db_writes", ["--threads", "4", "--writes", "250"]),
+        ("bench.bench_tracking_batch", ["--orders", "500", "--batch-sizes", "0,50", "--latency", "0.01"]),
+        ("bench.bench_fulfillment_outbox", ["--orders", "500", "--latency", "0.01", "--sequential-sample", "20"]),
+        ("bench.bench_webhook", ["--requests", "300", "--concurrency", "8", "--latency", "0.01"]),
+        ("bench.bench_tracking_sweep", ["--rows", "10000,100000", "--sweep-limit", "2000"]),
+        ("bench.bench_tracking_shards", ["--workers", "1,2,4", "--orders", "600", "--latency", "0.02"]),
+        ("bench.bench_logging", ["--orders", "5000"]),
+        ("bench.bench_archive", ["--rows", "10000", "--repeats", "10"]),
+        ("bench.bench_quote", ["--requests", "2000", "--destinations", "1000", "--latency", "0.005"]),
+        ("bench.bench_packing", ["--orders", "5000", "--products", "500", "--latency", "0.005"]),
+        ("bench.bench_replay", ["--orders", "1000", "--latency", "0.01"]),
+    ],
+    "full": [
+        ("bench.bench_payload", ["--orders", "20000"]),
+        ("bench.bench_db_writes", ["--threads", "8", "--writes", "2000"]),
+        ("bench.bench_tracking_batch", ["--orders", "5000", "--batch-sizes", "0,10,50,200", "--latency", "0.05"]),
+        ("bench.bench_fulfillment_outbox", ["--orders", "2000", "--latency", "0.05", "--concurrency", "16"]),
+        ("bench.bench_webhook", ["--requests", "2000", "--concurrency", "16", "--latency", "0.05"]),
+        ("bench.bench_webhook", ["--requests", "1000", "--concurrency", "16", "--latency", "0.05",
+                                 "--methods", "post", "--sync", "--error-rate", "0.02"]),
+        ("bench.bench_tracking_sweep", ["--rows", "10000,100000,1000000"]),
+        ("bench.bench_tracking_shards", ["--workers", "1,2,4,8", "--orders", "4000", "--latency", "0.02"]),
+        ("bench.bench_logging", ["--orders", "20000"]),
+        ("bench.bench_archive", ["--rows", "10000,100000"]),
+        ("bench.bench_quote", ["--requests", "5000", "--destinations", "2000", "--latency", "0.02"]),
+        ("bench.bench_packing", ["--orders", "20000", "--products", "2000"]),
+        ("bench.bench_replay", ["--orders", "10000", "--latency", "0.05", "--error-rate", "0.02"]),
+    ],
+}
+
+# Campos que identificam o caso de um resultado (o restante são métricas)
+CASE_FIELDS = ("benchmark", "mode", "pass", "method", "batch_size", "bulk", "rows", "threads", "workers", "items_per_order", "error_rate")
+
+LATENCY_PERCENTILES = ("p95_ms", "p99_ms")
+
+
+def run_benchmark(module: str, args: List[str]) -> List[Dict[str, Any]]:
+    """Roda um benchmark em um subprocesso e retorna as linhas JSON impressas."""
+    env = {key: value for key, value in os.environ.items() if key != "BENCH_OUTPUT"}
+    proc = subprocess.run([sys.executable, "-m", module, *args], capture_output=True, text=True, env=env)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{module} falhou (código {proc.returncode}):\n{proc.stderr[-2000:]}")
+    return [json.loads(line) for line in proc.stdout.splitlines() if line.startswith("{")]
+
+
+def case_key(result: Dict[str, Any]) -> str:
+    return json.dumps({field: result[field] for field in CASE_FIELDS if field in result}, sort_keys=True)
+
+
+def metrics(result: Dict[str, Any]) -> Iterator[Tuple[str, float, bool]]:
+    """(nome, valor, maior_é_melhor) das métricas comparáveis de um resultado."""
+    for key, value in result.items():
+        if key.endswith("_per_second") and isinstance(value, (int, float)):
+            yield key, float(value), True
+        elif key.endswith("latency_ms") or key.endswith("query_ms"):
+            if isinstance(value, dict):
+                for pct in LATENCY_PERCENTILES:
+                    if pct in value:
+                        yield f"{key}.{pct}", float(value[pct]), False
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[Dict[str, Any]]:
+    """Métricas que pioraram mais que `tolerance` (fração) em relação à referência."""
+    reference = {case_key(r): dict((name, value) for name, value, _ in metrics(r)) for r in baseline}
+    regressions = []
+    for result in results:
+        previous = reference.get(case_key(result))
+        if not previous:
+            continue
+        for name, value, higher_is_better in metrics(result):
+            before = previous.get(name)
+            if not before:
+                continue
+            change = (value - before) / before
+            worse = -change if higher_is_better else change
+            if worse > tolerance:
+                regressions.append({"case": json.loads(case_key(result)), "metric": name,
+                                    "baseline": before, "current": value, "change": round(change, 3)})
+    return regressions
+
+
+def load_results(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--only", default="", help="roda só os módulos informados (ex.: bench_webhook,bench_payload)")
+    parser.add_argument("--output", default="", help="arquivo JSON Lines com os resultados")
+    parser.add_argument("--baseline", default="", help="resultados de referência (JSON Lines)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="piora aceitável (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    only = {name.strip() for name in args.only.split(",") if name.strip()}
+    results: List[Dict[str, Any]] = []
+    for module, bench_args in PROFILES[args.profile]:
+        if only and module.rsplit(".", 1)[-1] not in only:
+            continue
+        print(f"▶️  {module} {' '.join(bench_args)}", file=sys.stderr)
+        for result in run_benchmark(module, bench_args):
+            results.append(result)
+            print(json.dumps(result, ensure_ascii=False))
+            sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    if args.baseline:
+        regressions = compare(results, load_results(args.baseline), args.tolerance)
+        for regression in regressions:
+            print(f"❌ Regressão: {json.dumps(regression, ensure_ascii=False)}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"✅ Nenhuma regressão acima de {args.tolerance:.0%} em relação a {args.baseline}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
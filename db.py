@@ -0,0 +1,177 @@
+"""
+Gerenciamento de conexões SQLite.
+
+Cada thread reaproveita a própria conexão (em vez de abrir uma por
+operação), configurada com WAL, synchronous=NORMAL e busy_timeout para
+conviver com as threads do gunicorn e os workers em background. O cache
+de prepared statements do módulo sqlite3 é reaproveitado entre chamadas
+e o tempo de cada query é acumulado para diagnóstico (e exportado no
+/metrics por operação + tabela).
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import metrics
+
+_WHITESPACE = re.compile(r"\s+")
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+(?:IF\s+NOT\s+EXISTS\s+)?(?!OF\b)(\w+(?:\.\w+)?)", re.IGNORECASE)
+
+QUERY_SECONDS = metrics.histogram(
+    "bagy_frenet_db_query_duration_seconds",
+    "Duração das queries SQLite por operação e tabela",
+    ["statement"],
+)
+
+
+@lru_cache(maxsize=1024)
+def _query_key(sql: str) -> Tuple[str, str]:
+    """Chave das estatísticas (SQL compactado) e label da métrica (ex.: 'UPDATE orders')."""
+    compact = _WHITESPACE.sub(" ", sql).strip()
+    verb = compact.split(" ", 1)[0].upper()
+    match = _TABLE.search(compact)
+    return compact[:120], f"{verb} {match.group(1)}" if match else verb
+
+
+class Database:
+    """Conexões SQLite por thread com WAL, transações explícitas e estatísticas por query."""
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000, synchronous: str = "NORMAL",
+                 cached_statements: int = 256, journal_mode: str = "WAL", attach: Optional[Dict[str, str]] = None):
+        self.path = path
+        # Bancos anexados (ATTACH) em toda conexão: {alias: caminho}
+        self.attached: Dict[str, str] = dict(attach or {})
+        self.busy_timeout_ms = busy_timeout_ms
+        self.synchronous = synchronous
+        self.cached_statements = cached_statements
+        self.journal_mode = journal_mode
+        self._local = threading.local()
+        self._stats: Dict[str, List[float]] = {}
+        self._stats_lock = threading.Lock()
+
+    # === conexões ===
+    def connection(self) -> sqlite3.Connection:
+        """Conexão da thread atual (reaberta após fork)."""
+        con = getattr(self._local, "con", None)
+        if con is None or self._local.pid != os.getpid():
+            con = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout_ms / 1000,
+                isolation_level=None,  # autocommit; transações via transaction()
+                cached_statements=self.cached_statements,
+            )
+            con.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            con.execute(f"PRAGMA synchronous={self.synchronous}")
+            con.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            for alias, path in self.attached.items():
+                con.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+                con.execute(f"PRAGMA {alias}.journal_mode={self.journal_mode}")
+                con.execute(f"PRAGMA {alias}.synchronous={self.synchronous}")
+            self._local.con = con
+            self._local.pid = os.getpid()
+            self._local.depth = 0
+        return con
+
+    def close(self):
+        """Fecha a conexão da thread atual."""
+        con = getattr(self._local, "con", None)
+        if con is not None:
+            con.close()
+            self._local.con = None
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transação (BEGIN IMMEDIATE). Transações aninhadas participam da mais externa."""
+        con = self.connection()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield con
+            finally:
+                self._local.depth -= 1
+            return
+
+        self._timed("BEGIN IMMEDIATE", lambda: con.execute("BEGIN IMMEDIATE"))
+        self._local.depth = 1
+        try:
+            yield con
+            self._timed("COMMIT", lambda: con.execute("COMMIT"))
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        finally:
+            self._local.depth = 0
+
+    # === execução com medição ===
+    def _timed(self, sql: str, fn):
+        started = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            elapsed = time.perf_counter() - started
+            key, statement = _query_key(sql)
+            QUERY_SECONDS.labels(statement).observe(elapsed)
+            with self._stats_lock:
+                entry = self._stats.get(key)
+                if entry is None:
+                    self._stats[key] = [1, elapsed, elapsed]
+                else:
+                    entry[0] += 1
+                    entry[1] += elapsed
+                    if elapsed > entry[2]:
+                        entry[2] = elapsed
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> sqlite3.Cursor:
+        con = self.connection()
+        return self._timed(sql, lambda: con.execute(sql, params))
+
+    def executemany(self, sql: str, seq: Iterable[Sequence[Any]]) -> sqlite3.Cursor:
+        con = self.connection()
+        return self._timed(sql, lambda: con.executemany(sql, seq))
+
+    def fetchall(self, sql: str, params: Sequence[Any] = (), row_factory=None) -> List[Any]:
+        con = self.connection()
+
+        def run():
+            cur = con.execute(sql, params)
+            if row_factory is not None:
+                cur.row_factory = row_factory
+            return cur.fetchall()
+
+        return self._timed(sql, run)
+
+    def fetchone(self, sql: str, params: Sequence[Any] = (), row_factory=None) -> Optional[Any]:
+        con = self.connection()
+
+        def run():
+            cur = con.execute(sql, params)
+            if row_factory is not None:
+                cur.row_factory = row_factory
+            return cur.fetchone()
+
+        return self._timed(sql, run)
+
+    def query_stats(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Queries com maior tempo total: execuções, tempo total, médio e máximo (ms)."""
+        with self._stats_lock:
+            items = [(sql, list(entry)) for sql, entry in self._stats.items()]
+        items.sort(key=lambda item: item[1][1], reverse=True)
+        return [
+            {
+                "query": sql,
+                "count": int(count),
+                "total_ms": round(total * 1000, 3),
+                "avg_ms": round(total * 1000 / count, 3),
+                "max_ms": round(worst * 1000, 3),
+            }
+            for sql, (count, total, worst) in items[:limit]
+        ]
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {}
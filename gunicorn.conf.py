@@ -0,0 +1,14 @@
+"""
+Configuração do gunicorn (carregada automaticamente a partir do diretório atual).
+
+Os workers em background (dispatchers da fila de webhooks e da outbox,
+métricas e a disputa pela liderança do rastreio) são iniciados em cada
+processo worker depois do fork; só o líder do lease "tracker" executa as
+varreduras de rastreio.
+"""
+
+
+def post_worker_init(worker):
+    import main
+
+    main.start_background_workers()
@@ -0,0 +1,129 @@
+"""
+Camada HTTP compartilhada para as chamadas à Bagy e à Frenet.
+
+Cada serviço usa um HttpClient próprio (requests.Session) com pool de
+conexões keep-alive por host, timeouts separados de conexão/leitura e
+headers calculados uma única vez. A duração de cada chamada vai para o
+/metrics por serviço, endpoint, método e status.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+CALL_SECONDS = metrics.histogram(
+    "bagy_frenet_http_client_duration_seconds",
+    "Duração das chamadas às APIs externas por serviço, endpoint, método e status (ou tipo de erro)",
+    ["service", "endpoint", "method", "status"],
+)
+
+
+class HttpClient:
+    """Cliente HTTP com pool de conexões persistentes e contadores de reuso."""
+
+    def __init__(
+        self,
+        name: str,
+        headers_factory: Callable[[], Dict[str, str]],
+        pool_connections: int = 10,
+        pool_maxsize: int = 20,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+    ):
+        self.name = name
+        self.headers_factory = headers_factory
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        self.pool_maxsize = pool_maxsize
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._adapter = adapter
+
+        self._headers_ready = False
+        self._lock = threading.Lock()
+        self._requests = 0
+
+    def _ensure_headers(self):
+        """
+        Calcula os headers na primeira requisição (erros de configuração não são cacheados).
+
+        Os headers da sessão são substituídos, não mesclados: depois de reset_headers,
+        um header que a factory deixou de devolver não continua sendo enviado.
+        """
+        if self._headers_ready:
+            return
+        with self._lock:
+            if not self._headers_ready:
+                headers = requests.utils.default_headers()
+                headers.update(self.headers_factory())
+                self.session.headers = headers
+                self._headers_ready = True
+
+    def request(self, method: str, url: str, endpoint: Optional[str] = None, **kwargs: Any) -> requests.Response:
+        """
+        Faz a requisição pelo pool de conexões.
+
+        `endpoint` é o nome usado no label da métrica; sem ele, usa o caminho da URL
+        (informe-o quando o caminho contém IDs, para não criar uma série por pedido).
+        """
+        self._ensure_headers()
+        kwargs.setdefault("timeout", self.timeout)
+        with self._lock:
+            self._requests += 1
+        status = "error"
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+            status = str(response.status_code)
+            return response
+        except requests.RequestException as e:
+            status = type(e).__name__
+            raise
+        finally:
+            CALL_SECONDS.labels(self.name, endpoint or urlsplit(url).path, method, status).observe(
+                time.perf_counter() - started
+            )
+
+    def get(self, url: str, endpoint: Optional[str] = None, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, endpoint=endpoint, **kwargs)
+
+    def post(self, url: str, endpoint: Optional[str] = None, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, endpoint=endpoint, **kwargs)
+
+    def put(self, url: str, endpoint: Optional[str] = None, **kwargs: Any) -> requests.Response:
+        return self.request("PUT", url, endpoint=endpoint, **kwargs)
+
+    def reset_headers(self):
+        """Força o recálculo dos headers na próxima requisição (ex.: token rotacionado)."""
+        with self._lock:
+            self._headers_ready = False
+
+    def stats(self) -> Dict[str, Any]:
+        """Requisições feitas, conexões abertas e conexões reaproveitadas."""
+        pools = self._adapter.poolmanager.pools
+        opened = 0
+        with pools.lock:
+            containers = list(pools._container.values())
+        for pool in containers:
+            opened += getattr(pool, "num_connections", 0)
+        with self._lock:
+            total = self._requests
+        return {
+            "requests": total,
+            "connections_opened": opened,
+            "connections_reused": max(total - opened, 0),
+            "pools": len(containers),
+            "pool_maxsize": self.pool_maxsize,
+            "timeout": {"connect": self.timeout[0], "read": self.timeout[1]},
+        }
+
+    def close(self):
+        self.session.close()
+
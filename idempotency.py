@@ -0,0 +1,172 @@
+"""
+Camada de idempotência do processamento de webhooks.
+
+Cada entrega é identificada por `ID do pedido + hash do payload normalizado`.
+A primeira entrega executa o processamento e guarda a resposta; reenvios da
+Bagy (ou GETs repetidos) recebem a mesma resposta sem nova chamada à Frenet.
+
+- respostas concluídas ficam em um LRU com TTL e na tabela idempotency_keys
+- entregas simultâneas no mesmo processo compartilham uma execução (SingleFlight)
+- entre processos, a chave é reservada com status 'in_progress' por `lock_seconds`
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from cache import SingleFlight, TTLCache
+from db import Database
+
+logger = logging.getLogger(__name__)
+
+# fn() -> (corpo da resposta, status HTTP)
+Processor = Callable[[], Tuple[Dict[str, Any], int]]
+
+
+class IdempotencyInProgress(Exception):
+    """A mesma entrega está sendo processada por outro processo."""
+
+
+class IdempotencyStore:
+    """Resultados de processamento por chave de idempotência, em memória e no SQLite."""
+
+    def __init__(self, database: Database, ttl: int = 86400, cache_size: int = 10000, lock_seconds: int = 120):
+        self.database = database
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self._cache = TTLCache(ttl=ttl, maxsize=cache_size)
+        self._flight = SingleFlight()
+        self._purged_at = 0.0
+        self._lock = threading.Lock()
+        self.replayed = 0
+        self.coalesced = 0
+        self.init()
+
+    def init(self):
+        """Cria a tabela de chaves se necessário."""
+        with self.database.transaction():
+            self.database.execute("""
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                order_id TEXT,
+                status TEXT NOT NULL,
+                response TEXT,
+                status_code INTEGER,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )""")
+            self.database.execute("""
+            CREATE INDEX IF NOT EXISTS idx_idempotency_expires ON idempotency_keys(expires_at)
+            """)
+
+    @staticmethod
+    def key_for(order_id: Any, payload: Dict[str, Any]) -> str:
+        """Chave estável: ID do pedido + SHA-256 do payload em JSON canônico."""
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+        return f"{order_id}:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+    def lookup(self, key: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        """Resposta já registrada para a chave (memória, depois banco)."""
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        row = self.database.fetchone(
+            "SELECT response, status_code, expires_at FROM idempotency_keys WHERE key = ? AND status = 'done' AND expires_at > ?",
+            (key, time.time()),
+        )
+        if not row:
+            return None
+        result = (json.loads(row[0]), row[1])
+        self._cache.set(key, result, ttl=row[2] - time.time())
+        return result
+
+    def run(self, key: str, order_id: Any, fn: Processor) -> Tuple[Dict[str, Any], int, bool]:
+        """
+        Executa fn uma única vez por chave. Retorna (corpo, status, reaproveitado).
+
+        Respostas 5xx não são registradas, para que o reenvio seja processado de novo.
+        Levanta IdempotencyInProgress se outro processo estiver com a chave reservada.
+        """
+        known = self.lookup(key)
+        if known is not None:
+            self._count("replayed")
+            return known[0], known[1], True
+
+        def execute() -> Tuple[Dict[str, Any], int, bool]:
+            again = self.lookup(key)
+            if again is not None:
+                return again[0], again[1], True
+            if not self._claim(key, order_id):
+                raise IdempotencyInProgress(f"Pedido {order_id} já está em processamento")
+            try:
+                body, status_code = fn()
+            except BaseException:
+                self._release(key)
+                raise
+            if status_code < 500:
+                self._store(key, body, status_code)
+            else:
+                self._release(key)
+            return body, status_code, False
+
+        (body, status_code, replayed), shared = self._flight.do(key, execute)
+        if shared:
+            self._count("coalesced")
+        elif replayed:
+            self._count("replayed")
+        return body, status_code, replayed or shared
+
+    def forget(self, key: str):
+        """Descarta a chave (ex.: o job da entrega foi para a dead-letter)."""
+        self._cache.invalidate(key)
+        self.database.execute("DELETE FROM idempotency_keys WHERE key = ?", (key,))
+
+    def _claim(self, key: str, order_id: Any) -> bool:
+        now = time.time()
+        self._purge_expired(now)
+        rows = self.database.fetchall("""
+        INSERT INTO idempotency_keys(key, order_id, status, created_at, expires_at)
+        VALUES (?, ?, 'in_progress', ?, ?)
+        ON CONFLICT(key) DO UPDATE SET
+            order_id = excluded.order_id,
+            status = 'in_progress',
+            response = NULL,
+            status_code = NULL,
+            created_at = excluded.created_at,
+            expires_at = excluded.expires_at
+        WHERE idempotency_keys.expires_at <= excluded.created_at
+        RETURNING key
+        """, (key, str(order_id), now, now + self.lock_seconds))
+        return bool(rows)
+
+    def _store(self, key: str, body: Dict[str, Any], status_code: int):
+        self.database.execute("""
+        UPDATE idempotency_keys SET status = 'done', response = ?, status_code = ?, expires_at = ?
+        WHERE key = ?
+        """, (json.dumps(body, ensure_ascii=False, default=str), status_code, time.time() + self.ttl, key))
+        self._cache.set(key, (body, status_code))
+
+    def _release(self, key: str):
+        self.database.execute("DELETE FROM idempotency_keys WHERE key = ? AND status = 'in_progress'", (key,))
+
+    def _purge_expired(self, now: float):
+        """Remove chaves vencidas, no máximo uma vez por hora."""
+        with self._lock:
+            if now - self._purged_at < 3600:
+                return
+            self._purged_at = now
+        cur = self.database.execute("DELETE FROM idempotency_keys WHERE expires_at <= ?", (now,))
+        if cur.rowcount:
+            logger.info("🧹 %s chaves de idempotência vencidas removidas", cur.rowcount)
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        """Resumo para o endpoint /health."""
+        with self._lock:
+            counters = {"replayed": self.replayed, "coalesced": self.coalesced}
+        return {**counters, "in_flight": len(self._flight.in_flight()), "cache": self._cache.stats()}
@@ -0,0 +1,215 @@
+"""
+Fila de jobs durável em SQLite para processamento assíncrono dos webhooks.
+
+O webhook apenas valida e enfileira o pedido; dispatchers em threads
+separadas consomem a fila e chamam a Frenet. Cada job reservado fica
+invisível por `visibility_timeout` segundos: se o worker morrer, o job
+volta a ficar disponível. Falhas são reprocessadas com backoff e, após
+`max_attempts`, o job vai para a dead-letter (status 'dead').
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+from db import Database
+
+logger = logging.getLogger(__name__)
+
+JOB_SECONDS = metrics.histogram(
+    "bagy_frenet_job_duration_seconds",
+    "Duração da execução dos jobs da fila por tipo e resultado (completed, retry, dead)",
+    ["kind", "outcome"],
+)
+
+# handler(job) - job contém id, kind, payload, attempts, max_attempts e final_attempt
+JobHandler = Callable[[Dict[str, Any]], None]
+# on_dead(job, exception) - chamado quando o job esgota as tentativas
+DeadHandler = Callable[[Dict[str, Any], Exception], None]
+
+
+class JobQueue:
+    """Fila persistente com visibilidade temporária, retry e dead-letter."""
+
+    def __init__(self, database: Database, visibility_timeout: int = 300, max_attempts: int = 5, retry_delay: int = 30):
+        self.database = database
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.init()
+
+    def init(self):
+        """Cria a tabela de jobs se necessário."""
+        with self.database.transaction():
+            self.database.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                locked_by TEXT,
+                last_error TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )""")
+            self.database.execute("""
+            CREATE INDEX IF NOT EXISTS idx_jobs_available ON jobs(status, available_at)
+            """)
+
+    def enqueue(self, kind: str, payload: Dict[str, Any]) -> int:
+        """Persiste um job e retorna seu ID."""
+        cur = self.database.execute(
+            "INSERT INTO jobs(kind, payload, available_at) VALUES (?, ?, ?)",
+            (kind, json.dumps(payload, ensure_ascii=False), time.time()),
+        )
+        return cur.lastrowid
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Reserva atomicamente o próximo job disponível (ou com visibilidade expirada)."""
+        now = time.time()
+        rows = self.database.fetchall("""
+        UPDATE jobs SET
+            status = 'running',
+            attempts = attempts + 1,
+            locked_by = ?,
+            available_at = ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE status IN ('queued', 'running') AND available_at <= ?
+            ORDER BY available_at, id
+            LIMIT 1
+        )
+        RETURNING id, kind, payload, attempts
+        """, (worker_id, now + self.visibility_timeout, now))
+
+        if not rows:
+            return None
+        job_id, kind, payload, attempts = rows[0]
+        return {
+            "id": job_id,
+            "kind": kind,
+            "payload": json.loads(payload),
+            "attempts": attempts,
+            "max_attempts": self.max_attempts,
+            "final_attempt": attempts >= self.max_attempts,
+        }
+
+    def complete(self, job_id: int):
+        """Remove o job concluído da fila."""
+        self.database.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def fail(self, job: Dict[str, Any], error: str) -> bool:
+        """Reagenda o job com backoff ou move para dead-letter. Retorna True se foi para dead-letter."""
+        dead = job["attempts"] >= self.max_attempts
+        delay = self.retry_delay * (2 ** (job["attempts"] - 1))
+        self.database.execute("""
+        UPDATE jobs SET
+            status = ?,
+            available_at = ?,
+            locked_by = NULL,
+            last_error = ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+        """, ("dead" if dead else "queued", time.time() + delay, error, job["id"]))
+        return dead
+
+    def requeue_dead(self, job_ids: Optional[List[int]] = None) -> int:
+        """Devolve jobs da dead-letter para a fila (todos, ou os IDs informados)."""
+        if job_ids:
+            placeholders = ",".join("?" for _ in job_ids)
+            cur = self.database.execute(f"""
+            UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'dead' AND id IN ({placeholders})
+            """, (time.time(), *job_ids))
+        else:
+            cur = self.database.execute("""
+            UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'dead'
+            """, (time.time(),))
+        return cur.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        """Quantidade de jobs por status."""
+        stats = {"queued": 0, "running": 0, "dead": 0}
+        for status, count in self.database.fetchall("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            stats[status] = count
+        return stats
+
+
+class JobDispatcher:
+    """Pool de threads que consome a fila e executa o handler de cada job."""
+
+    def __init__(self, queue: JobQueue, handler: JobHandler, workers: int = 4,
+                 poll_interval: float = 1.0, on_dead: Optional[DeadHandler] = None):
+        self.queue = queue
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.poll_interval = poll_interval
+        self.on_dead = on_dead
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, args=(f"{self._worker_prefix}:{i}",), daemon=True, name=f"JobDispatcher-{i}")
+            t.start()
+            self._threads.append(t)
+        logger.info("📬 %s dispatchers da fila iniciados", self.workers)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def notify(self):
+        """Acorda os dispatchers após um enqueue no mesmo processo."""
+        self._wakeup.set()
+
+    def _run(self, worker_id: str):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim(worker_id)
+            except Exception as e:
+                logger.error("❌ Erro ao reservar job da fila: %s", e)
+                job = None
+
+            if not job:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._execute(job)
+
+    def _execute(self, job: Dict[str, Any]):
+        started = time.perf_counter()
+        try:
+            self.handler(job)
+            self.queue.complete(job["id"])
+            JOB_SECONDS.labels(job["kind"], "completed").observe(time.perf_counter() - started)
+        except Exception as e:
+            error_msg = str(e)
+            try:
+                dead = self.queue.fail(job, error_msg)
+            except Exception as fail_error:
+                logger.error("❌ Erro ao reagendar job %s: %s", job["id"], fail_error)
+                return
+            JOB_SECONDS.labels(job["kind"], "dead" if dead else "retry").observe(time.perf_counter() - started)
+            if dead:
+                logger.error("💀 Job %s (%s) movido para dead-letter após %s tentativas: %s", job["id"], job["kind"], job["attempts"], error_msg)
+                if self.on_dead:
+                    try:
+                        self.on_dead(job, e)
+                    except Exception as callback_error:
+                        logger.error("❌ Erro no tratamento do job %s em dead-letter: %s", job["id"], callback_error)
+            else:
+                logger.warning("⚠️  Job %s (%s) falhou (tentativa %s/%s): %s", job["id"], job["kind"], job["attempts"], job["max_attempts"], error_msg)
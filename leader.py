@@ -0,0 +1,227 @@
+"""
+Eleição de líder por lease no SQLite.
+
+Cada processo (workers do gunicorn, `python main.py` ou outro nó que use o
+mesmo arquivo de banco) disputa um lease nomeado na tabela `leases`. Só o
+detentor de um lease válido executa a tarefa; ele renova o lease a cada
+`ttl / 3` segundos em uma thread própria, de modo que uma varredura longa
+não perde a liderança. Se o líder morrer, o lease expira após `ttl` segundos
+e o próximo processo a tentar assume (o `epoch` é incrementado a cada troca
+de detentor).
+
+A expiração usa o relógio de cada máquina: com vários nós, mantenha os
+relógios sincronizados (NTP) e o `ttl` bem acima da diferença entre eles.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+from db import Database
+
+logger = logging.getLogger(__name__)
+
+LEADER_CHANGES = metrics.counter(
+    "bagy_frenet_leader_transitions_total",
+    "Mudanças de liderança deste processo por lease e evento (acquired, lost, released)",
+    ["lease", "event"],
+)
+
+
+class LeaderLease:
+    """Lease nomeado com detentor, validade e epoch, adquirido/renovado em um único UPSERT."""
+
+    def __init__(self, database: Database, name: str, ttl: float = 60.0):
+        self.database = database
+        self.name = name
+        self.ttl = max(float(ttl), 1.0)
+        self._pid = os.getpid()
+        self.holder_id = self._new_holder_id()
+        self.epoch: Optional[int] = None
+        self.expires_at = 0.0
+        self.init()
+
+    def init(self):
+        """Cria a tabela de leases se necessário."""
+        self.database.execute("""
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            epoch INTEGER NOT NULL DEFAULT 1,
+            acquired_at REAL NOT NULL,
+            renewed_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )""")
+
+    @staticmethod
+    def _new_holder_id() -> str:
+        return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def _current_holder(self) -> str:
+        # Após fork, o processo filho disputa o lease com a própria identificação
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.holder_id = self._new_holder_id()
+            self.epoch = None
+            self.expires_at = 0.0
+        return self.holder_id
+
+    def acquire(self) -> bool:
+        """Adquire o lease (se livre ou expirado) ou renova o próprio; True se este processo é o líder."""
+        holder = self._current_holder()
+        now = time.time()
+        rows = self.database.fetchall("""
+        INSERT INTO leases(name, holder, epoch, acquired_at, renewed_at, expires_at)
+        VALUES (?, ?, 1, ?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            epoch = CASE WHEN leases.holder = excluded.holder THEN leases.epoch ELSE leases.epoch + 1 END,
+            acquired_at = CASE WHEN leases.holder = excluded.holder THEN leases.acquired_at ELSE excluded.acquired_at END,
+            holder = excluded.holder,
+            renewed_at = excluded.renewed_at,
+            expires_at = excluded.expires_at
+        WHERE leases.holder = excluded.holder OR leases.expires_at <= excluded.renewed_at
+        RETURNING epoch
+        """, (self.name, holder, now, now, now + self.ttl))
+        if rows:
+            self.epoch = rows[0][0]
+            self.expires_at = now + self.ttl
+            return True
+        self.epoch = None
+        self.expires_at = 0.0
+        return False
+
+    def release(self):
+        """Libera o lease se este processo for o detentor (outro processo assume sem esperar o ttl)."""
+        if self._pid != os.getpid():
+            return
+        self.database.execute(
+            "UPDATE leases SET expires_at = 0 WHERE name = ? AND holder = ?",
+            (self.name, self.holder_id),
+        )
+        self.epoch = None
+        self.expires_at = 0.0
+
+    def held(self) -> bool:
+        """True se este processo detém o lease e ele ainda não expirou (sem consultar o banco)."""
+        return self._pid == os.getpid() and self.epoch is not None and time.time() < self.expires_at
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        """Detentor atual registrado no banco (pode estar expirado)."""
+        row = self.database.fetchone(
+            "SELECT holder, epoch, acquired_at, renewed_at, expires_at FROM leases WHERE name = ?",
+            (self.name,),
+        )
+        if not row:
+            return None
+        holder, epoch, acquired_at, renewed_at, expires_at = row
+        return {
+            "holder": holder,
+            "epoch": epoch,
+            "acquired_at": acquired_at,
+            "renewed_at": renewed_at,
+            "expires_at": expires_at,
+            "expired": expires_at <= time.time(),
+        }
+
+
+class LeaderWorker:
+    """
+    Executa `task(should_continue)` a cada `interval` segundos só enquanto este processo for o líder.
+
+    Uma thread renova/disputa o lease a cada `ttl / 3` segundos; outra executa a
+    tarefa. `should_continue()` retorna False assim que a liderança é perdida, para a
+    tarefa parar entre etapas em vez de concorrer com o novo líder.
+    """
+
+    def __init__(self, lease: LeaderLease, task: Callable[[Callable[[], bool]], None], interval: float,
+                 name: str = "Leader"):
+        self.lease = lease
+        self.task = task
+        self.interval = interval
+        self.name = name
+        self.renew_interval = max(lease.ttl / 3, 0.5)
+        self._pid = os.getpid()
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._leader = threading.Event()
+        self.last_run: Optional[float] = None
+
+    def is_leader(self) -> bool:
+        return self._leader.is_set() and self.lease.held()
+
+    def start(self):
+        """Inicia as threads de lease e da tarefa (uma vez por processo)."""
+        if self._threads and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._leader.clear()
+        self._threads = [
+            threading.Thread(target=self._campaign, daemon=True, name=f"{self.name}Lease"),
+            threading.Thread(target=self._run, daemon=True, name=self.name),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Encerra as threads e libera o lease, se detido."""
+        self._stop.set()
+        was_leader = self._leader.is_set()
+        self._leader.clear()
+        try:
+            if was_leader:
+                self.lease.release()
+                LEADER_CHANGES.labels(self.lease.name, "released").inc()
+        except Exception as e:
+            logger.error("❌ Erro ao liberar o lease '%s': %s", self.lease.name, e)
+
+    def _campaign(self):
+        while not self._stop.is_set():
+            try:
+                leader = self.lease.acquire()
+            except Exception as e:
+                # Sem conseguir renovar, a liderança vale só até o lease expirar
+                logger.error("❌ Erro ao renovar o lease '%s': %s", self.lease.name, e)
+                leader = self.lease.held()
+            if leader and not self._leader.is_set():
+                logger.info("👑 Liderança '%s' assumida por %s (epoch %s)", self.lease.name, self.lease.holder_id, self.lease.epoch)
+                LEADER_CHANGES.labels(self.lease.name, "acquired").inc()
+                self._leader.set()
+            elif not leader and self._leader.is_set():
+                logger.warning("⚠️ Liderança '%s' perdida por %s", self.lease.name, self.lease.holder_id)
+                LEADER_CHANGES.labels(self.lease.name, "lost").inc()
+                self._leader.clear()
+            self._stop.wait(self.renew_interval)
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self._leader.wait(self.renew_interval):
+                continue
+            if self._stop.is_set():
+                return
+            try:
+                self.task(self.is_leader)
+            except Exception as e:
+                logger.error("❌ Erro na tarefa '%s': %s", self.name, e)
+            self.last_run = time.time()
+            self._stop.wait(self.interval)
+
+    def status(self) -> Dict[str, Any]:
+        """Resumo para o endpoint /health."""
+        try:
+            current = self.lease.current()
+        except Exception as e:
+            current = {"error": str(e)}
+        return {
+            "lease": self.lease.name,
+            "ttl": self.lease.ttl,
+            "process": self.lease.holder_id,
+            "is_leader": self.is_leader(),
+            "running": any(thread.is_alive() for thread in self._threads) and self._pid == os.getpid(),
+            "last_run": self.last_run,
+            "holder": current,
+        }
@@ -0,0 +1,163 @@
+"""
+Configuração de logging para alto volume.
+
+- formato texto (padrão) ou JSON, uma linha por registro, com os campos
+  passados em `extra` (ex.: order_id) como chaves do JSON
+- QueueHandler/QueueListener: a thread que loga só enfileira o registro;
+  formatação e escrita acontecem na thread do listener. Com a fila cheia o
+  registro é descartado (e contado) em vez de bloquear a requisição
+- nível QUIET (SUMMARY): mantém só a linha de resumo de cada pedido,
+  avisos e erros
+- amostragem dos dumps de payload (logger "payloads")
+"""
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from typing import Any, Dict, Optional
+
+import metrics
+
+# Nível das linhas de resumo (uma por pedido/varredura): acima de INFO, abaixo de WARNING
+SUMMARY = 25
+logging.addLevelName(SUMMARY, "SUMMARY")
+
+LEVEL_ALIASES = {"QUIET": SUMMARY}
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+TEXT_DATEFMT = "%Y-%m-%d %H:%M:%S"
+
+# Atributos padrão de LogRecord (o restante veio de `extra` e vai para o JSON)
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+DROPPED = metrics.counter(
+    "bagy_frenet_log_records_dropped_total",
+    "Registros de log descartados porque a fila do QueueHandler estava cheia",
+)
+
+# Dumps de payloads/respostas completos, sujeitos a amostragem
+payload_logger = logging.getLogger("payloads")
+
+
+class JsonFormatter(logging.Formatter):
+    """Um objeto JSON por linha: ts, level, logger, message, campos extras e exceção."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """Deixa passar só a fração `rate` dos registros (avaliado antes de qualquer formatação)."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = max(0.0, min(1.0, rate))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return self.rate >= 1.0 or (self.rate > 0.0 and random.random() < self.rate)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que não bloqueia nem formata o registro completo na thread que loga."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Só a mensagem é resolvida aqui (os argumentos podem mudar depois);
+        # timestamp, JSON e traceback são formatados pelo listener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc()
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def parse_level(value: str) -> int:
+    """'INFO', 'QUIET', '20'... → nível numérico."""
+    name = (value or "INFO").strip().upper()
+    if name in LEVEL_ALIASES:
+        return LEVEL_ALIASES[name]
+    if name.isdigit():
+        return int(name)
+    level = logging.getLevelName(name)
+    if not isinstance(level, int):
+        raise ValueError(f"Nível de log desconhecido: {value}")
+    return level
+
+
+def configure_logging(level: str = "INFO", fmt: str = "text", use_queue: bool = True,
+                      queue_size: int = 10000, payload_sample_rate: float = 1.0):
+    """Configura o logger raiz (substitui os handlers existentes)."""
+    global _listener, _listener_pid
+    stream = logging.StreamHandler(sys.stderr)
+    if fmt.lower() == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter(TEXT_FORMAT, datefmt=TEXT_DATEFMT))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(parse_level(level))
+
+    payload_logger.filters = [SampleFilter(payload_sample_rate)]
+
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        if not use_queue:
+            root.addHandler(stream)
+            return
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=max(0, queue_size))
+        root.addHandler(NonBlockingQueueHandler(log_queue))
+        _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+def ensure_listener():
+    """Reinicia a thread do listener após fork (threads não sobrevivem ao fork do gunicorn)."""
+    global _listener_pid
+    with _lock:
+        if _listener is None or _listener_pid == os.getpid():
+            return
+        _listener._thread = None
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+def stop_logging():
+    """Esvazia a fila e encerra o listener (chamado na saída do processo)."""
+    global _listener
+    with _lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
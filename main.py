@@ -1,19 +1,51 @@
-from flask import Flask, request, jsonify
-import requests
+from flask import Flask, Response, g, request, jsonify, stream_template, stream_with_context
 import os
 import datetime
+import atexit
+import base64
+import copy
+import hashlib
+import json
+import socket
 import sqlite3
 import threading
 import time
 import logging
-from typing import Optional, Dict, Any, List, Tuple
-from functools import wraps
+from typing import Optional, Dict, Any, List, Tuple, Union
+from functools import lru_cache
+from urllib.parse import urlencode
+
+from archive import OrderArchive, decompress_json
+from cache import SingleFlight, TTLCache
+from db import Database
+from http_client import HttpClient
+from idempotency import IdempotencyInProgress, IdempotencyStore
+from job_queue import JobDispatcher, JobQueue
+from leader import LeaderLease, LeaderWorker
+from logconfig import SUMMARY, configure_logging, ensure_listener, payload_logger
+from outbox import FulfillmentOutbox, OutboxDispatcher
+from packing import Package, ProductCatalog, pack_items
+from quote import QuoteEngine, clean_cep, services_from_response
+from payload import PACKAGE_HEIGHT, PACKAGE_LENGTH, PACKAGE_WIDTH, build_order_data, build_shipment_payload, normalize_order_data
+import metrics
+from metrics import MetricsStore
+from ratelimit import HostThrottle
+from resilience import CircuitBreaker, CircuitOpenError, HttpError, RetryPolicy, is_retryable, resilience_status
+from tracker import AdaptiveSchedule, TrackingEngine
+from tracking_events import UNCHANGED_TOTAL, Observation, TrackingEventLog, observation_from_response
 
 # Configuração de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # DEBUG, INFO, QUIET (uma linha por pedido), WARNING, ERROR
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text ou json (uma linha JSON por registro)
+LOG_QUEUE = os.getenv("LOG_QUEUE", "true").lower() in ("1", "true", "yes")  # escrita em thread separada
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # registros pendentes antes de descartar
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0"))  # fração dos dumps de payload (nível DEBUG)
+configure_logging(
+    level=LOG_LEVEL,
+    fmt=LOG_FORMAT,
+    use_queue=LOG_QUEUE,
+    queue_size=LOG_QUEUE_SIZE,
+    payload_sample_rate=LOG_PAYLOAD_SAMPLE_RATE
 )
 logger = logging.getLogger(__name__)
 
@@ -26,6 +58,7 @@ FRENET_TOKEN = os.getenv("FRENET_TOKEN")
 BAGY_BASE = os.getenv("BAGY_BASE", "https://api.dooca.store")
 
 # URLs da API de envio (configurável)
+FRENET_SHIPMENTS_URL = os.getenv("FRENET_SHIPMENTS_URL", "https://api.frenet.com.br/v1/shipments")
 SHIPPING_API_URL = os.getenv("SHIPPING_API_URL", "https://api.frenet.com.br/shipping/quote")
 TRACKING_API_URL = os.getenv("TRACKING_API_URL", "https://api.frenet.com.br/tracking/trackinginfo")
 
@@ -42,10 +75,96 @@ FORCE_CARRIER_NAME = os.getenv("FORCE_CARRIER_NAME", "Loggi Drop Off")
 INTEGRATION_TYPE = os.getenv("INTEGRATION_TYPE", "frenet")
 
 TRACKER_INTERVAL = int(os.getenv("TRACKER_INTERVAL", "600"))  # segundos (10 min)
+TRACKER_CONCURRENCY = int(os.getenv("TRACKER_CONCURRENCY", "8"))  # threads do motor de rastreio
+TRACKER_HOST_CONCURRENCY = int(os.getenv("TRACKER_HOST_CONCURRENCY", "4"))  # requisições simultâneas por host
+TRACKER_RATE_LIMIT = float(os.getenv("TRACKER_RATE_LIMIT", "10"))  # requisições/segundo por host (0 = sem limite)
+TRACKER_MAX_INTERVAL = int(os.getenv("TRACKER_MAX_INTERVAL", "86400"))  # intervalo máximo entre consultas de um pedido (s)
+TRACKER_EXPECTED_TRANSIT_DAYS = float(os.getenv("TRACKER_EXPECTED_TRANSIT_DAYS", "5"))  # prazo típico de entrega
+TRACKING_BATCH_SIZE = int(os.getenv("TRACKING_BATCH_SIZE", "50"))  # pedidos por lote (0 = um a um)
+TRACKING_BULK_URL = os.getenv("TRACKING_BULK_URL", "")  # endpoint de rastreio em lote, se disponível
+TRACKER_ENABLED = os.getenv("TRACKER_ENABLED", "true").lower() in ("1", "true", "yes")  # disputa a liderança do rastreio neste processo
+TRACKER_LEASE_TTL = float(os.getenv("TRACKER_LEASE_TTL", "60"))  # segundos até outro processo assumir se o líder morrer
+TRACKER_MODE = os.getenv("TRACKER_MODE", "leader").lower()  # leader (um processo rastreia) ou sharded (todos, com reserva de pedidos)
+TRACKER_ROW_LEASE = int(os.getenv("TRACKER_ROW_LEASE", "300"))  # segundos de reserva de um lote no modo sharded
 DB_PATH = os.getenv("DB_PATH", "data.db")
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))  # espera por locks antes de "database is locked"
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")  # NORMAL é seguro com WAL
+DB_CACHED_STATEMENTS = int(os.getenv("DB_CACHED_STATEMENTS", "256"))  # prepared statements em cache por conexão
+
+# Arquivo morto: pedidos entregues e erros antigos saem da tabela orders para outro arquivo SQLite
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() in ("1", "true", "yes")
+ARCHIVE_DB_PATH = os.getenv("ARCHIVE_DB_PATH") or f"{os.path.splitext(DB_PATH)[0]}-archive.db"
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "90"))  # dias desde a entrega para arquivar um pedido entregue
+ARCHIVE_ERROR_AFTER_DAYS = float(os.getenv("ARCHIVE_ERROR_AFTER_DAYS", "180"))  # dias desde a falha para arquivar um pedido com erro
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", "3600"))  # segundos entre execuções do arquivamento
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))  # pedidos movidos por transação
 
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
 REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "30"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1"))  # backoff inicial entre tentativas (s), com jitter
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))  # teto do backoff e do Retry-After (s)
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))  # falhas seguidas para abrir o circuito
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))  # segundos com o circuito aberto
+
+# Pool de conexões HTTP (keep-alive) compartilhado pelas chamadas Bagy/Frenet
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))  # hosts mantidos em cache por cliente
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))  # conexões persistentes por host
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))  # segundos
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", str(REQUEST_TIMEOUT)))  # segundos
+
+# Fila de webhooks: o handler enfileira e responde 202; dispatchers enviam à Frenet
+WEBHOOK_ASYNC = os.getenv("WEBHOOK_ASYNC", "true").lower() in ("1", "true", "yes")
+QUEUE_WORKERS = int(os.getenv("QUEUE_WORKERS", "4"))  # threads dispatcher por processo
+QUEUE_VISIBILITY_TIMEOUT = int(os.getenv("QUEUE_VISIBILITY_TIMEOUT", "300"))  # segundos até um job travado voltar à fila
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "5"))  # tentativas antes da dead-letter
+QUEUE_RETRY_DELAY = int(os.getenv("QUEUE_RETRY_DELAY", "30"))  # segundos (dobra a cada tentativa)
+
+# Outbox de fulfillment: transições shipped/delivered enviadas à Bagy em background
+FULFILLMENT_CONCURRENCY = int(os.getenv("FULFILLMENT_CONCURRENCY", "8"))  # envios simultâneos à Bagy
+FULFILLMENT_RATE_LIMIT = float(os.getenv("FULFILLMENT_RATE_LIMIT", "20"))  # requisições/segundo à Bagy (0 = sem limite)
+FULFILLMENT_BATCH_SIZE = int(os.getenv("FULFILLMENT_BATCH_SIZE", "100"))  # itens reservados por lote
+FULFILLMENT_MAX_ATTEMPTS = int(os.getenv("FULFILLMENT_MAX_ATTEMPTS", "8"))  # tentativas antes da dead-letter
+FULFILLMENT_RETRY_DELAY = int(os.getenv("FULFILLMENT_RETRY_DELAY", "30"))  # segundos (dobra a cada tentativa)
+
+# Idempotência dos webhooks: reenvios do mesmo pedido/payload reaproveitam a primeira resposta
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))  # segundos que a resposta fica registrada
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))  # chaves mantidas em memória
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "120"))  # reserva de uma entrega em processamento
+
+# Consulta de pedidos na Bagy (webhook GET)
+BAGY_ORDER_CACHE_TTL = float(os.getenv("BAGY_ORDER_CACHE_TTL", "10"))  # segundos sem consultar a Bagy
+BAGY_ORDER_REVALIDATE_TTL = float(os.getenv("BAGY_ORDER_REVALIDATE_TTL", "600"))  # segundos revalidando com ETag
+BAGY_ORDER_CACHE_SIZE = int(os.getenv("BAGY_ORDER_CACHE_SIZE", "1000"))  # pedidos mantidos em memória
+
+# Cotação de frete (/quote): cache por faixa de CEP, peso e dimensões
+QUOTE_CACHE_TTL = float(os.getenv("QUOTE_CACHE_TTL", "21600"))  # segundos que uma cotação vale (6h)
+QUOTE_CACHE_SIZE = int(os.getenv("QUOTE_CACHE_SIZE", "50000"))  # faixas mantidas em memória
+QUOTE_CEP_PREFIX = int(os.getenv("QUOTE_CEP_PREFIX", "5"))  # dígitos do CEP que definem a faixa de destino
+QUOTE_WEIGHT_STEP = float(os.getenv("QUOTE_WEIGHT_STEP", "0.5"))  # largura da faixa de peso (kg)
+QUOTE_DIMENSION_STEP = int(os.getenv("QUOTE_DIMENSION_STEP", "5"))  # largura da faixa de cada dimensão (cm)
+QUOTE_PERSIST = os.getenv("QUOTE_PERSIST", "true").lower() in ("1", "true", "yes")  # guarda as cotações no SQLite
+QUOTE_STALE_TTL = float(os.getenv("QUOTE_STALE_TTL", "604800"))  # cotação vencida ainda servida se a Frenet falhar (s)
+QUOTE_INVOICE_VALUE = float(os.getenv("QUOTE_INVOICE_VALUE", "0"))  # valor declarado nas cotações (o cache não separa por valor)
+QUOTE_TIMEOUT = float(os.getenv("QUOTE_TIMEOUT", "5"))  # tempo máximo de leitura da cotação na Frenet (s)
+
+# Pacote (peso, dimensões e cubagem) a partir do catálogo de SKUs da Bagy
+CATALOG_REFRESH_INTERVAL = int(os.getenv("CATALOG_REFRESH_INTERVAL", "21600"))  # segundos entre sincronizações (0 = desligado)
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "100"))  # produtos por página da listagem da Bagy
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))  # segundos até recarregar o catálogo do banco
+
+# Reenvio em lote (python replay.py): padrões do comando
+REPLAY_CONCURRENCY = int(os.getenv("REPLAY_CONCURRENCY", "8"))  # envios simultâneos à Frenet
+REPLAY_RATE_LIMIT = float(os.getenv("REPLAY_RATE_LIMIT", "20"))  # envios por segundo (0 = sem limite)
+
+# Cache em memória dos contadores de /stats e /health
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "5"))  # segundos
+
+# Arquivos estáticos do painel (/static) com cache no navegador
+STATIC_CACHE_SECONDS = int(os.getenv("STATIC_CACHE_SECONDS", "86400"))
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = STATIC_CACHE_SECONDS
+
+# Métricas (/metrics): cada worker grava suas métricas no banco a cada intervalo
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))  # segundos
 
 # Validação de configurações críticas
 if not BAGY_TOKEN:
@@ -53,17 +172,107 @@ if not BAGY_TOKEN:
 if not FRENET_TOKEN:
     logger.warning("⚠️  FRENET_TOKEN não configurado! A integração não funcionará.")
 
-logger.info(f"🔧 Configurações carregadas: SELLER_CEP={SELLER_CEP}, FORCE_VALUE=R${FORCE_VALUE}")
-logger.info(f"🚚 Transportadora padrão: {FORCE_CARRIER_NAME} (Código: {FORCE_CARRIER_CODE})")
-logger.info(f"🔗 Tipo de integração: {INTEGRATION_TYPE.upper()}")
-logger.info(f"🌐 API de envio: {SHIPPING_API_URL}")
+logger.info("🔧 Configurações carregadas: SELLER_CEP=%s, FORCE_VALUE=R$%s", SELLER_CEP, FORCE_VALUE)
+logger.info("🚚 Transportadora padrão: %s (Código: %s)", FORCE_CARRIER_NAME, FORCE_CARRIER_CODE)
+logger.info("🔗 Tipo de integração: %s", INTEGRATION_TYPE.upper())
+logger.info("🌐 API de envio: %s", SHIPPING_API_URL)
 
 # === BANCO LOCAL (SQLite) ===
+stats_cache = TTLCache(ttl=STATS_CACHE_TTL, maxsize=8)
+
+# Conexão por thread com WAL, busy_timeout e cache de prepared statements
+database = Database(
+    DB_PATH,
+    busy_timeout_ms=DB_BUSY_TIMEOUT_MS,
+    synchronous=DB_SYNCHRONOUS,
+    cached_statements=DB_CACHED_STATEMENTS,
+    attach={"archive": ARCHIVE_DB_PATH} if ARCHIVE_ENABLED else None
+)
+
+# Colunas adicionadas depois da versão 2.0 (criadas automaticamente em bancos existentes)
+ORDERS_EXTRA_COLUMNS = {
+    "shipped_at": "TEXT",
+    "next_check_at": "TEXT NOT NULL DEFAULT '1970-01-01 00:00:00'",
+    "last_checked_at": "TEXT",
+    "last_carrier_status": "TEXT",
+    "unchanged_checks": "INTEGER NOT NULL DEFAULT 0",
+    "tracking_hash": "TEXT",  # hash dos eventos da última resposta de rastreio (respostas iguais são ignoradas)
+    "leased_by": "TEXT",  # worker que reservou o pedido para rastreio (modo sharded)
+    "lease_until": "TEXT",  # a reserva expira neste horário (UTC) e o pedido volta a ficar disponível
+}
+
+def db_migrate():
+    """Adiciona à tabela orders as colunas que ainda não existem."""
+    existing = {row[1] for row in database.fetchall("PRAGMA table_info(orders)")}
+    for column, definition in ORDERS_EXTRA_COLUMNS.items():
+        if column not in existing:
+            database.execute(f"ALTER TABLE orders ADD COLUMN {column} {definition}")
+            logger.info("🛠️  Coluna orders.%s adicionada", column)
+
+def db_timestamp(offset_seconds: float = 0) -> str:
+    """Timestamp UTC no mesmo formato do CURRENT_TIMESTAMP do SQLite."""
+    moment = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=offset_seconds)
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+# Contadores materializados para /stats e /health, mantidos por triggers:
+# - order_status_counts: total de pedidos por status
+# - order_status_events: entradas em cada status por minuto, em um anel de 1440 posições
+#   (slot = minuto % 1440); a posição é reiniciada quando o minuto gravado é antigo
+ORDER_MINUTE_SQL = "(CAST(strftime('%s', 'now') AS INTEGER) / 60)"
+ORDER_EVENT_SQL = f"""
+    INSERT INTO order_status_events(slot, status, minute, count)
+    VALUES ({ORDER_MINUTE_SQL} % 1440, new.status, {ORDER_MINUTE_SQL}, 1)
+    ON CONFLICT(slot, status) DO UPDATE SET
+        count = CASE WHEN minute = excluded.minute THEN count + 1 ELSE 1 END,
+        minute = excluded.minute;
+"""
+
+def db_init_counters():
+    """Cria as tabelas de contadores e os triggers; na primeira vez, preenche a partir de orders."""
+    exists = database.fetchone("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'order_status_counts'")
+    database.execute("""
+    CREATE TABLE IF NOT EXISTS order_status_counts (
+        status TEXT PRIMARY KEY,
+        total INTEGER NOT NULL DEFAULT 0
+    )""")
+    database.execute("""
+    CREATE TABLE IF NOT EXISTS order_status_events (
+        slot INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        minute INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (slot, status)
+    )""")
+    database.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_orders_count_insert AFTER INSERT ON orders BEGIN
+        INSERT INTO order_status_counts(status, total) VALUES (new.status, 1)
+        ON CONFLICT(status) DO UPDATE SET total = total + 1;
+        {ORDER_EVENT_SQL}
+    END""")
+    database.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_orders_count_update AFTER UPDATE OF status ON orders
+    WHEN old.status IS NOT new.status BEGIN
+        UPDATE order_status_counts SET total = total - 1 WHERE status = old.status;
+        INSERT INTO order_status_counts(status, total) VALUES (new.status, 1)
+        ON CONFLICT(status) DO UPDATE SET total = total + 1;
+        {ORDER_EVENT_SQL}
+    END""")
+    database.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_orders_count_delete AFTER DELETE ON orders BEGIN
+        UPDATE order_status_counts SET total = total - 1 WHERE status = old.status;
+    END""")
+    if not exists:
+        database.execute("""
+        INSERT INTO order_status_counts(status, total)
+        SELECT status, COUNT(*) FROM orders GROUP BY status
+        """)
+        logger.info("🛠️  Contadores de status criados a partir da tabela orders")
+
 def db_init():
     """Inicializa o banco de dados SQLite com a estrutura necessária."""
     try:
-        with sqlite3.connect(DB_PATH) as con:
-            con.execute("""
+        with database.transaction():
+            database.execute("""
             CREATE TABLE IF NOT EXISTS orders (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 bagy_order_id TEXT UNIQUE NOT NULL,
@@ -90,170 +299,461 @@ def db_init():
                 retry_count INTEGER DEFAULT 0,
                 last_error TEXT
             )""")
-            con.execute("""
+            database.execute("""
             CREATE INDEX IF NOT EXISTS idx_status ON orders(status)
             """)
-            con.execute("""
+            database.execute("""
             CREATE INDEX IF NOT EXISTS idx_tracking ON orders(tracking_code)
             """)
-            con.execute("""
+            database.execute("""
             CREATE INDEX IF NOT EXISTS idx_order_code ON orders(bagy_order_code)
             """)
-            con.commit()
-        logger.info(f"✅ Banco de dados inicializado: {DB_PATH}")
+            db_migrate()
+            database.execute("""
+            CREATE INDEX IF NOT EXISTS idx_status_next_check ON orders(status, next_check_at)
+            """)
+            # Listagem /orders: paginação por (created_at, id) com filtros; o índice por status
+            # também cobre a projeção resumida (fields=summary) sem ler a tabela
+            database.execute("""
+            CREATE INDEX IF NOT EXISTS idx_status_created ON orders(status, created_at, id, bagy_order_id, bagy_order_code, tracking_code)
+            """)
+            database.execute("""
+            CREATE INDEX IF NOT EXISTS idx_created ON orders(created_at)
+            """)
+            database.execute("""
+            CREATE INDEX IF NOT EXISTS idx_state_city_created ON orders(address_state, address_city, created_at)
+            """)
+            # Arquivamento: pedidos entregues/com erro pela data da última atualização
+            database.execute("""
+            CREATE INDEX IF NOT EXISTS idx_status_updated ON orders(status, updated_at)
+            """)
+            db_init_counters()
+        logger.info("✅ Banco de dados inicializado: %s", DB_PATH)
     except Exception as e:
-        logger.error(f"❌ Erro ao inicializar banco de dados: {e}")
+        logger.error("❌ Erro ao inicializar banco de dados: %s", e)
         raise
 
 db_init()
 
+# Transição de status/rastreio: um único UPSERT, sem leitura prévia.
+# ?3 (status) NULL mantém o status atual; retry_count é incrementado no próprio SQL.
+ORDER_TRANSITION_SQL = """
+INSERT INTO orders(bagy_order_id, tracking_code, status, retry_count, last_error, delivered_at, shipped_at)
+VALUES (
+    ?1, ?2, COALESCE(?3, 'created'), ?4, ?5,
+    CASE WHEN ?3 = 'delivered' THEN CURRENT_TIMESTAMP END,
+    CASE WHEN ?3 = 'shipped' THEN CURRENT_TIMESTAMP END
+)
+ON CONFLICT(bagy_order_id) DO UPDATE SET
+    tracking_code = COALESCE(excluded.tracking_code, tracking_code),
+    status = COALESCE(?3, status),
+    retry_count = retry_count + excluded.retry_count,
+    last_error = excluded.last_error,
+    updated_at = CURRENT_TIMESTAMP,
+    delivered_at = CASE WHEN ?3 = 'delivered' THEN CURRENT_TIMESTAMP ELSE delivered_at END,
+    shipped_at = CASE WHEN ?3 = 'shipped' AND shipped_at IS NULL THEN CURRENT_TIMESTAMP ELSE shipped_at END
+"""
+
+# Pedido completo: cada valor é vinculado uma vez e reaproveitado via excluded.*
+ORDER_UPSERT_SQL = """
+INSERT INTO orders(
+    bagy_order_id, bagy_order_code, tracking_code, status,
+    customer_name, customer_cpf, customer_email, customer_phone,
+    address_zipcode, address_street, address_number, address_complement,
+    address_neighborhood, address_city, address_state,
+    total_value, shipping_cost, order_data_json,
+    retry_count, last_error, delivered_at, shipped_at
+)
+VALUES (
+    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+    CASE WHEN ?4 = 'delivered' THEN CURRENT_TIMESTAMP END,
+    CASE WHEN ?4 = 'shipped' THEN CURRENT_TIMESTAMP END
+)
+ON CONFLICT(bagy_order_id) DO UPDATE SET
+    bagy_order_code = COALESCE(excluded.bagy_order_code, bagy_order_code),
+    tracking_code = COALESCE(excluded.tracking_code, tracking_code),
+    status = excluded.status,
+    customer_name = COALESCE(excluded.customer_name, customer_name),
+    customer_cpf = COALESCE(excluded.customer_cpf, customer_cpf),
+    customer_email = COALESCE(excluded.customer_email, customer_email),
+    customer_phone = COALESCE(excluded.customer_phone, customer_phone),
+    address_zipcode = COALESCE(excluded.address_zipcode, address_zipcode),
+    address_street = COALESCE(excluded.address_street, address_street),
+    address_number = COALESCE(excluded.address_number, address_number),
+    address_complement = COALESCE(excluded.address_complement, address_complement),
+    address_neighborhood = COALESCE(excluded.address_neighborhood, address_neighborhood),
+    address_city = COALESCE(excluded.address_city, address_city),
+    address_state = COALESCE(excluded.address_state, address_state),
+    total_value = COALESCE(excluded.total_value, total_value),
+    shipping_cost = COALESCE(excluded.shipping_cost, shipping_cost),
+    order_data_json = COALESCE(excluded.order_data_json, order_data_json),
+    retry_count = retry_count + excluded.retry_count,
+    last_error = excluded.last_error,
+    updated_at = CURRENT_TIMESTAMP,
+    delivered_at = CASE WHEN excluded.status = 'delivered' THEN CURRENT_TIMESTAMP ELSE delivered_at END,
+    shipped_at = CASE WHEN excluded.status = 'shipped' AND shipped_at IS NULL THEN CURRENT_TIMESTAMP ELSE shipped_at END
+"""
+
 def db_save(order_id: str, tracking: Optional[str] = None, status: str = "created", error: Optional[str] = None, order_data: Optional[Dict[str, Any]] = None):
-    """Salva ou atualiza um pedido no banco de dados."""
-    import json
+    """Salva ou atualiza um pedido: completo se order_data for informado, senão apenas a transição de status."""
+    if not order_data:
+        db_save_many([(order_id, tracking, status, error)])
+        return
+    
     try:
-        with sqlite3.connect(DB_PATH) as con:
-            # Verificar se já existe
-            cur = con.execute("SELECT retry_count FROM orders WHERE bagy_order_id = ?", (order_id,))
-            existing = cur.fetchone()
-            retry_count = (existing[0] if existing else 0) + (1 if error else 0)
-            
-            # Se order_data foi fornecido, extrair campos individuais
-            if order_data:
-                order_code = order_data.get("order_code")
-                customer = order_data.get("customer", {})
-                address = order_data.get("address", {})
-                total_value = order_data.get("total_value", 0)
-                shipping_cost = order_data.get("shipping_cost", 0)
-                order_json = json.dumps(order_data, ensure_ascii=False)
-            else:
-                order_code = None
-                customer = {}
-                address = {}
-                total_value = 0
-                shipping_cost = 0
-                order_json = None
-            
-            if order_data:
-                # INSERT com dados completos
-                con.execute("""
-                INSERT INTO orders(
-                    bagy_order_id, bagy_order_code, tracking_code, status,
-                    customer_name, customer_cpf, customer_email, customer_phone,
-                    address_zipcode, address_street, address_number, address_complement,
-                    address_neighborhood, address_city, address_state,
-                    total_value, shipping_cost, order_data_json,
-                    retry_count, last_error, updated_at
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ON CONFLICT(bagy_order_id) DO UPDATE SET
-                    bagy_order_code = COALESCE(?, bagy_order_code),
-                    tracking_code = COALESCE(?, tracking_code),
-                    status = ?,
-                    customer_name = COALESCE(?, customer_name),
-                    customer_cpf = COALESCE(?, customer_cpf),
-                    customer_email = COALESCE(?, customer_email),
-                    customer_phone = COALESCE(?, customer_phone),
-                    address_zipcode = COALESCE(?, address_zipcode),
-                    address_street = COALESCE(?, address_street),
-                    address_number = COALESCE(?, address_number),
-                    address_complement = COALESCE(?, address_complement),
-                    address_neighborhood = COALESCE(?, address_neighborhood),
-                    address_city = COALESCE(?, address_city),
-                    address_state = COALESCE(?, address_state),
-                    total_value = COALESCE(?, total_value),
-                    shipping_cost = COALESCE(?, shipping_cost),
-                    order_data_json = COALESCE(?, order_data_json),
-                    retry_count = ?,
-                    last_error = ?,
-                    updated_at = CURRENT_TIMESTAMP,
-                    delivered_at = CASE WHEN ? = 'delivered' THEN CURRENT_TIMESTAMP ELSE delivered_at END
-                """, (
-                    # INSERT values
-                    order_id, order_code, tracking, status,
-                    customer.get("name"), customer.get("cpf"), customer.get("email"), customer.get("phone"),
-                    address.get("zipcode"), address.get("street"), address.get("number"), address.get("complement"),
-                    address.get("neighborhood"), address.get("city"), address.get("state"),
-                    total_value, shipping_cost, order_json,
-                    retry_count, error,
-                    # UPDATE values
-                    order_code, tracking, status,
-                    customer.get("name"), customer.get("cpf"), customer.get("email"), customer.get("phone"),
-                    address.get("zipcode"), address.get("street"), address.get("number"), address.get("complement"),
-                    address.get("neighborhood"), address.get("city"), address.get("state"),
-                    total_value, shipping_cost, order_json,
-                    retry_count, error, status
-                ))
-            else:
-                # INSERT simples (compatibilidade com código existente)
-                con.execute("""
-                INSERT INTO orders(bagy_order_id, tracking_code, status, retry_count, last_error, updated_at)
-                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ON CONFLICT(bagy_order_id) DO UPDATE SET
-                    tracking_code = COALESCE(?, tracking_code),
-                    status = ?,
-                    retry_count = ?,
-                    last_error = ?,
-                    updated_at = CURRENT_TIMESTAMP,
-                    delivered_at = CASE WHEN ? = 'delivered' THEN CURRENT_TIMESTAMP ELSE delivered_at END
-                """, (order_id, tracking, status, retry_count, error, tracking, status, retry_count, error, status))
-            con.commit()
-        logger.debug(f"💾 Pedido {order_id} salvo: status={status}, tracking={tracking}")
+        customer = order_data.get("customer", {})
+        address = order_data.get("address", {})
+        database.execute(ORDER_UPSERT_SQL, (
+            order_id, order_data.get("order_code"), tracking, status,
+            customer.get("name"), customer.get("cpf"), customer.get("email"), customer.get("phone"),
+            address.get("zipcode"), address.get("street"), address.get("number"), address.get("complement"),
+            address.get("neighborhood"), address.get("city"), address.get("state"),
+            order_data.get("total_value", 0), order_data.get("shipping_cost", 0),
+            json.dumps(order_data, ensure_ascii=False, separators=(",", ":")),
+            1 if error else 0, error
+        ))
+        logger.debug("💾 Pedido %s salvo: status=%s, tracking=%s", order_id, status, tracking)
     except Exception as e:
-        logger.error(f"❌ Erro ao salvar pedido {order_id}: {e}")
+        logger.error("❌ Erro ao salvar pedido %s: %s", order_id, e)
         raise
 
-def db_pending() -> List[Tuple[str, str]]:
-    """Retorna pedidos pendentes de verificação de entrega."""
+def db_save_many(transitions: List[Tuple[str, Optional[str], Optional[str], Optional[str]]]):
+    """
+    Aplica várias transições em uma única transação.
+    
+    Cada item é (order_id, tracking_code, status, error): status None mantém o atual;
+    error incrementa retry_count e grava last_error. Pedidos inexistentes são criados.
+    """
+    if not transitions:
+        return
+    try:
+        with database.transaction():
+            database.executemany(ORDER_TRANSITION_SQL, [
+                (order_id, tracking, status, 1 if error else 0, error)
+                for order_id, tracking, status, error in transitions
+            ])
+        logger.debug("💾 %s transições de pedidos salvas", len(transitions))
+    except Exception as e:
+        logger.error("❌ Erro ao salvar %s transições de pedidos: %s", len(transitions), e)
+        raise
+
+# Pedidos vencidos para rastreio e não reservados por outro worker (parâmetros: agora, agora, limite de retries)
+PENDING_WHERE = """
+    status IN ('created','shipped')
+    AND next_check_at <= ?
+    AND (lease_until IS NULL OR lease_until <= ?)
+    AND tracking_code IS NOT NULL
+    AND tracking_code != 'SEM-RASTREIO'
+    AND retry_count < ?
+"""
+
+def db_pending(limit: int = -1) -> List[Tuple[str, str]]:
+    """Retorna pedidos cuja próxima verificação de entrega já venceu (next_check_at <= agora)."""
+    now = db_timestamp()
     try:
-        with sqlite3.connect(DB_PATH) as con:
-            cur = con.execute("""
+        return database.fetchall(f"""
             SELECT bagy_order_id, tracking_code FROM orders
-            WHERE status IN ('created','shipped') 
-            AND tracking_code IS NOT NULL 
-            AND tracking_code != 'SEM-RASTREIO'
-            AND retry_count < ?
-            ORDER BY updated_at ASC
-            """, (MAX_RETRIES * 2,))
-            return cur.fetchall()
+            WHERE {PENDING_WHERE}
+            ORDER BY next_check_at ASC
+            LIMIT ?
+            """, (now, now, MAX_RETRIES * 2, limit))
     except Exception as e:
-        logger.error(f"❌ Erro ao buscar pedidos pendentes: {e}")
+        logger.error("❌ Erro ao buscar pedidos pendentes: %s", e)
         return []
 
+def db_claim_pending(worker_id: str, limit: int, lease_seconds: float) -> List[Tuple[str, str]]:
+    """
+    Reserva atomicamente até `limit` pedidos vencidos para `worker_id` (modo sharded).
+    
+    Um único UPDATE ... RETURNING marca leased_by/lease_until: dois workers nunca
+    recebem o mesmo pedido enquanto a reserva vale. A reserva não é liberada ao fim
+    do lote: pedidos verificados saem da fila pelo next_check_at (ou status), e os que
+    falharam só voltam depois de lease_until, evitando nova consulta no mesmo ciclo.
+    Reservas de um worker que morreu expiram sozinhas.
+    """
+    now = db_timestamp()
+    return database.fetchall(f"""
+        UPDATE orders SET leased_by = ?, lease_until = ?
+        WHERE id IN (
+            SELECT id FROM orders
+            WHERE {PENDING_WHERE}
+            ORDER BY next_check_at ASC
+            LIMIT ?
+        )
+        RETURNING bagy_order_id, tracking_code
+        """, (worker_id, db_timestamp(lease_seconds), now, now, MAX_RETRIES * 2, limit))
+
+def db_apply_observations(observed: List[Tuple[str, str, Observation]]) -> Dict[str, int]:
+    """
+    Grava o resultado das consultas de rastreio (order_id, tracking_code, observation).
+    
+    Respostas com o mesmo hash de eventos da anterior (orders.tracking_hash) não geram
+    evento nem atualizam o pedido: só o próximo next_check_at é gravado, com o contador
+    de respostas repetidas do AdaptiveSchedule. Mudanças entram em tracking_events e são
+    processadas em seguida (db_process_tracking_events), tudo em uma única transação.
+    """
+    if not observed:
+        return {"unchanged": 0, "changed": 0, "delivered": 0, "shipped": 0, "exceptions": 0}
+    by_order = {order_id: (code, obs) for order_id, code, obs in observed}
+    placeholders = ",".join("?" for _ in by_order)
+    rows = database.fetchall(f"""
+        SELECT bagy_order_id, tracking_hash, unchanged_checks,
+               (julianday('now') - julianday(COALESCE(shipped_at, created_at))) * 86400
+        FROM orders WHERE bagy_order_id IN ({placeholders})
+    """, list(by_order))
+    
+    unchanged_params, changed_params, changes = [], [], []
+    for order_id, stored_hash, unchanged, age in rows:
+        code, obs = by_order[order_id]
+        if obs.events_hash == stored_hash:
+            unchanged = (unchanged or 0) + 1
+            delay = tracking_schedule.next_delay(age or 0, obs.status, unchanged)
+            unchanged_params.append((unchanged, db_timestamp(delay), order_id))
+        else:
+            delay = tracking_schedule.next_delay(age or 0, obs.status, 0)
+            changed_params.append((obs.events_hash, obs.status, db_timestamp(delay), order_id))
+            changes.append((order_id, code, obs))
+    UNCHANGED_TOTAL.inc(len(unchanged_params))
+    
+    result = {"unchanged": len(unchanged_params), "changed": len(changes), "delivered": 0, "shipped": 0, "exceptions": 0}
+    try:
+        db_write_observations(unchanged_params, changed_params, changes, result)
+    except Exception as e:
+        logger.error("❌ Erro ao gravar %s resultados de rastreio: %s", len(observed), e)
+        raise
+    logger.debug("💾 Rastreio gravado: %s sem mudança, %s mudanças", result["unchanged"], result["changed"])
+    return result
+
+def db_write_observations(unchanged_params, changed_params, changes, result: Dict[str, int]):
+    """Grava reagendamentos, mudanças e o processamento das mudanças em uma transação."""
+    with database.transaction():
+        database.executemany("""
+        UPDATE orders SET
+            unchanged_checks = ?,
+            next_check_at = ?,
+            last_checked_at = CURRENT_TIMESTAMP
+        WHERE bagy_order_id = ?
+        """, unchanged_params)
+        if changes:
+            tracking_event_log.append(changes)
+            database.executemany("""
+            UPDATE orders SET
+                tracking_hash = ?,
+                last_carrier_status = ?,
+                unchanged_checks = 0,
+                next_check_at = ?,
+                last_checked_at = CURRENT_TIMESTAMP
+            WHERE bagy_order_id = ?
+            """, changed_params)
+            result.update(db_process_tracking_events())
+
+def db_process_tracking_events(limit: int = 1000) -> Dict[str, int]:
+    """
+    Processa as mudanças pendentes de tracking_events, em ordem de chegada.
+    
+    - delivered: pedido entregue + transição 'delivered' na outbox da Bagy (precedida de
+      'shipped' se o pedido ainda não estava enviado, para a Bagy receber o código de rastreio)
+    - primeira movimentação de um pedido 'created': status 'shipped' + transição 'shipped'
+    - exception: alerta (log de aviso e bagy_frenet_tracking_events_total{category="exception"})
+    
+    Participa da transação em andamento, se houver.
+    """
+    counts = {"delivered": 0, "shipped": 0, "exceptions": 0}
+    while True:
+        events = tracking_event_log.unprocessed(limit)
+        if not events:
+            return counts
+        updates, fulfillments = [], []
+        # Um pedido pode ter várias mudanças pendentes: a transição vale a partir do status atual
+        order_status = {event["order_id"]: event["order_status"] for event in events}
+        for event in events:
+            order_id, code, category = event["order_id"], event["tracking_code"], event["category"]
+            current = order_status.get(order_id)
+            if current is None or current == "delivered":
+                continue
+            if category == "delivered":
+                updates.append((order_id, code, "delivered", None))
+                if current != "shipped":
+                    # Entregue sem movimentação anterior: a Bagy ainda não recebeu o código de rastreio
+                    fulfillments.append((order_id, "shipped", code))
+                fulfillments.append((order_id, "delivered", code))
+                order_status[order_id] = "delivered"
+                counts["delivered"] += 1
+                continue
+            if category == "exception":
+                counts["exceptions"] += 1
+                logger.warning("🚨 Exceção no rastreio do pedido %s (%s): %s", order_id, code, event["status"])
+            if current == "created" and category in ("in_transit", "exception"):
+                updates.append((order_id, code, "shipped", None))
+                fulfillments.append((order_id, "shipped", code))
+                order_status[order_id] = "shipped"
+                counts["shipped"] += 1
+        db_save_many(updates)
+        if fulfillments:
+            fulfillment_outbox.enqueue_many(fulfillments)
+        tracking_event_log.mark_processed(events)
+        if len(events) < limit:
+            return counts
+
+# Campos da projeção resumida de /orders (atendida pelo índice idx_status_created)
+ORDER_SUMMARY_FIELDS = ("id", "bagy_order_id", "bagy_order_code", "status", "tracking_code", "created_at")
+
+@lru_cache(maxsize=1)
+def db_order_columns() -> Tuple[str, ...]:
+    """Colunas da tabela orders (projeções válidas em /orders)."""
+    return tuple(row[1] for row in database.fetchall("PRAGMA table_info(orders)"))
+
+def encode_cursor(created_at: str, row_id: int) -> str:
+    """Cursor opaco da paginação por (created_at, id)."""
+    raw = json.dumps([created_at, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(created_at), int(row_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+# Status que podem estar no arquivo morto (os demais são listados só da tabela quente)
+ARCHIVED_STATUSES = ("all", "delivered", "error")
+
+def db_list_orders(status: str = "all", fields: Optional[List[str]] = None, limit: int = 100,
+                   cursor: Optional[str] = None, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                   state: Optional[str] = None, city: Optional[str] = None,
+                   has_tracking: Optional[bool] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Lista pedidos do mais recente para o mais antigo com paginação por cursor (keyset).
+    
+    Retorna (pedidos, próximo cursor). fields=None seleciona todas as colunas;
+    id e created_at são sempre incluídos porque formam o cursor. Com o arquivo
+    morto ativo, status all/delivered/error também listam os pedidos arquivados.
+    """
+    columns = db_order_columns()
+    selected = list(columns) if not fields else list(dict.fromkeys(["id", "created_at", *fields]))
+    unknown = [f for f in selected if f not in columns]
+    if unknown:
+        raise ValueError(f"Campos desconhecidos: {', '.join(unknown)}")
+    
+    where, params = [], []
+    if status != "all":
+        where.append("status = ?")
+        params.append(status)
+    if date_from:
+        where.append("created_at >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("created_at <= ?")
+        params.append(date_to)
+    if state:
+        where.append("address_state = ?")
+        params.append(state)
+    if city:
+        where.append("address_city = ?")
+        params.append(city)
+    if has_tracking is True:
+        where.append("tracking_code IS NOT NULL AND tracking_code != ''")
+    elif has_tracking is False:
+        where.append("(tracking_code IS NULL OR tracking_code = '')")
+    if cursor:
+        where.append("(created_at, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    
+    projection = ", ".join(selected)
+    hot_query = f"""
+        SELECT {projection} FROM main.orders
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+    """
+    if ARCHIVE_ENABLED and status in ARCHIVED_STATUSES:
+        # Tabela quente + arquivo morto: cada lado usa o próprio índice (created_at, id) e devolve
+        # no máximo uma página; a união é reordenada e cortada. Pedidos que voltaram para a
+        # tabela quente depois de arquivados aparecem só uma vez (a versão quente).
+        archive_where = where + ["NOT EXISTS (SELECT 1 FROM main.orders o WHERE o.bagy_order_id = a.bagy_order_id)"]
+        query = f"""
+            SELECT * FROM ({hot_query})
+            UNION ALL
+            SELECT * FROM (
+                SELECT {projection} FROM {order_archive.table} a
+                WHERE {" AND ".join(archive_where)}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            )
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        """
+        query_params = (*params, limit + 1, *params, limit + 1, limit + 1)
+    else:
+        query, query_params = hot_query, (*params, limit + 1)
+    rows = database.fetchall(query, query_params, row_factory=sqlite3.Row)
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    orders = [dict(row) for row in rows]
+    if "order_data_json" in selected:
+        for order in orders:
+            order["order_data_json"] = decompress_json(order["order_data_json"])
+    return orders, next_cursor
+
 def db_stats() -> Dict[str, int]:
-    """Retorna estatísticas do banco de dados."""
+    """Retorna estatísticas do banco de dados (contadores materializados, cache de STATS_CACHE_TTL)."""
     try:
-        with sqlite3.connect(DB_PATH) as con:
-            stats = {}
-            cur = con.execute("SELECT status, COUNT(*) FROM orders GROUP BY status")
-            for status, count in cur.fetchall():
-                stats[status] = count
-            cur = con.execute("SELECT COUNT(*) FROM orders")
-            stats['total'] = cur.fetchone()[0]
-            return stats
+        return dict(stats_cache.get_or_set("status_counts", db_load_status_counts))
     except Exception as e:
-        logger.error(f"❌ Erro ao obter estatísticas: {e}")
+        logger.error("❌ Erro ao obter estatísticas: %s", e)
         return {}
 
-# === DECORADOR DE RETRY ===
-def retry_on_failure(max_attempts: int = MAX_RETRIES, delay: int = 2):
-    """Decorador para tentar novamente em caso de falha."""
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            last_exception = None
-            for attempt in range(1, max_attempts + 1):
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    last_exception = e
-                    if attempt < max_attempts:
-                        logger.warning(f"⚠️  Tentativa {attempt}/{max_attempts} falhou para {func.__name__}: {e}. Tentando novamente em {delay}s...")
-                        time.sleep(delay)
-                    else:
-                        logger.error(f"❌ Todas as {max_attempts} tentativas falharam para {func.__name__}: {e}")
-            raise last_exception
-        return wrapper
-    return decorator
+def db_load_status_counts() -> Dict[str, int]:
+    stats = {}
+    for status, count in database.fetchall("SELECT status, total FROM order_status_counts WHERE total != 0"):
+        stats[status] = count
+    stats['total'] = sum(stats.values())
+    return stats
+
+ORDER_THROUGHPUT_WINDOWS = (("last_minute", 1), ("last_hour", 60), ("last_day", 1440))
+
+def db_throughput() -> Dict[str, Dict[str, int]]:
+    """Pedidos que entraram em cada status no último minuto, hora e dia."""
+    try:
+        return stats_cache.get_or_set("throughput", db_load_throughput)
+    except Exception as e:
+        logger.error("❌ Erro ao obter vazão por status: %s", e)
+        return {}
+
+def db_load_throughput() -> Dict[str, Dict[str, int]]:
+    current = int(time.time()) // 60
+    rows = database.fetchall(
+        "SELECT status, minute, count FROM order_status_events WHERE minute > ?",
+        (current - 1440,)
+    )
+    result = {name: {} for name, _ in ORDER_THROUGHPUT_WINDOWS}
+    for status, minute, count in rows:
+        for name, minutes in ORDER_THROUGHPUT_WINDOWS:
+            if minute > current - minutes:
+                result[name][status] = result[name].get(status, 0) + count
+    return result
+
+# === RESILIÊNCIA ===
+# Retry só para falhas transitórias (timeout, conexão, 408/429/5xx), com backoff exponencial,
+# jitter e Retry-After; um circuit breaker por endpoint rejeita chamadas durante quedas
+def resilience_policy(name: str, max_attempts: int = MAX_RETRIES) -> RetryPolicy:
+    breaker = CircuitBreaker(name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT)
+    return RetryPolicy(name, max_attempts=max_attempts, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY, breaker=breaker)
+
+frenet_shipments_policy = resilience_policy("frenet_shipments")
+frenet_tracking_policy = resilience_policy("frenet_tracking", max_attempts=1)  # a agenda de rastreio já reagenda
+bagy_orders_policy = resilience_policy("bagy_orders")
+bagy_fulfillment_policy = resilience_policy("bagy_fulfillment", max_attempts=1)  # a outbox já reagenda com backoff
+frenet_quote_policy = resilience_policy("frenet_quote", max_attempts=1)  # o checkout não espera backoff
+bagy_products_policy = resilience_policy("bagy_products")
+RESILIENCE_POLICIES = [
+    frenet_shipments_policy, frenet_tracking_policy, frenet_quote_policy,
+    bagy_orders_policy, bagy_fulfillment_policy, bagy_products_policy
+]
 
 # === FUNÇÕES BAGY ===
 def bagy_headers() -> Dict[str, str]:
@@ -266,7 +766,17 @@ def bagy_headers() -> Dict[str, str]:
         "Accept": "application/json"
     }
 
-@retry_on_failure(max_attempts=MAX_RETRIES)
+HTTP_POOL_CONFIG = {
+    "pool_connections": HTTP_POOL_CONNECTIONS,
+    "pool_maxsize": HTTP_POOL_MAXSIZE,
+    "connect_timeout": HTTP_CONNECT_TIMEOUT,
+    "read_timeout": HTTP_READ_TIMEOUT,
+}
+
+# Cliente compartilhado: reaproveita conexões TCP/TLS e headers entre chamadas
+bagy_http = HttpClient("bagy", bagy_headers, **HTTP_POOL_CONFIG)
+
+@bagy_fulfillment_policy
 def bagy_mark_shipped(order_id: str, tracking_code: str):
     """Marca pedido como enviado na Bagy."""
     url = f"{BAGY_BASE}/orders/{order_id}/fulfillment/shipped"
@@ -275,33 +785,110 @@ def bagy_mark_shipped(order_id: str, tracking_code: str):
         "shipping_carrier": FORCE_CARRIER_NAME
     }
     
-    logger.info(f"📤 Marcando pedido {order_id} como enviado na Bagy...")
-    r = requests.put(url, headers=bagy_headers(), json=body, timeout=REQUEST_TIMEOUT)
+    logger.info("📤 Marcando pedido %s como enviado na Bagy...", order_id)
+    r = bagy_http.put(url, endpoint="orders/fulfillment/shipped", json=body)
     
     if not r.ok:
-        error_msg = f"Erro Bagy shipped [HTTP {r.status_code}]: {r.text}"
-        logger.error(f"❌ {error_msg}")
-        raise Exception(error_msg)
+        error = HttpError.from_response("Erro Bagy shipped", r)
+        logger.error("❌ %s", error)
+        raise error
     
-    logger.info(f"✅ Pedido {order_id} marcado como enviado na Bagy")
+    logger.info("✅ Pedido %s marcado como enviado na Bagy", order_id)
     return r.json() if r.content else {}
 
-@retry_on_failure(max_attempts=MAX_RETRIES)
+@bagy_fulfillment_policy
 def bagy_mark_delivered(order_id: str):
     """Marca pedido como entregue na Bagy."""
     url = f"{BAGY_BASE}/orders/{order_id}/fulfillment/delivered"
     
-    logger.info(f"📦 Marcando pedido {order_id} como entregue na Bagy...")
-    r = requests.put(url, headers=bagy_headers(), timeout=REQUEST_TIMEOUT)
+    logger.info("📦 Marcando pedido %s como entregue na Bagy...", order_id)
+    r = bagy_http.put(url, endpoint="orders/fulfillment/delivered")
     
     if not r.ok:
-        error_msg = f"Erro Bagy delivered [HTTP {r.status_code}]: {r.text}"
-        logger.error(f"❌ {error_msg}")
-        raise Exception(error_msg)
+        error = HttpError.from_response("Erro Bagy delivered", r)
+        logger.error("❌ %s", error)
+        raise error
     
-    logger.info(f"✅ Pedido {order_id} marcado como entregue na Bagy")
+    logger.info("✅ Pedido %s marcado como entregue na Bagy", order_id)
     return r.json() if r.content else {}
 
+# Pedidos da Bagy consultados pelo webhook GET: cache curto, revalidação condicional
+# (ETag/Last-Modified) e uma única requisição por pedido mesmo com notificações simultâneas
+bagy_order_cache = TTLCache(ttl=BAGY_ORDER_REVALIDATE_TTL, maxsize=BAGY_ORDER_CACHE_SIZE)
+bagy_order_flight = SingleFlight()
+
+@bagy_orders_policy
+def bagy_fetch_order(order_id: str, cached: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """GET do pedido na Bagy. Com uma entrada anterior, envia If-None-Match/If-Modified-Since."""
+    url = f"{BAGY_BASE}/orders/{order_id}"
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    
+    r = bagy_http.get(url, endpoint="orders", headers=headers)
+    
+    if r.status_code == 304 and cached:
+        logger.debug("♻️  Pedido %s não mudou na Bagy (304)", order_id)
+        return {**cached, "fetched_at": time.monotonic()}
+    
+    if not r.ok:
+        error = HttpError.from_response("Erro Bagy order", r)
+        logger.error("❌ %s", error)
+        raise error
+    
+    return {
+        "order": r.json(),
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "fetched_at": time.monotonic()
+    }
+
+def bagy_get_order(order_id: str) -> Dict[str, Any]:
+    """
+    Busca o pedido completo na Bagy.
+    
+    Respostas com menos de BAGY_ORDER_CACHE_TTL segundos são reaproveitadas; depois disso
+    (até BAGY_ORDER_REVALIDATE_TTL) a Bagy é consultada de forma condicional.
+    Chamadas simultâneas para o mesmo pedido compartilham a mesma requisição.
+    """
+    order_id = str(order_id)
+    cached = bagy_order_cache.get(order_id)
+    if cached and time.monotonic() - cached["fetched_at"] < BAGY_ORDER_CACHE_TTL:
+        return copy.deepcopy(cached["order"])
+    
+    def refresh() -> Dict[str, Any]:
+        entry = bagy_fetch_order(order_id, cached)
+        bagy_order_cache.set(order_id, entry)
+        return entry
+    
+    entry, _ = bagy_order_flight.do(order_id, refresh)
+    return copy.deepcopy(entry["order"])
+
+# === CATÁLOGO DE PRODUTOS (peso e dimensões por SKU) ===
+product_catalog = ProductCatalog(database, ttl=CATALOG_CACHE_TTL)
+
+@bagy_products_policy
+def bagy_fetch_products(page: int) -> Any:
+    """Uma página da listagem de produtos da Bagy."""
+    r = bagy_http.get(f"{BAGY_BASE}/products", endpoint="products", params={"page": page, "limit": CATALOG_PAGE_SIZE})
+    if not r.ok:
+        raise HttpError.from_response("Erro Bagy products", r)
+    return r.json() if r.content else []
+
+def catalog_sweep(should_continue=None) -> Dict[str, Any]:
+    """Sincroniza o catálogo local com a listagem de produtos da Bagy (uma requisição por página)."""
+    result = product_catalog.refresh(bagy_fetch_products, CATALOG_PAGE_SIZE, should_continue)
+    logger.log(SUMMARY, "📦 Catálogo de produtos sincronizado: %s SKUs em %s páginas (%ss)",
+               result["skus"], result["pages"], result["duration_seconds"])
+    return result
+
+def order_package(items: List[Dict[str, Any]]) -> Package:
+    """Peso, dimensões e cubagem do pacote de um pedido (itens de build_order_data)."""
+    return pack_items(items, product_catalog.get)
+
 # === FUNÇÕES FRENET ===
 def shipping_api_headers() -> Dict[str, str]:
     """Retorna headers para requisições à API de envio (configurável por tipo)."""
@@ -331,17 +918,9 @@ def frenet_headers() -> Dict[str, str]:
     """Alias para shipping_api_headers() - compatibilidade."""
     return shipping_api_headers()
 
-def normalize_order_data(pedido: Dict[str, Any]) -> Dict[str, Any]:
-    """Normaliza dados do pedido - suporta formato direto e formato com 'event'/'data'."""
-    # Se o webhook vier com estrutura {"event": "...", "data": {...}}
-    if "event" in pedido and "data" in pedido:
-        logger.info(f"📦 Formato webhook com event: {pedido.get('event')}")
-        return pedido["data"]
-    
-    # Formato direto (pedido completo no root)
-    return pedido
+frenet_http = HttpClient("frenet", shipping_api_headers, **HTTP_POOL_CONFIG)
 
-@retry_on_failure(max_attempts=MAX_RETRIES)
+@frenet_shipments_policy
 def send_to_frenet_shipments(pedido: Dict[str, Any]) -> Dict[str, Any]:
     """Envia pedido para API de Shipments da Frenet (cria pedido no painel 'Gerencie suas etiquetas')."""
     # Normalizar dados do pedido
@@ -349,166 +928,294 @@ def send_to_frenet_shipments(pedido: Dict[str, Any]) -> Dict[str, Any]:
     
     order_id = pedido.get("id", "UNKNOWN")
     order_code = pedido.get("code", "UNKNOWN")
-    logger.info(f"📋 Enviando pedido #{order_code} (ID: {order_id}) para Frenet...")
+    logger.info("📋 Enviando pedido #%s (ID: %s) para Frenet...", order_code, order_id)
     
-    # Extrair dados do endereço
-    addr = pedido.get("address", {}) or pedido.get("shipping_address", {})
-    logger.info(f"📍 Endereço encontrado: {bool(addr)}")
-    if not addr:
+    if not (pedido.get("address") or pedido.get("shipping_address")):
         raise ValueError("Endereço de entrega não encontrado no pedido")
-    
-    # Extrair dados do cliente
-    cust = pedido.get("customer", {})
-    logger.info(f"👤 Cliente encontrado: {bool(cust)} - Nome: {cust.get('name', 'N/A')}")
-    if not cust:
+    if not pedido.get("customer"):
         raise ValueError("Dados do cliente não encontrados no pedido")
+    if not pedido.get("items"):
+        logger.warning("⚠️  Pedido %s sem itens, usando valores padrão", order_id)
     
-    # Processar itens
-    items = pedido.get("items", []) or []
-    logger.info(f"📦 Itens encontrados: {len(items)}")
-    if not items:
-        logger.warning(f"⚠️  Pedido {order_id} sem itens, usando valores padrão")
-        items = [{"weight": 1, "length": 20, "height": 10, "width": 15, "quantity": 1}]
-    
-    # Calcular peso total e dimensões
-    total_weight = sum(float(it.get("weight", 500)) for it in items) / 1000  # Converter gramas para kg
-    total_weight = max(total_weight, 0.1)  # Mínimo 0.1kg
-    
-    # Calcular valor total
-    invoice_value = float(pedido.get("total", 0)) or sum(
-        float(it.get("price", 0)) * int(it.get("quantity", 1)) for it in items
-    )
-    
-    # Limpar e formatar dados
-    recipient_zipcode = addr.get("zipcode", "").replace("-", "").replace(".", "").strip()
-    recipient_name = cust.get("name", "Cliente")
-    recipient_phone = cust.get("phone", "").replace("(", "").replace(")", "").replace("-", "").replace(" ", "").strip()
-    recipient_email = cust.get("email", "")
-    recipient_cpf = cust.get("cpf", cust.get("document", "")).replace(".", "").replace("-", "").strip()
+    order_data = build_order_data(pedido)
+    package = order_package(order_data["items"])
+    payload = build_shipment_payload(order_data, float(pedido.get("shipping_cost", FORCE_VALUE)), package)
     
-    # Montar payload para API Frenet Shipments
-    # Baseado na documentação: https://docs.frenet.com.br/docs/shipments-whitelabel
-    payload = {
-        "OrderNumber": str(order_code),  # Número do pedido na sua plataforma
-        "RecipientDocument": recipient_cpf if recipient_cpf else "",  # CPF do destinatário
-        "RecipientName": recipient_name,
-        "RecipientEmail": recipient_email,
-        "RecipientPhone": recipient_phone,
-        "RecipientZipCode": recipient_zipcode,
-        "RecipientAddress": addr.get("street", addr.get("address", "")),
-        "RecipientAddressNumber": addr.get("number", "S/N"),
-        "RecipientAddressComplement": addr.get("complement", ""),
-        "RecipientAddressDistrict": addr.get("district", addr.get("neighborhood", "")),
-        "RecipientCity": addr.get("city", ""),
-        "RecipientState": addr.get("state", ""),
-        "RecipientCountry": "BR",
-        "PackageHeight": 10,  # cm - ajustar conforme necessário
-        "PackageWidth": 15,   # cm
-        "PackageLength": 20,  # cm
-        "PackageWeight": total_weight,  # kg
-        "InvoiceValue": invoice_value,
-        "ShippingQuoteValue": float(pedido.get("shipping_cost", FORCE_VALUE)),
-        "Items": [
-            {
-                "SKU": it.get("sku", f"ITEM-{idx}"),
-                "Description": it.get("name", "Produto"),
-                "Quantity": int(it.get("quantity", 1)),
-                "Price": float(it.get("price", 0))
-            }
-            for idx, it in enumerate(items, 1)
-        ]
-    }
+    logger.info("📤 Enviando para Frenet Shipments API...")
+    logger.info("📍 Origem: %s → Destino: %s", SELLER_CEP, payload["RecipientZipCode"])
+    logger.info("💰 Valor: R$ %s | Peso: %skg | Pacote: %sx%sx%s cm%s", payload["InvoiceValue"], payload["PackageWeight"],
+                *package.dimensions, " (estimado)" if package.estimated else "")
+    logger.info("👤 Cliente: %s | Pedido: %s", payload["RecipientName"], order_code)
+    payload_logger.debug("📤 Payload Frenet: %s", payload)
     
-    logger.info(f"📤 Enviando para Frenet Shipments API...")
-    logger.info(f"📍 Origem: {SELLER_CEP} → Destino: {recipient_zipcode}")
-    logger.info(f"💰 Valor: R$ {invoice_value} | Peso: {total_weight}kg")
-    logger.info(f"👤 Cliente: {recipient_name} | Pedido: {order_code}")
-    logger.debug(f"Payload Frenet: {payload}")
-    
-    # URL da API de Shipments (pode variar - verificar documentação)
-    shipments_url = os.getenv("FRENET_SHIPMENTS_URL", "https://api.frenet.com.br/v1/shipments")
-    
-    r = requests.post(shipments_url, headers=frenet_headers(), json=payload, timeout=REQUEST_TIMEOUT)
+    r = frenet_http.post(FRENET_SHIPMENTS_URL, endpoint="shipments", json=payload)
     
     if not r.ok:
-        error_msg = f"Erro Frenet Shipments [HTTP {r.status_code}]: {r.text}"
-        logger.error(f"❌ {error_msg}")
-        raise Exception(error_msg)
+        error = HttpError.from_response("Erro Frenet Shipments", r)
+        logger.error("❌ %s", error)
+        raise error
     
     response_data = r.json() if r.content else {}
-    logger.info(f"📥 Resposta Frenet: {response_data}")
+    payload_logger.debug("📥 Resposta Frenet: %s", response_data)
     
     # Extrair ID do pedido criado na Frenet
     frenet_order_id = response_data.get("OrderId") or response_data.get("order_id") or response_data.get("id")
     
-    logger.info(f"✅ Pedido #{order_code} criado na Frenet com sucesso!")
+    logger.info("✅ Pedido #%s criado na Frenet com sucesso!", order_code)
     if frenet_order_id:
-        logger.info(f"🆔 ID Frenet: {frenet_order_id}")
-    logger.info(f"👉 Acesse painel.frenet.com.br → Gerencie suas etiquetas")
-    logger.info(f"🏷️  O pedido deve aparecer lá para você gerar a etiqueta manualmente")
+        logger.info("🆔 ID Frenet: %s", frenet_order_id)
+    logger.info("👉 Acesse painel.frenet.com.br → Gerencie suas etiquetas")
+    logger.info("🏷️  O pedido deve aparecer lá para você gerar a etiqueta manualmente")
     
     # Retornar dados estruturados
-    order_data = {
-        "order_id": order_id,
-        "order_code": order_code,
-        "frenet_order_id": frenet_order_id,
-        "customer": {
-            "name": recipient_name,
-            "cpf": recipient_cpf,
-            "email": recipient_email,
-            "phone": recipient_phone
-        },
-        "address": {
-            "zipcode": recipient_zipcode,
-            "street": addr.get("street", addr.get("address", "")),
-            "number": addr.get("number", "S/N"),
-            "complement": addr.get("complement", ""),
-            "neighborhood": addr.get("district", addr.get("neighborhood", "")),
-            "city": addr.get("city", ""),
-            "state": addr.get("state", "")
-        },
-        "items": [
-            {
-                "name": it.get("name", "Produto"),
-                "quantity": it.get("quantity", 1),
-                "weight": it.get("weight", 500),
-                "price": it.get("price", 0)
-            }
-            for it in items
+    order_data["customer"]["name"] = payload["RecipientName"]
+    order_data["frenet_order_id"] = frenet_order_id
+    order_data["frenet_response"] = response_data
+    order_data["package"] = package._asdict()
+    return order_data
+
+@frenet_quote_policy
+def frenet_quote(recipient_cep: str, weight_kg: float, dimensions: Tuple[int, int, int]) -> List[Dict[str, Any]]:
+    """Cotação na Frenet (SELLER_CEP → destinatário) para um pacote; serviços do mais barato ao mais caro."""
+    height, width, length = dimensions
+    body = {
+        "SellerCEP": clean_cep(SELLER_CEP),
+        "RecipientCEP": recipient_cep,
+        "ShipmentInvoiceValue": QUOTE_INVOICE_VALUE,
+        "ShippingServiceCode": None,
+        "ShippingItemArray": [
+            {"Height": height, "Width": width, "Length": length, "Weight": weight_kg, "Quantity": 1}
         ],
-        "total_value": invoice_value,
-        "shipping_cost": float(pedido.get("shipping_cost", 0)),
-        "frenet_response": response_data
+        "RecipientCountry": "BR",
     }
+    r = frenet_http.post(SHIPPING_API_URL, endpoint="quote", json=body, timeout=(HTTP_CONNECT_TIMEOUT, QUOTE_TIMEOUT))
+    if not r.ok:
+        raise HttpError.from_response("Erro Frenet cotação", r)
+    return services_from_response(r.json() if r.content else None)
+
+quote_engine = QuoteEngine(
+    frenet_quote,
+    database=database if QUOTE_PERSIST else None,
+    ttl=QUOTE_CACHE_TTL,
+    cache_size=QUOTE_CACHE_SIZE,
+    cep_prefix=QUOTE_CEP_PREFIX,
+    weight_step=QUOTE_WEIGHT_STEP,
+    dimension_step=QUOTE_DIMENSION_STEP,
+    stale_ttl=QUOTE_STALE_TTL
+)
+
+@frenet_tracking_policy
+def frenet_tracking_request(url: str, body: Dict[str, Any]) -> Any:
+    """POST na API de rastreio; respostas de erro viram HttpError (contadas pelo circuit breaker)."""
+    r = frenet_http.post(url, endpoint="tracking/bulk" if url == TRACKING_BULK_URL else "tracking", json=body)
+    if not r.ok:
+        raise HttpError.from_response("Erro Frenet rastreio", r)
+    return r.json() if r.content else None
+
+def frenet_tracking_observation(code: str) -> Observation:
+    """Consulta o rastreio na Frenet e retorna status, categoria e hash dos eventos (erros são propagados)."""
+    logger.debug("🔍 Consultando rastreio %s na Frenet...", code)
+    data = frenet_tracking_request(FRENET_TRACK_URL, {"TrackingNumber": code}) or {}
+    return observation_from_response(data)
+
+def frenet_track_many(codes: List[str]) -> Dict[str, Union[Observation, Exception]]:
+    """
+    Consulta vários rastreios de uma vez.
     
-    return order_data
+    Usa o endpoint em lote (TRACKING_BULK_URL) quando configurado; caso contrário,
+    distribui as consultas individuais no pool do motor de rastreio, reaproveitando
+    as conexões do cliente HTTP. Retorna {código: observation ou a exceção da consulta}.
+    """
+    if not codes:
+        return {}
+    
+    if TRACKING_BULK_URL:
+        try:
+            with tracking_throttle.slot(TRACKING_BULK_URL):
+                data = frenet_tracking_request(TRACKING_BULK_URL, {"TrackingNumbers": codes}) or []
+            if isinstance(data, dict):
+                data = data.get("Results") or data.get("results") or []
+            missing = ValueError("Rastreio ausente na resposta em lote")
+            results: Dict[str, Union[Observation, Exception]] = {code: missing for code in codes}
+            for item in data:
+                code = item.get("TrackingNumber")
+                if code in results:
+                    results[code] = observation_from_response(item)
+            return results
+        except Exception as e:
+            logger.error("❌ Erro na consulta em lote de %s rastreios: %s", len(codes), e)
+            return {code: e for code in codes}
+    
+    def check_one(code: str) -> Union[Observation, Exception]:
+        try:
+            with tracking_throttle.slot(FRENET_TRACK_URL):
+                return frenet_tracking_observation(code)
+        except Exception as e:
+            return e
+    
+    return dict(zip(codes, tracking_engine.map(check_one, codes)))
 
-def frenet_check_delivered(code: str) -> bool:
-    """Verifica se pedido foi entregue consultando rastreio na Frenet."""
+# === PROCESSAMENTO DE PEDIDOS ===
+def process_order(pedido_normalizado: Dict[str, Any], allow_fallback: bool = True) -> Dict[str, Any]:
+    """
+    Envia o pedido para a Frenet e salva no banco.
+    
+    Se a API falhar e allow_fallback=True, salva localmente para criação manual. Com
+    allow_fallback=False, só falhas transitórias são propagadas (para nova tentativa);
+    erros definitivos (4xx) e circuito aberto usam o fallback imediatamente.
+    Retorna o corpo da resposta do webhook.
+    """
+    order_id = pedido_normalizado.get("id")
+    order_code = pedido_normalizado.get("code")
+    
+    # Tentar enviar para API Frenet Shipments
     try:
-        body = {"TrackingNumber": code}
-        logger.debug(f"🔍 Consultando rastreio {code} na Frenet...")
+        order_data = send_to_frenet_shipments(pedido_normalizado)
         
-        r = requests.post(FRENET_TRACK_URL, headers=frenet_headers(), json=body, timeout=REQUEST_TIMEOUT)
+        # Salvar no banco como "pending" (aguardando você gerar etiqueta manualmente na Frenet)
+        db_save(order_id, tracking=None, status="pending", order_data=order_data)
         
-        if not r.ok:
-            logger.warning(f"⚠️  Erro ao consultar rastreio {code} [HTTP {r.status_code}]: {r.text}")
-            return False
+        logger.info("✅ Pedido #%s (ID: %s) enviado para Frenet com sucesso!", order_code, order_id)
+        logger.info("🏷️  Pedido deve aparecer em: painel.frenet.com.br → Gerencie suas etiquetas")
+        logger.info("👉 Acesse lá para escolher transportadora e gerar a etiqueta")
         
-        data = r.json() if r.content else {}
-        status = str(data.get("CurrentStatus") or data.get("Status") or "").lower()
+        return {
+            "success": True,
+            "order_id": order_id,
+            "order_code": order_code,
+            "frenet_order_id": order_data.get("frenet_order_id"),
+            "message": "Pedido criado na Frenet! Acesse o painel para gerar etiqueta.",
+            "order_data": order_data,
+            "method": "api",
+            "next_steps": [
+                "1. Acesse https://painel.frenet.com.br",
+                "2. Vá em 'Gerencie suas etiquetas'",
+                "3. Encontre o pedido #" + str(order_code),
+                "4. Escolha a transportadora (recomendado: Loggi Drop Off)",
+                "5. Gere a etiqueta e imprima",
+                "6. Faça a postagem do pacote",
+                "7. O sistema vai monitorar o rastreio e atualizar a Bagy quando entregue"
+            ]
+        }
         
-        is_delivered = "entregue" in status or "delivered" in status or "finalizado" in status
+    except Exception as api_error:
+        # Falhas transitórias voltam para a fila; erros definitivos e circuito aberto vão direto ao fallback
+        if not allow_fallback and is_retryable(api_error):
+            raise
         
-        if is_delivered:
-            logger.info(f"📦 Rastreio {code} está ENTREGUE (status: {status})")
-        else:
-            logger.debug(f"Rastreio {code} ainda não entregue (status: {status})")
+        # Se API falhar (404, 401, timeout, etc), usar modo fallback
+        error_msg = str(api_error)
+        logger.warning("⚠️  API Frenet falhou: %s", error_msg)
+        logger.warning("💾 Salvando pedido localmente como fallback...")
+        
+        # Mesmos dados que o envio à Frenet gravaria
+        order_data = build_order_data(pedido_normalizado)
+        
+        # Salvar no banco
+        db_save(order_id, tracking=None, status="pending", order_data=order_data)
         
-        return is_delivered
+        logger.info("✅ Pedido #%s salvo localmente!", order_code)
+        logger.info("🌐 Acesse /orders para visualizar e criar manualmente na Frenet")
+        logger.info("⚠️  Nota: API Frenet não disponível, usando modo manual")
+        
+        return {
+            "success": True,
+            "order_id": order_id,
+            "order_code": order_code,
+            "message": "Pedido salvo localmente. API Frenet indisponível.",
+            "order_data": order_data,
+            "method": "fallback",
+            "api_error": error_msg,
+            "next_steps": [
+                "1. Acesse https://seu-dominio.railway.app/orders",
+                "2. Visualize o pedido #" + str(order_code),
+                "3. Copie os dados do cliente e endereço",
+                "4. Acesse https://painel.frenet.com.br manualmente",
+                "5. Crie o pedido com os dados copiados",
+                "6. Escolha transportadora e gere etiqueta",
+                "7. Faça a postagem do pacote",
+                "8. O sistema vai monitorar o rastreio e atualizar a Bagy quando entregue"
+            ]
+        }
+
+def handle_shipment_job(job: Dict[str, Any]):
+    """Handler da fila: envia o pedido à Frenet. Falhas transitórias só usam o fallback local na última tentativa."""
+    process_order(job["payload"], allow_fallback=job["final_attempt"])
+
+def shipment_job_dead(job: Dict[str, Any], error: Exception):
+    """Registra no banco o pedido cujo job esgotou as tentativas e libera a chave de idempotência."""
+    order_id = job["payload"].get("id")
+    if order_id:
+        db_save(order_id, status="error", error=str(error))
+        idempotency.forget(IdempotencyStore.key_for(order_id, job["payload"]))
+
+webhook_queue = JobQueue(database, visibility_timeout=QUEUE_VISIBILITY_TIMEOUT, max_attempts=QUEUE_MAX_ATTEMPTS, retry_delay=QUEUE_RETRY_DELAY)
+webhook_dispatcher = JobDispatcher(webhook_queue, handle_shipment_job, workers=QUEUE_WORKERS, on_dead=shipment_job_dead)
+idempotency = IdempotencyStore(database, ttl=IDEMPOTENCY_TTL, cache_size=IDEMPOTENCY_CACHE_SIZE, lock_seconds=IDEMPOTENCY_LOCK_SECONDS)
+
+# === OUTBOX DE FULFILLMENT (BAGY) ===
+# Limita concorrência e taxa das atualizações de fulfillment enviadas à Bagy
+fulfillment_throttle = HostThrottle(FULFILLMENT_CONCURRENCY, FULFILLMENT_RATE_LIMIT)
+
+def send_fulfillment(item: Dict[str, Any]):
+    """Envia uma transição da outbox à Bagy (uma tentativa: a outbox reagenda com backoff)."""
+    with fulfillment_throttle.slot(BAGY_BASE):
+        if item["transition"] == "delivered":
+            if item.get("shipped_pending"):
+                # 'shipped' substituído antes de ser enviado: a Bagy recebe o código de rastreio primeiro
+                bagy_mark_shipped(item["order_id"], item["tracking_code"])
+                fulfillment_outbox.shipped_sent(item["order_id"])
+            bagy_mark_delivered(item["order_id"])
+        else:
+            bagy_mark_shipped(item["order_id"], item["tracking_code"])
+
+def fulfillment_dead(item: Dict[str, Any], error: Exception):
+    """Registra no pedido a transição que não pôde ser enviada à Bagy."""
+    db_save_many([(item["order_id"], None, None, f"Bagy {item['transition']}: {error}")])
+
+fulfillment_outbox = FulfillmentOutbox(database, max_attempts=FULFILLMENT_MAX_ATTEMPTS, retry_delay=FULFILLMENT_RETRY_DELAY)
+# Mudanças de rastreio observadas (uma linha por mudança, consumidas pelo rastreio)
+tracking_event_log = TrackingEventLog(database)
+
+# Arquivo morto (ARCHIVE_DB_PATH, anexado como "archive" em cada conexão)
+order_archive = OrderArchive(database) if ARCHIVE_ENABLED else None
+fulfillment_dispatcher = OutboxDispatcher(
+    fulfillment_outbox, send_fulfillment,
+    concurrency=FULFILLMENT_CONCURRENCY,
+    batch_size=FULFILLMENT_BATCH_SIZE,
+    on_dead=fulfillment_dead
+)
+
+def accept_order(pedido_normalizado: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Enfileira (WEBHOOK_ASYNC) ou processa o pedido faturado. Retorna (corpo, status HTTP)."""
+    order_id = pedido_normalizado.get("id")
+    order_code = pedido_normalizado.get("code")
+    
+    # Modo assíncrono: persistir na fila e responder imediatamente
+    if WEBHOOK_ASYNC:
+        job_id = webhook_queue.enqueue("frenet_shipment", pedido_normalizado)
+        webhook_dispatcher.notify()
+        logger.info("📬 Pedido #%s (ID: %s) enfileirado (job %s)", order_code, order_id, job_id)
+        return {
+            "accepted": True,
+            "order_id": order_id,
+            "order_code": order_code,
+            "job_id": job_id,
+            "message": "Pedido recebido e enfileirado para envio à Frenet"
+        }, 202
+    
+    # Modo síncrono: processar dentro da requisição
+    try:
+        return process_order(pedido_normalizado), 200
     except Exception as e:
-        logger.error(f"❌ Erro ao verificar rastreio {code}: {e}")
-        return False
+        error_msg = str(e)
+        logger.error("❌ Erro crítico ao processar pedido %s: %s", order_id, error_msg)
+        db_save(order_id, status="error", error=error_msg)
+        
+        return {
+            "error": error_msg,
+            "order_id": order_id
+        }, 500
 
 # === WEBHOOK ===
 @app.route("/webhook", methods=["POST", "GET"])
@@ -520,7 +1227,8 @@ def webhook():
         # Suportar GET (estilo integração nativa) e POST
         if request.method == "GET":
             order_id = request.args.get("order") or request.args.get("id")
-            logger.info(f"📥 Webhook GET recebido - order_id: {order_id}, query params: {dict(request.args)}")
+            g.order_log = {"order_id": order_id, "order_code": None}
+            logger.info("📥 Webhook GET recebido - order_id: %s, query params: %s", order_id, request.args)
             
             if not order_id:
                 logger.warning("⚠️  Webhook GET sem parâmetro 'order' ou 'id'")
@@ -528,11 +1236,11 @@ def webhook():
             
             # Buscar pedido completo da API Bagy
             try:
-                logger.info(f"🔍 Buscando dados do pedido {order_id} na Bagy...")
+                logger.info("🔍 Buscando dados do pedido %s na Bagy...", order_id)
                 pedido = bagy_get_order(order_id)
-                logger.info(f"📦 Pedido obtido da Bagy: {pedido}")
+                payload_logger.debug("📦 Pedido obtido da Bagy: %s", pedido)
             except Exception as e:
-                logger.error(f"❌ Erro ao buscar pedido da Bagy: {e}")
+                logger.error("❌ Erro ao buscar pedido da Bagy: %s", e)
                 return jsonify({"error": f"Erro ao buscar pedido: {str(e)}"}), 500
         else:
             # POST - pedido vem no body
@@ -545,25 +1253,27 @@ def webhook():
             
             if not order_id:
                 logger.warning("⚠️  Webhook POST recebido sem ID de pedido")
-                logger.warning(f"📦 Payload recebido: {pedido}")
+                logger.warning("📦 Payload recebido: %s", pedido)
                 return jsonify({"error": "ID do pedido não encontrado"}), 400
             
-            logger.info(f"📥 Webhook POST recebido para pedido {order_id} (código: {order_code})")
-            logger.info(f"📦 Payload completo: {pedido}")
+            logger.info("📥 Webhook POST recebido para pedido %s (código: %s)", order_id, order_code)
+            payload_logger.debug("📦 Payload completo: %s", pedido)
         
         # Normalizar dados do pedido (extrair de "data" se necessário)
         pedido_normalizado = normalize_order_data(pedido)
         order_id = pedido_normalizado.get("id")
         order_code = pedido_normalizado.get("code")
+        g.order_log = {"order_id": order_id, "order_code": order_code}
         
-        logger.info(f"🔢 Pedido - ID: {order_id}, Código: {order_code}")
+        logger.info("🔢 Pedido - ID: %s, Código: %s", order_id, order_code)
         
         # Verificar fulfillment_status - SÓ PROCESSAR SE ESTIVER FATURADO
         fulfillment_status = pedido_normalizado.get("fulfillment_status", "")
-        logger.info(f"📊 Status do fulfillment: '{fulfillment_status}'")
+        logger.info("📊 Status do fulfillment: '%s'", fulfillment_status)
         
         if fulfillment_status != "invoiced":
-            logger.info(f"⏭️  Pedido #{order_code} (ID: {order_id}) ignorado - status '{fulfillment_status}' (esperado: 'invoiced')")
+            g.order_log["outcome"] = "ignored"
+            logger.info("⏭️  Pedido #%s (ID: %s) ignorado - status '%s' (esperado: 'invoiced')", order_code, order_id, fulfillment_status)
             return jsonify({
                 "message": "Pedido ignorado - apenas pedidos FATURADOS são processados",
                 "order_id": order_id,
@@ -572,178 +1282,325 @@ def webhook():
                 "required": "invoiced"
             }), 200
         
-        logger.info(f"✅ Pedido #{order_code} (ID: {order_id}) está FATURADO, processando...")
+        logger.info("✅ Pedido #%s (ID: %s) está FATURADO, processando...", order_code, order_id)
         
         # Verificar se já foi processado
-        with sqlite3.connect(DB_PATH) as con:
-            cur = con.execute("SELECT status FROM orders WHERE bagy_order_id = ?", (order_id,))
-            existing = cur.fetchone()
-            if existing and existing[0] in ['shipped', 'delivered']:
-                logger.info(f"⏭️  Pedido {order_id} já foi processado (status: {existing[0]})")
-                return jsonify({
-                    "message": "Pedido já processado",
-                    "status": existing[0]
-                }), 200
+        existing = database.fetchone("SELECT status FROM orders WHERE bagy_order_id = ?", (order_id,))
+        if not existing and order_archive:
+            archived_status = order_archive.status_of(order_id)
+            existing = (archived_status,) if archived_status else None
+        if existing and existing[0] in ['shipped', 'delivered']:
+            g.order_log["outcome"] = "already_processed"
+            logger.info("⏭️  Pedido %s já foi processado (status: %s)", order_id, existing[0])
+            return jsonify({
+                "message": "Pedido já processado",
+                "status": existing[0]
+            }), 200
         
-        # Processar pedido - ENVIAR PARA FRENET SHIPMENTS API (com fallback)
+        # Reenvios do mesmo pedido/payload devolvem a resposta da primeira entrega
+        idempotency_key = IdempotencyStore.key_for(order_id, pedido_normalizado)
         try:
-            # Tentar enviar para API Frenet Shipments
-            try:
-                order_data = send_to_frenet_shipments(pedido_normalizado)
-                
-                # Salvar no banco como "pending" (aguardando você gerar etiqueta manualmente na Frenet)
-                db_save(order_id, tracking=None, status="pending", order_data=order_data)
-                
-                logger.info(f"✅ Pedido #{order_code} (ID: {order_id}) enviado para Frenet com sucesso!")
-                logger.info(f"🏷️  Pedido deve aparecer em: painel.frenet.com.br → Gerencie suas etiquetas")
-                logger.info(f"👉 Acesse lá para escolher transportadora e gerar a etiqueta")
-                
-                return jsonify({
-                    "success": True,
-                    "order_id": order_id,
-                    "order_code": order_code,
-                    "frenet_order_id": order_data.get("frenet_order_id"),
-                    "message": "Pedido criado na Frenet! Acesse o painel para gerar etiqueta.",
-                    "order_data": order_data,
-                    "method": "api",
-                    "next_steps": [
-                        "1. Acesse https://painel.frenet.com.br",
-                        "2. Vá em 'Gerencie suas etiquetas'",
-                        "3. Encontre o pedido #" + str(order_code),
-                        "4. Escolha a transportadora (recomendado: Loggi Drop Off)",
-                        "5. Gere a etiqueta e imprima",
-                        "6. Faça a postagem do pacote",
-                        "7. O sistema vai monitorar o rastreio e atualizar a Bagy quando entregue"
-                    ]
-                }), 200
-                
-            except Exception as api_error:
-                # Se API falhar (404, 401, timeout, etc), usar modo fallback
-                error_msg = str(api_error)
-                logger.warning(f"⚠️  API Frenet falhou: {error_msg}")
-                logger.warning(f"💾 Salvando pedido localmente como fallback...")
-                
-                # Extrair dados básicos para salvar
-                cust = pedido_normalizado.get("customer", {})
-                addr = pedido_normalizado.get("address", {}) or pedido_normalizado.get("shipping_address", {})
-                items = pedido_normalizado.get("items", []) or []
-                
-                order_data = {
-                    "order_id": order_id,
-                    "order_code": order_code,
-                    "customer": {
-                        "name": cust.get("name", ""),
-                        "cpf": cust.get("cpf", cust.get("document", "")),
-                        "email": cust.get("email", ""),
-                        "phone": cust.get("phone", "")
-                    },
-                    "address": {
-                        "zipcode": addr.get("zipcode", "").replace("-", "").replace(".", ""),
-                        "street": addr.get("street", addr.get("address", "")),
-                        "number": addr.get("number", "S/N"),
-                        "complement": addr.get("complement", ""),
-                        "neighborhood": addr.get("district", addr.get("neighborhood", "")),
-                        "city": addr.get("city", ""),
-                        "state": addr.get("state", "")
-                    },
-                    "items": [
-                        {
-                            "name": it.get("name", "Produto"),
-                            "quantity": it.get("quantity", 1),
-                            "weight": it.get("weight", 500),
-                            "price": it.get("price", 0)
-                        }
-                        for it in items
-                    ],
-                    "total_value": float(pedido_normalizado.get("total", 0)),
-                    "shipping_cost": float(pedido_normalizado.get("shipping_cost", 0))
-                }
-                
-                # Salvar no banco
-                db_save(order_id, tracking=None, status="pending", order_data=order_data)
-                
-                logger.info(f"✅ Pedido #{order_code} salvo localmente!")
-                logger.info(f"🌐 Acesse /orders para visualizar e criar manualmente na Frenet")
-                logger.info(f"⚠️  Nota: API Frenet não disponível, usando modo manual")
-                
-                return jsonify({
-                    "success": True,
-                    "order_id": order_id,
-                    "order_code": order_code,
-                    "message": "Pedido salvo localmente. API Frenet indisponível.",
-                    "order_data": order_data,
-                    "method": "fallback",
-                    "api_error": error_msg,
-                    "next_steps": [
-                        "1. Acesse https://seu-dominio.railway.app/orders",
-                        "2. Visualize o pedido #" + str(order_code),
-                        "3. Copie os dados do cliente e endereço",
-                        "4. Acesse https://painel.frenet.com.br manualmente",
-                        "5. Crie o pedido com os dados copiados",
-                        "6. Escolha transportadora e gere etiqueta",
-                        "7. Faça a postagem do pacote",
-                        "8. O sistema vai monitorar o rastreio e atualizar a Bagy quando entregue"
-                    ]
-                }), 200
-            
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"❌ Erro crítico ao processar pedido {order_id}: {error_msg}")
-            db_save(order_id, status="error", error=error_msg)
-            
-            return jsonify({
-                "error": error_msg,
-                "order_id": order_id
-            }), 500
+            body, status_code, replayed = idempotency.run(
+                idempotency_key, order_id, lambda: accept_order(pedido_normalizado)
+            )
+        except IdempotencyInProgress as e:
+            g.order_log["outcome"] = "in_progress"
+            logger.info("⏳ %s", e)
+            return jsonify({"message": str(e), "order_id": order_id}), 409
+        
+        if replayed:
+            g.order_log["outcome"] = "replayed"
+            logger.info("♻️  Pedido #%s (ID: %s) já recebido com o mesmo conteúdo - resposta reaproveitada", order_code, order_id)
+        response = jsonify(body)
+        response.headers["Idempotent-Replayed"] = "true" if replayed else "false"
+        return response, status_code
     
     except Exception as e:
-        logger.error(f"❌ Erro crítico no webhook: {e}")
+        logger.error("❌ Erro crítico no webhook: %s", e)
         return jsonify({"error": "Erro interno ao processar webhook"}), 500
 
+# Resultado padrão da linha de resumo, pelo status HTTP da resposta
+ORDER_OUTCOMES = {200: "processed", 202: "enqueued"}
+
+@app.after_request
+def log_order_summary(response):
+    """Uma linha de resumo por pedido recebido (nível SUMMARY, mantido com LOG_LEVEL=QUIET)."""
+    order_log = g.pop("order_log", None)
+    if order_log is not None:
+        started = g.get("request_started")
+        duration_ms = round((time.perf_counter() - started) * 1000, 1) if started is not None else None
+        outcome = order_log.get("outcome") or ORDER_OUTCOMES.get(response.status_code, "error")
+        logger.log(
+            SUMMARY, "📦 Pedido #%s (ID: %s) %s - HTTP %s em %sms",
+            order_log["order_code"], order_log["order_id"], outcome, response.status_code, duration_ms,
+            extra={**order_log, "outcome": outcome, "status_code": response.status_code, "duration_ms": duration_ms}
+        )
+    return response
+
 # === MONITOR DE RASTREIO ===
-def tracking_worker():
+# Agenda adaptativa: cada pedido tem seu próprio next_check_at
+tracking_schedule = AdaptiveSchedule(
+    min_interval=TRACKER_INTERVAL,
+    max_interval=TRACKER_MAX_INTERVAL,
+    expected_transit_days=TRACKER_EXPECTED_TRANSIT_DAYS
+)
+
+# Limita concorrência e taxa por host (Frenet e Bagy) durante as varreduras
+tracking_throttle = HostThrottle(TRACKER_HOST_CONCURRENCY, TRACKER_RATE_LIMIT)
+
+def track_order(order_id: str, code: str) -> bool:
     """
-    Worker que monitora status de entrega dos pedidos.
+    Verifica um pedido e processa a mudança de rastreio, se houver. Retorna True se entregue.
     
-    IMPORTANTE: Este worker só funciona DEPOIS que você:
+    Erros da consulta são propagados para o motor (track_order_failed); com o circuito
+    aberto o pedido só é pulado, sem contar tentativa.
+    """
+    try:
+        with tracking_throttle.slot(FRENET_TRACK_URL):
+            observation = frenet_tracking_observation(code)
+    except CircuitOpenError as e:
+        logger.debug("⏭️  Rastreio %s não consultado: %s", code, e)
+        return False
+
+    result = db_apply_observations([(order_id, code, observation)])
+    if result["delivered"]:
+        # Entrega gravada junto com a transição na outbox; a Bagy é atualizada em background
+        fulfillment_dispatcher.notify()
+        logger.info("✅ Pedido %s marcado como entregue! (rastreio: %s)", order_id, code)
+        return True
+    if result["shipped"]:
+        fulfillment_dispatcher.notify()
+    logger.debug("Pedido %s ainda não entregue (rastreio: %s, status: %s)", order_id, code, observation.status)
+    return False
+
+def track_order_failed(order_id: str, code: str, error: Exception):
+    """Registra falha na verificação de um pedido."""
+    error_msg = str(error)
+    logger.error("❌ Erro ao verificar pedido %s: %s", order_id, error_msg)
+    db_save_many([(order_id, code, None, error_msg)])
+
+def track_batch(orders: List[Tuple[str, str]]) -> Tuple[int, int]:
+    """
+    Verifica um lote de pedidos com o mínimo de chamadas à API de rastreio.
+    
+    Só as respostas que mudaram desde a consulta anterior viram eventos e são
+    processadas; entregas e envios vão para a outbox da Bagy na mesma transação.
+    Consultas com erro gravam last_error e incrementam retry_count, como
+    track_order_failed (com o circuito aberto, só entram no total de erros).
+    Retorna (entregues, erros).
+    """
+    observations = frenet_track_many([code for _, code in orders])
+    found, failed, skipped = [], [], 0
+    for order_id, code in orders:
+        observation = observations.get(code)
+        if isinstance(observation, Observation):
+            found.append((order_id, code, observation))
+        elif isinstance(observation, CircuitOpenError):
+            skipped += 1
+        else:
+            failed.append((order_id, code, None, str(observation or "Rastreio não consultado")))
+    result = db_apply_observations(found)
+    if failed:
+        db_save_many(failed)
+        logger.error("❌ %s rastreios com erro no lote (ex.: %s: %s)", len(failed), failed[0][1], failed[0][3])
+    if result["delivered"] or result["shipped"]:
+        fulfillment_dispatcher.notify()
+    if result["delivered"]:
+        logger.info("✅ %s pedidos marcados como entregues (atualização da Bagy enfileirada)", result["delivered"])
+    return result["delivered"], len(failed) + skipped
+
+tracking_engine = TrackingEngine(track_order, on_error=track_order_failed, concurrency=TRACKER_CONCURRENCY)
+
+def tracking_sweep(should_continue=None):
+    """
+    Uma varredura do monitor de rastreio.
+    
+    IMPORTANTE: O rastreio só funciona DEPOIS que você:
     1. Gerar a etiqueta manualmente na Frenet
     2. Fazer a postagem física
     3. Adicionar o código de rastreio no banco de dados
     
-    O worker verifica periodicamente se o pedido foi entregue e atualiza a Bagy automaticamente.
+    Verifica se os pedidos foram entregues e atualiza a Bagy automaticamente.
+    Só são consultados os pedidos com next_check_at vencido (ver AdaptiveSchedule).
+    As verificações rodam em paralelo (TRACKER_CONCURRENCY) respeitando o limite de
+    requisições por host (TRACKER_HOST_CONCURRENCY / TRACKER_RATE_LIMIT).
+    A varredura para (entre lotes, ou antes do próximo pedido no modo um-a-um) se
+    should_continue() retornar False.
     """
-    logger.info(f"🔄 Iniciando monitor de rastreio (intervalo: {TRACKER_INTERVAL}s)")
-    logger.info(f"📋 Este worker aguarda você adicionar códigos de rastreio manualmente")
+    pending_orders = db_pending()
+    if not pending_orders:
+        logger.debug("💤 Nenhum pedido vencido para verificação")
+        return
     
+    logger.info("🔍 Verificando %s pedidos pendentes...", len(pending_orders))
+    if TRACKING_BATCH_SIZE > 0:
+        result = tracking_engine.sweep_batches(pending_orders, TRACKING_BATCH_SIZE, track_batch, should_continue)
+    else:
+        result = tracking_engine.sweep(pending_orders, should_continue)
+    if result.get("stopped"):
+        logger.warning("⚠️ Varredura interrompida (liderança perdida) após %s de %s pedidos", result["checked"], len(pending_orders))
+    logger.log(
+        SUMMARY,
+        "⏱️  Varredura concluída: %s pedidos em %ss (%s/s) - %s entregues, %s erros",
+        result["checked"], result["duration_seconds"], result["throughput_per_second"], result["delivered"], result["errors"]
+    )
+
+def sharded_tracking_sweep(should_continue=None) -> Dict[str, Any]:
+    """
+    Uma varredura no modo sharded: reserva lotes de pedidos vencidos (db_claim_pending)
+    até não sobrar nenhum livre. Cada processo executa a sua; os lotes não se repetem.
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    batch_size = TRACKING_BATCH_SIZE if TRACKING_BATCH_SIZE > 0 else 50
+    result = tracking_engine.sweep_claimed(
+        lambda: db_claim_pending(worker_id, batch_size, TRACKER_ROW_LEASE), track_batch, should_continue
+    )
+    if result["checked"]:
+        logger.log(
+            SUMMARY,
+            "⏱️  Varredura (sharded, %s) concluída: %s pedidos em %s lotes, %ss (%s/s) - %s entregues, %s erros",
+            worker_id, result["checked"], result["batches"], result["duration_seconds"],
+            result["throughput_per_second"], result["delivered"], result["errors"]
+        )
+    return result
+
+def sharded_tracking_worker():
+    """Loop do modo sharded: todos os processos com TRACKER_ENABLED varrem a cada TRACKER_INTERVAL."""
     while True:
         try:
-            pending_orders = db_pending()
-            
-            if pending_orders:
-                logger.info(f"🔍 Verificando {len(pending_orders)} pedidos pendentes...")
-            
-            for order_id, code in pending_orders:
-                try:
-                    if frenet_check_delivered(code):
-                        bagy_mark_delivered(order_id)
-                        db_save(order_id, code, status="delivered")
-                        logger.info(f"✅ Pedido {order_id} marcado como entregue! (rastreio: {code})")
-                    else:
-                        logger.debug(f"Pedido {order_id} ainda não entregue (rastreio: {code})")
-                except Exception as e:
-                    error_msg = str(e)
-                    logger.error(f"❌ Erro ao verificar pedido {order_id}: {error_msg}")
-                    db_save(order_id, code, error=error_msg)
-                
-                # Pequeno delay entre verificações
-                time.sleep(2)
-        
+            sharded_tracking_sweep()
         except Exception as e:
-            logger.error(f"❌ Erro no worker de rastreio: {e}")
-        
-        logger.debug(f"💤 Aguardando {TRACKER_INTERVAL}s para próxima verificação...")
+            logger.error("❌ Erro no worker de rastreio (sharded): %s", e)
         time.sleep(TRACKER_INTERVAL)
 
+# Modo leader: um único monitor de rastreio entre todos os processos (workers do gunicorn, réplicas):
+# cada processo disputa o lease "tracker" no SQLite e só o líder executa as varreduras
+tracker_lease = LeaderLease(database, "tracker", ttl=TRACKER_LEASE_TTL)
+tracking_worker = LeaderWorker(tracker_lease, tracking_sweep, TRACKER_INTERVAL, name="TrackingWorker")
+
+def start_tracking_worker():
+    """Inicia o rastreio neste processo (se TRACKER_ENABLED): disputa da liderança ou modo sharded."""
+    if not TRACKER_ENABLED:
+        logger.info("⏸️  Rastreio desativado neste processo (TRACKER_ENABLED=false)")
+        return
+    if TRACKER_MODE == "sharded":
+        logger.info("🔄 Monitor de rastreio sharded (intervalo: %ss, reserva de %ss por lote)", TRACKER_INTERVAL, TRACKER_ROW_LEASE)
+        threading.Thread(target=sharded_tracking_worker, daemon=True, name="TrackingWorker").start()
+    else:
+        logger.info("🔄 Monitor de rastreio (intervalo: %ss, lease de %ss) aguardando liderança", TRACKER_INTERVAL, TRACKER_LEASE_TTL)
+        tracking_worker.start()
+        atexit.register(tracking_worker.stop)
+    logger.info("⚙️  Concorrência: %s threads | %s por host | %s req/s por host", TRACKER_CONCURRENCY, TRACKER_HOST_CONCURRENCY, TRACKER_RATE_LIMIT)
+    logger.info("📅 Agenda adaptativa: entre %ss e %ss por pedido (prazo típico: %s dias)", TRACKER_INTERVAL, TRACKER_MAX_INTERVAL, TRACKER_EXPECTED_TRANSIT_DAYS)
+
+# === ARQUIVAMENTO ===
+def archive_sweep(should_continue=None) -> Dict[str, int]:
+    """
+    Move pedidos entregues há mais de ARCHIVE_AFTER_DAYS e que falharam há mais de
+    ARCHIVE_ERROR_AFTER_DAYS (pela última atualização, updated_at) para o arquivo
+    morto, em lotes de ARCHIVE_BATCH_SIZE.
+    
+    Os contadores de /stats continuam incluindo os pedidos arquivados: o total
+    removido pelo trigger de DELETE é devolvido na mesma transação (menos as
+    cópias arquivadas substituídas, que já estavam contadas).
+    """
+    delivered_before = db_timestamp(-ARCHIVE_AFTER_DAYS * 86400)
+    error_before = db_timestamp(-ARCHIVE_ERROR_AFTER_DAYS * 86400)
+    archived: Dict[str, int] = {}
+    while should_continue is None or should_continue():
+        with database.transaction():
+            batch = order_archive.archive_batch(delivered_before, error_before, ARCHIVE_BATCH_SIZE)
+            restore = dict(batch["moved"])
+            for status, count in batch["replaced"].items():
+                restore[status] = restore.get(status, 0) - count
+            database.executemany(
+                "UPDATE order_status_counts SET total = total + ? WHERE status = ?",
+                [(count, status) for status, count in restore.items() if count]
+            )
+        for status, count in batch["moved"].items():
+            archived[status] = archived.get(status, 0) + count
+        if sum(batch["moved"].values()) < ARCHIVE_BATCH_SIZE:
+            break
+    if archived:
+        logger.log(SUMMARY, "🗄️  %s pedidos movidos para o arquivo morto: %s", sum(archived.values()), archived)
+    return archived
+
+# Um único processo arquiva por vez (lease "archive", mesmo mecanismo do rastreio)
+archive_worker = LeaderWorker(LeaderLease(database, "archive", ttl=TRACKER_LEASE_TTL), archive_sweep, ARCHIVE_INTERVAL, name="ArchiveWorker")
+
+# Um único processo sincroniza o catálogo por vez (lease "catalog")
+catalog_worker = LeaderWorker(LeaderLease(database, "catalog", ttl=TRACKER_LEASE_TTL), catalog_sweep, CATALOG_REFRESH_INTERVAL, name="CatalogWorker")
+
+def start_catalog_worker():
+    """Inicia a sincronização periódica do catálogo de produtos (se CATALOG_REFRESH_INTERVAL > 0)."""
+    if CATALOG_REFRESH_INTERVAL <= 0:
+        return
+    logger.info("📦 Catálogo de produtos sincronizado a cada %ss (%s produtos por página)", CATALOG_REFRESH_INTERVAL, CATALOG_PAGE_SIZE)
+    catalog_worker.start()
+    atexit.register(catalog_worker.stop)
+
+def start_archive_worker():
+    """Inicia o arquivamento periódico neste processo (se ARCHIVE_ENABLED)."""
+    if not ARCHIVE_ENABLED:
+        return
+    logger.info("🗄️  Arquivamento a cada %ss: entregues após %s dias, erros após %s dias → %s",
+                ARCHIVE_INTERVAL, ARCHIVE_AFTER_DAYS, ARCHIVE_ERROR_AFTER_DAYS, ARCHIVE_DB_PATH)
+    archive_worker.start()
+    atexit.register(archive_worker.stop)
+
+# === MÉTRICAS (/metrics) ===
+# Snapshots por worker no SQLite, somados na leitura (funciona com vários workers do gunicorn)
+metrics_store = MetricsStore(database, flush_interval=METRICS_FLUSH_INTERVAL)
+
+REQUEST_SECONDS = metrics.histogram(
+    "bagy_frenet_http_request_duration_seconds",
+    "Duração das requisições recebidas por rota, método e status",
+    ["endpoint", "method", "status"],
+)
+
+@app.before_request
+def metrics_request_started():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def metrics_request_finished(response):
+    started = g.get("request_started")
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.labels(endpoint, request.method, response.status_code).observe(time.perf_counter() - started)
+    return response
+
+def metrics_gauges():
+    """Profundidade das filas e pedidos por status (globais: lidos do banco na hora da coleta)."""
+    depth = {("webhook_jobs", status): count for status, count in webhook_queue.stats().items()}
+    depth.update({("fulfillment_outbox", status): count for status, count in fulfillment_outbox.stats().items()})
+    orders = {(status,): count for status, count in db_stats().items() if status != "total"}
+    return [
+        ("bagy_frenet_queue_depth", "Itens nas filas por status", ("queue", "status"), depth),
+        ("bagy_frenet_orders", "Pedidos por status", ("status",), orders),
+    ]
+
+metrics.REGISTRY.register_collector(metrics_gauges)
+
+_background_started = False
+_background_lock = threading.Lock()
+
+def start_background_workers():
+    """Inicia os dispatchers da fila de webhooks e da outbox de fulfillment, a gravação das métricas, o rastreio, o arquivamento e o catálogo de produtos (uma vez por processo)."""
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+    ensure_listener()
+    if WEBHOOK_ASYNC:
+        webhook_dispatcher.start()
+    fulfillment_dispatcher.start()
+    metrics_store.start()
+    start_tracking_worker()
+    start_archive_worker()
+    start_catalog_worker()
+
 # === ENDPOINTS DE STATUS ===
 @app.route("/", methods=["GET"])
 def status():
@@ -775,16 +1632,111 @@ def health():
             },
             "database": {
                 "path": DB_PATH,
-                "stats": stats
+                "stats": stats,
+                "throughput": db_throughput(),
+                "slowest_queries": database.query_stats(limit=10)
+            },
+            "tracker": {
+                **tracking_engine.status(),
+                "mode": TRACKER_MODE,
+                "leader": tracking_worker.status(),
+                "events": tracking_event_log.stats()
+            },
+            "queue": {
+                "async": WEBHOOK_ASYNC,
+                "workers": QUEUE_WORKERS,
+                "jobs": webhook_queue.stats()
+            },
+            "resilience": resilience_status(RESILIENCE_POLICIES),
+            "fulfillment": fulfillment_dispatcher.status(),
+            "archive": {
+                "enabled": ARCHIVE_ENABLED,
+                "path": ARCHIVE_DB_PATH,
+                "after_days": {"delivered": ARCHIVE_AFTER_DAYS, "error": ARCHIVE_ERROR_AFTER_DAYS},
+                **({"orders": order_archive.stats(), "leader": archive_worker.status()} if order_archive else {})
+            },
+            "idempotency": idempotency.stats(),
+            "quote": quote_engine.stats(),
+            "catalog": {
+                **product_catalog.stats(),
+                "refresh_interval": CATALOG_REFRESH_INTERVAL,
+                "leader": catalog_worker.status()
+            },
+            "bagy_orders_cache": bagy_order_cache.stats(),
+            "metrics": {"processes": metrics_store.processes(), "flush_interval": METRICS_FLUSH_INTERVAL},
+            "http": {
+                "bagy": bagy_http.stats(),
+                "frenet": frenet_http.stats()
             }
         }), 200
     except Exception as e:
-        logger.error(f"❌ Erro no health check: {e}")
+        logger.error("❌ Erro no health check: %s", e)
         return jsonify({
             "status": "unhealthy",
             "error": str(e)
         }), 500
 
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Métricas de todos os workers no formato de exposição do Prometheus."""
+    try:
+        return Response(metrics_store.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+    except Exception as e:
+        logger.error("❌ Erro ao gerar métricas: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/quote", methods=["GET", "POST"])
+def quote():
+    """
+    Cotação de frete para o checkout.
+    
+    Parâmetros (query ou JSON): cep, weight (kg), height/width/length (cm, padrão:
+    pacote fixo do envio). No JSON, `items` ([{"sku", "quantity", "weight" (g)}])
+    substitui peso e dimensões pelo pacote calculado com o catálogo de produtos.
+    Faixas já cotadas são respondidas do cache.
+    """
+    params = (request.get_json(silent=True) or {}) if request.method == "POST" else request.args
+    package = None
+    try:
+        if not params.get("cep"):
+            raise ValueError("Parâmetro cep é obrigatório")
+        cep = clean_cep(params["cep"])
+        if request.method == "POST" and params.get("items"):
+            if not isinstance(params["items"], list) or not all(isinstance(item, dict) for item in params["items"]):
+                raise ValueError("Parâmetro items deve ser uma lista de objetos")
+            package = order_package(params["items"])
+            weight, dimensions = package.weight_kg, package.dimensions
+        else:
+            weight = float(params.get("weight", 0))
+            dimensions = (
+                float(params.get("height", PACKAGE_HEIGHT)),
+                float(params.get("width", PACKAGE_WIDTH)),
+                float(params.get("length", PACKAGE_LENGTH)),
+            )
+        if weight <= 0:
+            raise ValueError("Parâmetro weight (kg) deve ser maior que zero")
+        if min(dimensions) <= 0:
+            raise ValueError("Dimensões (cm) devem ser maiores que zero")
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    # Fora do bloco de validação: resposta inválida da Frenet (JSON, preço) não é erro do cliente
+    try:
+        result = quote_engine.quote(cep, weight, dimensions)
+    except Exception as e:
+        logger.error("❌ Erro na cotação para o CEP %s: %s", cep, e)
+        return jsonify({
+            "error": "Cotação indisponível",
+            "detail": str(e),
+            "fallback": {"carrier": FORCE_CARRIER_NAME, "price": FORCE_VALUE}
+        }), 503
+    return jsonify({
+        "cep": cep,
+        "weight": weight,
+        "dimensions": {"height": dimensions[0], "width": dimensions[1], "length": dimensions[2]},
+        **({"package": package._asdict()} if package else {}),
+        **result
+    }), 200
+
 @app.route("/stats", methods=["GET"])
 def stats_endpoint():
     """Endpoint para visualizar estatísticas."""
@@ -792,304 +1744,202 @@ def stats_endpoint():
         stats = db_stats()
         return jsonify({
             "statistics": stats,
+            "throughput": db_throughput(),
             "timestamp": datetime.datetime.now().isoformat()
         }), 200
     except Exception as e:
-        logger.error(f"❌ Erro ao obter estatísticas: {e}")
+        logger.error("❌ Erro ao obter estatísticas: %s", e)
         return jsonify({"error": str(e)}), 500
 
+def parse_date_arg(value: Optional[str], end_of_day: bool = False) -> Optional[str]:
+    """Aceita 'AAAA-MM-DD' ou 'AAAA-MM-DD HH:MM:SS' e devolve no formato do banco."""
+    if not value:
+        return None
+    value = value.replace("T", " ")
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            parsed = datetime.datetime.strptime(value, fmt)
+            break
+        except ValueError:
+            continue
+    else:
+        raise ValueError(f"Data inválida: {value}")
+    if fmt == "%Y-%m-%d" and end_of_day:
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+# === PAINEL DE PEDIDOS ===
+ORDER_STATUS_FILTERS = (
+    ("pending", "⏳ Pendentes"),
+    ("shipped", "📮 Enviados"),
+    ("delivered", "✅ Entregues"),
+    ("error", "❌ Erros"),
+    ("all", "📋 Todos"),
+)
+ORDER_STATUS_LABELS = {
+    "pending": "⏳ Aguardando",
+    "shipped": "📮 Enviado",
+    "delivered": "✅ Entregue",
+    "error": "❌ Erro",
+}
+
+def assets_version() -> str:
+    """Hash do template e do CSS do painel: muda o ETag e a URL do CSS a cada deploy que os altera."""
+    digest = hashlib.sha1()
+    for folder, name in ((app.template_folder, "orders.html"), (app.static_folder, "orders.css")):
+        try:
+            with open(os.path.join(app.root_path, folder, name), "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            pass
+    return digest.hexdigest()[:12]
+
+STATIC_VERSION = assets_version()
+
+def orders_etag(args, rows: List[Dict[str, Any]], next_cursor: Optional[str]) -> str:
+    """ETag da listagem: parâmetros da requisição, conteúdo das linhas e versão dos arquivos do painel."""
+    digest = hashlib.sha1(STATIC_VERSION.encode())
+    digest.update(repr(sorted(args.items(multi=True))).encode())
+    digest.update(repr(next_cursor).encode())
+    for row in rows:
+        digest.update(repr(tuple(row.values())).encode())
+    return digest.hexdigest()
+
+@app.route("/orders/<order_id>/tracking", methods=["GET"])
+def order_tracking(order_id: str):
+    """Mudanças de rastreio registradas para um pedido (mais recentes primeiro)."""
+    try:
+        limit = min(max(int(request.args.get("limit", 50)), 1), 500)
+    except ValueError:
+        return jsonify({"error": "Parâmetro limit inválido"}), 400
+    columns = "tracking_code, status, last_carrier_status, last_checked_at, next_check_at"
+    row = database.fetchone(f"SELECT {columns} FROM orders WHERE bagy_order_id = ?", (order_id,))
+    if not row and order_archive:
+        row = database.fetchone(f"SELECT {columns} FROM {order_archive.table} WHERE bagy_order_id = ?", (order_id,))
+    if not row:
+        return jsonify({"error": "Pedido não encontrado", "order_id": order_id}), 404
+    tracking_code, status, carrier_status, last_checked_at, next_check_at = row
+    return jsonify({
+        "order_id": order_id,
+        "tracking_code": tracking_code,
+        "status": status,
+        "carrier_status": carrier_status,
+        "last_checked_at": last_checked_at,
+        "next_check_at": next_check_at,
+        "events": tracking_event_log.history(order_id, limit)
+    }), 200
+
 @app.route("/orders", methods=["GET"])
 def orders_list():
-    """Endpoint para visualizar pedidos salvos."""
-    import json
+    """
+    Endpoint para visualizar pedidos salvos.
+    
+    Parâmetros: status (padrão: pending; 'all' para todos), limit (até 500), cursor
+    (next_cursor da página anterior), fields (lista de colunas ou 'summary'),
+    from/to (data de criação), state, city e has_tracking (true/false).
+    """
     try:
         status_filter = request.args.get("status", "pending")
         
-        with sqlite3.connect(DB_PATH) as con:
-            con.row_factory = sqlite3.Row
-            query = """
-                SELECT * FROM orders 
-                WHERE status = ? OR ? = 'all'
-                ORDER BY created_at DESC
-                LIMIT 100
-            """
-            cur = con.execute(query, (status_filter, status_filter))
-            rows = cur.fetchall()
+        try:
+            limit = min(max(int(request.args.get("limit", 100)), 1), 500)
+            fields_arg = request.args.get("fields")
+            if fields_arg == "summary":
+                fields = list(ORDER_SUMMARY_FIELDS)
+            elif fields_arg:
+                fields = [f.strip() for f in fields_arg.split(",") if f.strip()]
+            else:
+                fields = None
+            want_parsed = "parsed_data" in (fields or ["parsed_data"])
+            if fields and want_parsed:
+                fields = [f for f in fields if f != "parsed_data"] + ["order_data_json"]
+            has_tracking_arg = request.args.get("has_tracking")
+            has_tracking = None if has_tracking_arg is None else has_tracking_arg.lower() in ("1", "true", "yes")
             
-            orders = []
-            for row in rows:
-                order = dict(row)
+            rows, next_cursor = db_list_orders(
+                status=status_filter,
+                fields=fields,
+                limit=limit,
+                cursor=request.args.get("cursor"),
+                date_from=parse_date_arg(request.args.get("from")),
+                date_to=parse_date_arg(request.args.get("to"), end_of_day=True),
+                state=request.args.get("state"),
+                city=request.args.get("city"),
+                has_tracking=has_tracking
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        etag = orders_etag(request.args, rows, next_cursor)
+        if etag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+        
+        def iter_orders():
+            for order in rows:
                 # Parse JSON data if available
-                if order.get("order_data_json"):
+                if want_parsed and order.get("order_data_json"):
                     try:
                         order["parsed_data"] = json.loads(order["order_data_json"])
                     except:
                         order["parsed_data"] = None
-                orders.append(order)
+                yield order
         
-        # Formato HTML para visualização fácil
+        # Formato HTML para visualização fácil (template renderizado em streaming)
         if request.args.get("format") != "json":
-            html = """
-            <!DOCTYPE html>
-            <html lang="pt-BR">
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>Pedidos Bagy - Frenet</title>
-                <style>
-                    * { margin: 0; padding: 0; box-sizing: border-box; }
-                    body {
-                        font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-                        background: #f5f7fa;
-                        padding: 20px;
-                    }
-                    .container { max-width: 1400px; margin: 0 auto; }
-                    .header {
-                        background: white;
-                        padding: 30px;
-                        border-radius: 10px;
-                        margin-bottom: 20px;
-                        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                    }
-                    h1 { color: #2c3e50; margin-bottom: 10px; }
-                    .filters {
-                        display: flex;
-                        gap: 10px;
-                        margin-top: 20px;
-                    }
-                    .filter-btn {
-                        padding: 10px 20px;
-                        border: 2px solid #3498db;
-                        background: white;
-                        color: #3498db;
-                        border-radius: 5px;
-                        cursor: pointer;
-                        text-decoration: none;
-                        transition: all 0.3s;
-                    }
-                    .filter-btn:hover, .filter-btn.active {
-                        background: #3498db;
-                        color: white;
-                    }
-                    .order-card {
-                        background: white;
-                        padding: 25px;
-                        border-radius: 10px;
-                        margin-bottom: 15px;
-                        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                    }
-                    .order-header {
-                        display: flex;
-                        justify-content: space-between;
-                        align-items: center;
-                        margin-bottom: 20px;
-                        padding-bottom: 15px;
-                        border-bottom: 2px solid #ecf0f1;
-                    }
-                    .order-id {
-                        font-size: 20px;
-                        font-weight: bold;
-                        color: #2c3e50;
-                    }
-                    .status {
-                        padding: 8px 15px;
-                        border-radius: 20px;
-                        font-size: 14px;
-                        font-weight: 600;
-                    }
-                    .status-pending { background: #fff3cd; color: #856404; }
-                    .status-shipped { background: #d1ecf1; color: #0c5460; }
-                    .status-delivered { background: #d4edda; color: #155724; }
-                    .status-error { background: #f8d7da; color: #721c24; }
-                    .order-info {
-                        display: grid;
-                        grid-template-columns: repeat(auto-fit, minmax(300px, 1fr));
-                        gap: 20px;
-                    }
-                    .info-section {
-                        padding: 15px;
-                        background: #f8f9fa;
-                        border-radius: 8px;
-                    }
-                    .info-title {
-                        font-weight: 600;
-                        color: #495057;
-                        margin-bottom: 10px;
-                        font-size: 14px;
-                        text-transform: uppercase;
-                    }
-                    .info-content {
-                        color: #212529;
-                        line-height: 1.6;
-                    }
-                    .info-content strong {
-                        display: inline-block;
-                        width: 100px;
-                        color: #6c757d;
-                    }
-                    .copy-btn {
-                        background: #28a745;
-                        color: white;
-                        border: none;
-                        padding: 10px 20px;
-                        border-radius: 5px;
-                        cursor: pointer;
-                        margin-top: 10px;
-                    }
-                    .copy-btn:hover { background: #218838; }
-                    .empty-state {
-                        text-align: center;
-                        padding: 60px 20px;
-                        background: white;
-                        border-radius: 10px;
-                        color: #6c757d;
-                    }
-                    .empty-state i { font-size: 64px; margin-bottom: 20px; }
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>📦 Pedidos Bagy → Frenet</h1>
-                        <p style="color: #6c757d; margin-top: 10px;">
-                            Visualize e copie os dados dos pedidos para criar etiquetas na Frenet
-                        </p>
-                        <div class="filters">
-                            <a href="/orders?status=pending" class="filter-btn {pending_active}">⏳ Pendentes</a>
-                            <a href="/orders?status=shipped" class="filter-btn {shipped_active}">📮 Enviados</a>
-                            <a href="/orders?status=delivered" class="filter-btn {delivered_active}">✅ Entregues</a>
-                            <a href="/orders?status=error" class="filter-btn {error_active}">❌ Erros</a>
-                            <a href="/orders?status=all" class="filter-btn {all_active}">📋 Todos</a>
-                            <a href="/orders?status={status}&format=json" class="filter-btn">📄 JSON</a>
-                        </div>
-                    </div>
-            """.format(
-                pending_active="active" if status_filter == "pending" else "",
-                shipped_active="active" if status_filter == "shipped" else "",
-                delivered_active="active" if status_filter == "delivered" else "",
-                error_active="active" if status_filter == "error" else "",
-                all_active="active" if status_filter == "all" else "",
-                status=status_filter
+            next_url = None
+            if next_cursor:
+                next_url = "/orders?" + urlencode({**request.args.to_dict(), "cursor": next_cursor})
+            body = stream_template(
+                "orders.html",
+                orders=iter_orders(),
+                status_filter=status_filter,
+                status_filters=ORDER_STATUS_FILTERS,
+                status_labels=ORDER_STATUS_LABELS,
+                next_url=next_url,
+                static_version=STATIC_VERSION
             )
-            
-            if not orders:
-                html += """
-                    <div class="empty-state">
-                        <div style="font-size: 64px; margin-bottom: 20px;">📭</div>
-                        <h2>Nenhum pedido encontrado</h2>
-                        <p style="margin-top: 10px;">
-                            Os pedidos aparecerão aqui quando forem faturados no Bagy
-                        </p>
-                    </div>
-                """
-            else:
-                for order in orders:
-                    status_class = f"status-{order['status']}"
-                    status_text = {
-                        "pending": "⏳ Aguardando",
-                        "shipped": "📮 Enviado",
-                        "delivered": "✅ Entregue",
-                        "error": "❌ Erro"
-                    }.get(order["status"], order["status"])
-                    
-                    parsed = order.get("parsed_data", {})
-                    customer = parsed.get("customer", {}) if parsed else {}
-                    address = parsed.get("address", {}) if parsed else {}
-                    
-                    html += f"""
-                    <div class="order-card">
-                        <div class="order-header">
-                            <div>
-                                <div class="order-id">Pedido #{order.get('bagy_order_code', order['bagy_order_id'])}</div>
-                                <small style="color: #6c757d;">ID: {order['bagy_order_id']} | {order.get('created_at', 'N/A')}</small>
-                            </div>
-                            <span class="status {status_class}">{status_text}</span>
-                        </div>
-                        
-                        <div class="order-info">
-                            <div class="info-section">
-                                <div class="info-title">👤 Cliente</div>
-                                <div class="info-content">
-                                    <div><strong>Nome:</strong> {order.get('customer_name', customer.get('name', 'N/A'))}</div>
-                                    <div><strong>CPF:</strong> {order.get('customer_cpf', customer.get('cpf', 'N/A'))}</div>
-                                    <div><strong>Email:</strong> {order.get('customer_email', customer.get('email', 'N/A'))}</div>
-                                    <div><strong>Telefone:</strong> {order.get('customer_phone', customer.get('phone', 'N/A'))}</div>
-                                </div>
-                            </div>
-                            
-                            <div class="info-section">
-                                <div class="info-title">📍 Endereço de Entrega</div>
-                                <div class="info-content">
-                                    <div><strong>CEP:</strong> {order.get('address_zipcode', address.get('zipcode', 'N/A'))}</div>
-                                    <div><strong>Rua:</strong> {order.get('address_street', address.get('street', 'N/A'))}</div>
-                                    <div><strong>Número:</strong> {order.get('address_number', address.get('number', 'N/A'))}</div>
-                                    <div><strong>Complemento:</strong> {order.get('address_complement', address.get('complement', '-'))}</div>
-                                    <div><strong>Bairro:</strong> {order.get('address_neighborhood', address.get('neighborhood', 'N/A'))}</div>
-                                    <div><strong>Cidade:</strong> {order.get('address_city', address.get('city', 'N/A'))} - {order.get('address_state', address.get('state', 'N/A'))}</div>
-                                </div>
-                            </div>
-                            
-                            <div class="info-section">
-                                <div class="info-title">💰 Valores</div>
-                                <div class="info-content">
-                                    <div><strong>Total:</strong> R$ {order.get('total_value', 0):.2f}</div>
-                                    <div><strong>Frete:</strong> R$ {order.get('shipping_cost', 0):.2f}</div>
-                                    {f'<div><strong>Rastreio:</strong> {order.get("tracking_code")}</div>' if order.get('tracking_code') else ''}
-                                </div>
-                                <button class="copy-btn" onclick="copyOrder('{order['bagy_order_id']}')">
-                                    📋 Copiar Dados
-                                </button>
-                            </div>
-                        </div>
-                        
-                        {f'<div style="margin-top: 15px; padding: 10px; background: #f8d7da; color: #721c24; border-radius: 5px;"><strong>Erro:</strong> {order.get("last_error")}</div>' if order.get('last_error') else ''}
-                    </div>
-                    """
-            
-            html += """
-                </div>
-                <script>
-                    function copyOrder(orderId) {
-                        // TODO: Implementar cópia para clipboard
-                        alert('Funcionalidade de cópia em desenvolvimento. Por enquanto, copie manualmente os dados.');
-                    }
-                </script>
-            </body>
-            </html>
-            """
-            return html
+            response = Response(body, mimetype="text/html")
+        else:
+            # Formato JSON, um pedido por vez
+            def iter_json():
+                yield '{"orders": ['
+                for i, order in enumerate(iter_orders()):
+                    yield ("," if i else "") + json.dumps(order, ensure_ascii=False, default=str)
+                yield '], "count": %d, "status_filter": %s, "limit": %d, "next_cursor": %s}' % (
+                    len(rows), json.dumps(status_filter), limit, json.dumps(next_cursor)
+                )
+            response = Response(stream_with_context(iter_json()), mimetype="application/json")
         
-        # Formato JSON
-        return jsonify({
-            "orders": orders,
-            "count": len(orders),
-            "status_filter": status_filter
-        }), 200
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
         
     except Exception as e:
-        logger.error(f"❌ Erro ao listar pedidos: {e}")
+        logger.error("❌ Erro ao listar pedidos: %s", e)
         return jsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
     logger.info("="*60)
     logger.info("🚀 INICIANDO WEBHOOK BAGY-FRENET")
     logger.info("="*60)
-    logger.info(f"🔧 Seller CEP: {SELLER_CEP}")
-    logger.info(f"💰 Valor fixo: R$ {FORCE_VALUE}")
-    logger.info(f"🚚 Transportadora: {FORCE_CARRIER_NAME} ({FORCE_CARRIER_CODE})")
-    logger.info(f"⏱️  Intervalo de rastreio: {TRACKER_INTERVAL}s")
-    logger.info(f"🔄 Tentativas máximas: {MAX_RETRIES}")
-    logger.info(f"💾 Banco de dados: {DB_PATH}")
+    logger.info("🔧 Seller CEP: %s", SELLER_CEP)
+    logger.info("💰 Valor fixo: R$ %s", FORCE_VALUE)
+    logger.info("🚚 Transportadora: %s (%s)", FORCE_CARRIER_NAME, FORCE_CARRIER_CODE)
+    logger.info("⏱️  Intervalo de rastreio: %ss", TRACKER_INTERVAL)
+    logger.info("🧵 Concorrência do rastreio: %s (%s req/s por host)", TRACKER_CONCURRENCY, TRACKER_RATE_LIMIT)
+    logger.info("🔄 Tentativas máximas: %s", MAX_RETRIES)
+    logger.info("💾 Banco de dados: %s", DB_PATH)
     logger.info("="*60)
     
-    # Iniciar worker de rastreio
-    tracking_thread = threading.Thread(target=tracking_worker, daemon=True, name="TrackingWorker")
-    tracking_thread.start()
-    logger.info("✅ Worker de rastreio iniciado")
+    # Iniciar dispatchers da fila de webhooks e o rastreio (com eleição de líder)
+    start_background_workers()
     
     # Iniciar servidor Flask
     port = int(os.getenv("PORT", 3000))
-    logger.info(f"🌐 Servidor Flask iniciando na porta {port}...")
+    logger.info("🌐 Servidor Flask iniciando na porta %s...", port)
     logger.info("="*60)
     
     app.run(host="0.0.0.0", port=port, debug=False)
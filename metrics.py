@@ -0,0 +1,394 @@
+"""
+Métricas no formato de exposição do Prometheus (endpoint /metrics).
+
+- Counter e Histogram com labels, registrados no REGISTRY do módulo; o caminho
+  quente só faz um incremento sob o lock da métrica (sem I/O)
+- MetricsStore agrega os processos do gunicorn: cada worker grava um snapshot
+  das suas métricas na tabela metrics_snapshots a cada `flush_interval` e o
+  /metrics soma os snapshots de todos os workers. Snapshots de workers que
+  pararam de atualizar são incorporados à linha 'retired', para que os
+  contadores não voltem para trás quando um worker é reiniciado. Um worker
+  só lento que teve a linha incorporada passa a gravar apenas o que mudou
+  desde então (sem contar duas vezes)
+- coletores (gauges) são calculados na hora da leitura, ex.: profundidade das
+  filas, que já é global porque vem do banco
+"""
+import bisect
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Latência de chamadas HTTP e queries (segundos)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Snapshot: {nome: {"type", "help", "labels", "buckets", "samples": {json(valores dos labels): valor}}}
+Snapshot = Dict[str, Dict[str, Any]]
+# Coletor: () -> [(nome, ajuda, nomes dos labels, {valores dos labels: valor})]
+GaugeFamily = Tuple[str, str, Sequence[str], Dict[Tuple[str, ...], float]]
+Collector = Callable[[], Iterable[GaugeFamily]]
+
+RETIRED = "retired"
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self, lock: threading.Lock):
+        self._lock = lock
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_buckets", "counts", "sum")
+
+    def __init__(self, lock: threading.Lock, buckets: Tuple[float, ...]):
+        self._lock = lock
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], Any] = {}
+
+    def labels(self, *values: Any):
+        """Série da combinação de labels (criada na primeira vez)."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: esperados labels {self.labelnames}, recebidos {key}")
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _export(self) -> Dict[str, Any]:
+        return {"type": self.type, "help": self.documentation, "labels": list(self.labelnames)}
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild(self._lock)
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _export(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = {json.dumps(key): child.value for key, child in self._children.items()}
+        return {**super()._export(), "samples": samples}
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self._lock, self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _export(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = {json.dumps(key): [*child.counts, child.sum] for key, child in self._children.items()}
+        return {**super()._export(), "buckets": list(self.buckets), "samples": samples}
+
+
+class Registry:
+    """Métricas do processo e coletores calculados na leitura."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Métrica {metric.name} já registrada com outro tipo ou labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def snapshot(self) -> Snapshot:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric._export() for metric in metrics}
+
+    def collect_gauges(self) -> List[GaugeFamily]:
+        with self._lock:
+            collectors = list(self._collectors)
+        families: List[GaugeFamily] = []
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                logger.error("❌ Erro no coletor de métricas %s: %s", getattr(collector, "__name__", collector), e)
+        return families
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.counter(name, documentation, labelnames)
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.histogram(name, documentation, labelnames, buckets)
+
+
+def merge_snapshots(snapshots: Iterable[Snapshot]) -> Snapshot:
+    """Soma snapshots de vários processos (séries com buckets diferentes do primeiro são ignoradas)."""
+    merged: Snapshot = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.get(name)
+            if target is None:
+                merged[name] = {**metric, "samples": {k: (list(v) if isinstance(v, list) else v)
+                                                      for k, v in metric["samples"].items()}}
+                continue
+            if target["type"] != metric["type"] or target.get("buckets") != metric.get("buckets"):
+                continue
+            for key, value in metric["samples"].items():
+                current = target["samples"].get(key)
+                if current is None:
+                    target["samples"][key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    target["samples"][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    target["samples"][key] = current + value
+    return merged
+
+
+def subtract_snapshots(current: Snapshot, baseline: Snapshot) -> Snapshot:
+    """Diferença current - baseline por série (séries que não existiam no baseline ficam inteiras)."""
+    delta: Snapshot = {}
+    for name, metric in current.items():
+        base = baseline.get(name)
+        if base is None or base["type"] != metric["type"] or base.get("buckets") != metric.get("buckets"):
+            delta[name] = metric
+            continue
+        samples = {}
+        for key, value in metric["samples"].items():
+            previous = base["samples"].get(key)
+            if previous is None:
+                samples[key] = value
+            elif isinstance(value, list):
+                samples[key] = [a - b for a, b in zip(value, previous)]
+            else:
+                samples[key] = value - previous
+        delta[name] = {**metric, "samples": samples}
+    return delta
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def render(snapshot: Snapshot, gauges: Iterable[GaugeFamily] = ()) -> str:
+    """Texto no formato de exposição do Prometheus (versão 0.0.4)."""
+    lines: List[str] = []
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric["labels"]
+        for key in sorted(metric["samples"]):
+            values = json.loads(key)
+            sample = metric["samples"][key]
+            if metric["type"] == "histogram":
+                cumulative = 0
+                for bound, count in zip(metric["buckets"], sample):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(names, values, ('le', _number(bound)))} {cumulative}")
+                cumulative += sample[len(metric["buckets"])]
+                lines.append(f"{name}_bucket{_labels(names, values, ('le', '+Inf'))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(names, values)} {_number(sample[-1])}")
+                lines.append(f"{name}_count{_labels(names, values)} {cumulative}")
+            else:
+                lines.append(f"{name}{_labels(names, values)} {_number(sample)}")
+    for name, documentation, names, samples in gauges:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+        for values, value in sorted(samples.items()):
+            lines.append(f"{name}{_labels(names, values)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsStore:
+    """Snapshots das métricas por processo no SQLite, somados na leitura do /metrics."""
+
+    def __init__(self, database, registry: Registry = REGISTRY, flush_interval: float = 5.0):
+        self.database = database
+        self.registry = registry
+        self.flush_interval = flush_interval
+        # Um processo que não grava há 3 intervalos é considerado encerrado
+        self.stale_after = max(flush_interval * 3, 15.0)
+        self.process_id = f"{socket.gethostname()}:{os.getpid()}:{time.time():.0f}"
+        self._pid = os.getpid()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        # Último snapshot gravado e a parte dele já incorporada a 'retired'
+        self._written: Optional[Snapshot] = None
+        self._baseline: Snapshot = {}
+        self.init()
+
+    def init(self):
+        """Cria a tabela de snapshots se necessário."""
+        self.database.execute("""
+        CREATE TABLE IF NOT EXISTS metrics_snapshots (
+            process TEXT PRIMARY KEY,
+            snapshot TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )""")
+
+    def _current_process(self) -> str:
+        # Após fork, o processo filho grava com a própria identificação
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.process_id = f"{socket.gethostname()}:{self._pid}:{time.time():.0f}"
+            self._written = None
+            self._baseline = {}
+        return self.process_id
+
+    def start(self):
+        """Grava o snapshot do processo a cada flush_interval (uma thread por processo)."""
+        if self._thread and self._pid == os.getpid():
+            return
+        self._current_process()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="MetricsFlush")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("❌ Erro ao gravar métricas do processo: %s", e)
+
+    def flush(self):
+        """
+        Grava o snapshot atual deste processo.
+
+        Se a linha do processo sumiu depois de uma gravação (incorporada a 'retired' por
+        ficar sem gravar por stale_after, ex.: banco travado), o que já foi gravado vira o
+        baseline e daqui em diante só a diferença é gravada.
+        """
+        with self._flush_lock:
+            process = self._current_process()
+            snapshot = self.registry.snapshot()
+            with self.database.transaction():
+                if self._written is not None and not self.database.fetchone(
+                    "SELECT 1 FROM metrics_snapshots WHERE process = ?", (process,)
+                ):
+                    logger.warning("📊 Métricas do processo %s já incorporadas a '%s': gravando só a diferença", process, RETIRED)
+                    self._baseline = self._written
+                self.database.execute("""
+                INSERT INTO metrics_snapshots(process, snapshot, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(process) DO UPDATE SET snapshot = excluded.snapshot, updated_at = excluded.updated_at
+                """, (process, json.dumps(subtract_snapshots(snapshot, self._baseline)), time.time()))
+            self._written = snapshot
+
+    def _retire_stale(self, now: float):
+        """Incorpora à linha 'retired' os snapshots de processos que pararam de gravar."""
+        with self.database.transaction():
+            stale = self.database.fetchall("""
+            DELETE FROM metrics_snapshots WHERE process != ? AND updated_at < ? RETURNING snapshot
+            """, (RETIRED, now - self.stale_after))
+            if not stale:
+                return
+            row = self.database.fetchone("SELECT snapshot FROM metrics_snapshots WHERE process = ?", (RETIRED,))
+            snapshots = [json.loads(row[0])] if row else []
+            retired = merge_snapshots(snapshots + [json.loads(snapshot) for (snapshot,) in stale])
+            self.database.execute("""
+            INSERT INTO metrics_snapshots(process, snapshot, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(process) DO UPDATE SET snapshot = excluded.snapshot, updated_at = excluded.updated_at
+            """, (RETIRED, json.dumps(retired), now))
+        logger.info("📊 Métricas de %s processos encerrados incorporadas", len(stale))
+
+    def collect(self) -> Snapshot:
+        """Métricas somadas de todos os processos."""
+        now = time.time()
+        self.flush()
+        self._retire_stale(now)
+        rows = self.database.fetchall("SELECT snapshot FROM metrics_snapshots")
+        return merge_snapshots(json.loads(snapshot) for (snapshot,) in rows)
+
+    def render(self) -> str:
+        return render(self.collect(), self.registry.collect_gauges())
+
+    def processes(self) -> int:
+        """Processos com snapshot recente (para o /health)."""
+        row = self.database.fetchone(
+            "SELECT COUNT(*) FROM metrics_snapshots WHERE process != ? AND updated_at >= ?",
+            (RETIRED, time.time() - self.stale_after),
+        )
+        return row[0] if row else 0
@@ -0,0 +1,277 @@
+"""
+Outbox de atualizações de fulfillment para a Bagy.
+
+O rastreio grava a transição (shipped/delivered) na tabela
+fulfillment_outbox na mesma transação que atualiza o pedido, e um
+dispatcher em background envia as transições à Bagy em paralelo.
+
+- uma linha por pedido: transições repetidas são ignoradas e uma transição
+  mais avançada (delivered) substitui a pendente (shipped); o item substituído
+  fica marcado em `shipped_pending` e o código de rastreio é enviado antes da entrega
+- itens reservados ficam invisíveis por `visibility_timeout` segundos; se o
+  processo morrer, voltam a ficar disponíveis após o restart
+- falhas são reprocessadas com backoff e, após `max_attempts`, o item vai
+  para a dead-letter (status 'dead')
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+from db import Database
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_SECONDS = metrics.histogram(
+    "bagy_frenet_fulfillment_delivery_duration_seconds",
+    "Duração dos envios de fulfillment à Bagy por transição e resultado (sent, retry, dead)",
+    ["transition", "outcome"],
+)
+
+# Ordem das transições: uma transição só substitui outra de ordem menor
+TRANSITION_RANK = {"shipped": 1, "delivered": 2}
+
+# send(item) - item contém order_id, transition, tracking_code e attempts
+SendFn = Callable[[Dict[str, Any]], None]
+# on_dead(item, exception) - chamado quando o item esgota as tentativas
+DeadFn = Callable[[Dict[str, Any], Exception], None]
+
+
+class FulfillmentOutbox:
+    """Tabela de transições pendentes por pedido, com reserva em lote, retry e dead-letter."""
+
+    def __init__(self, database: Database, visibility_timeout: int = 120, max_attempts: int = 8, retry_delay: int = 30):
+        self.database = database
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.init()
+
+    def init(self):
+        """Cria a tabela da outbox se necessário."""
+        with self.database.transaction():
+            self.database.execute("""
+            CREATE TABLE IF NOT EXISTS fulfillment_outbox (
+                order_id TEXT PRIMARY KEY,
+                transition TEXT NOT NULL,
+                rank INTEGER NOT NULL,
+                tracking_code TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                last_error TEXT,
+                shipped_pending INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )""")
+            existing = {row[1] for row in self.database.fetchall("PRAGMA table_info(fulfillment_outbox)")}
+            if "shipped_pending" not in existing:
+                self.database.execute("ALTER TABLE fulfillment_outbox ADD COLUMN shipped_pending INTEGER NOT NULL DEFAULT 0")
+                logger.info("🛠️  Coluna fulfillment_outbox.shipped_pending adicionada")
+            self.database.execute("""
+            CREATE INDEX IF NOT EXISTS idx_outbox_available ON fulfillment_outbox(status, available_at)
+            """)
+
+    def enqueue_many(self, items: Iterable[Tuple[str, str, Optional[str]]]) -> int:
+        """
+        Registra transições (order_id, transition, tracking_code).
+
+        Participa da transação em andamento, se houver. Retorna quantas linhas
+        foram criadas ou avançadas (repetições não contam). Um 'shipped' ainda
+        não enviado que é substituído por 'delivered' continua devido
+        (`shipped_pending`): a Bagy só recebe o código de rastreio nesse PUT.
+        """
+        rows = []
+        now = time.time()
+        for order_id, transition, tracking_code in items:
+            if transition not in TRANSITION_RANK:
+                raise ValueError(f"Transição desconhecida: {transition}")
+            rows.append((order_id, transition, TRANSITION_RANK[transition], tracking_code, now))
+        if not rows:
+            return 0
+        with self.database.transaction() as con:
+            before = con.total_changes
+            self.database.executemany("""
+            INSERT INTO fulfillment_outbox(order_id, transition, rank, tracking_code, available_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(order_id) DO UPDATE SET
+                transition = excluded.transition,
+                rank = excluded.rank,
+                tracking_code = COALESCE(excluded.tracking_code, tracking_code),
+                status = 'pending',
+                attempts = 0,
+                available_at = excluded.available_at,
+                last_error = NULL,
+                shipped_pending = CASE WHEN fulfillment_outbox.transition = 'shipped' THEN 1 ELSE fulfillment_outbox.shipped_pending END,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE excluded.rank > fulfillment_outbox.rank
+               OR (excluded.rank = fulfillment_outbox.rank AND fulfillment_outbox.status = 'dead')
+            """, rows)
+            return con.total_changes - before
+
+    def enqueue(self, order_id: str, transition: str, tracking_code: Optional[str] = None) -> bool:
+        return self.enqueue_many([(order_id, transition, tracking_code)]) > 0
+
+    def claim(self, worker_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Reserva atomicamente até `limit` itens disponíveis (ou com visibilidade expirada)."""
+        now = time.time()
+        rows = self.database.fetchall("""
+        UPDATE fulfillment_outbox SET
+            status = 'sending',
+            attempts = attempts + 1,
+            available_at = ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE order_id IN (
+            SELECT order_id FROM fulfillment_outbox
+            WHERE status IN ('pending', 'sending') AND available_at <= ?
+            ORDER BY available_at
+            LIMIT ?
+        )
+        RETURNING order_id, transition, tracking_code, attempts, shipped_pending
+        """, (now + self.visibility_timeout, now, limit))
+        logger.debug("📦 %s reservou %s atualizações de fulfillment", worker_id, len(rows))
+        return [
+            {"order_id": order_id, "transition": transition, "tracking_code": tracking_code, "attempts": attempts,
+             "shipped_pending": bool(shipped_pending)}
+            for order_id, transition, tracking_code, attempts, shipped_pending in rows
+        ]
+
+    def complete(self, item: Dict[str, Any]):
+        """Remove o item enviado, a menos que uma transição mais nova tenha chegado durante o envio."""
+        with self.database.transaction():
+            self.database.execute(
+                "DELETE FROM fulfillment_outbox WHERE order_id = ? AND transition = ? AND status = 'sending'",
+                (item["order_id"], item["transition"]),
+            )
+            if item["transition"] == "shipped":
+                # 'delivered' chegou durante o envio: o shipped já foi aceito pela Bagy
+                self.shipped_sent(item["order_id"])
+
+    def shipped_sent(self, order_id: str):
+        """Marca como enviado o 'shipped' substituído por 'delivered' (não é reenviado nas próximas tentativas)."""
+        self.database.execute(
+            "UPDATE fulfillment_outbox SET shipped_pending = 0 WHERE order_id = ? AND shipped_pending = 1",
+            (order_id,),
+        )
+
+    def fail(self, item: Dict[str, Any], error: str) -> bool:
+        """Reagenda o item com backoff ou move para dead-letter. Retorna True se foi para dead-letter."""
+        dead = item["attempts"] >= self.max_attempts
+        delay = self.retry_delay * (2 ** min(item["attempts"] - 1, 10))
+        self.database.execute("""
+        UPDATE fulfillment_outbox SET
+            status = ?,
+            available_at = ?,
+            last_error = ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE order_id = ? AND transition = ? AND status = 'sending'
+        """, ("dead" if dead else "pending", time.time() + delay, error, item["order_id"], item["transition"]))
+        return dead
+
+    def stats(self) -> Dict[str, int]:
+        """Quantidade de itens por status."""
+        stats = {"pending": 0, "sending": 0, "dead": 0}
+        for status, count in self.database.fetchall("SELECT status, COUNT(*) FROM fulfillment_outbox GROUP BY status"):
+            stats[status] = count
+        return stats
+
+
+class OutboxDispatcher:
+    """Thread que drena a outbox em lotes, enviando cada lote em paralelo."""
+
+    def __init__(self, outbox: FulfillmentOutbox, send: SendFn, concurrency: int = 8, batch_size: int = 100,
+                 poll_interval: float = 2.0, on_dead: Optional[DeadFn] = None):
+        self.outbox = outbox
+        self.send = send
+        self.concurrency = max(1, int(concurrency))
+        self.batch_size = max(1, int(batch_size))
+        self.poll_interval = poll_interval
+        self.on_dead = on_dead
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+
+    def start(self):
+        if self._thread:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="OutboxDispatcher")
+        self._thread = threading.Thread(target=self._run, daemon=True, name="OutboxDispatcher")
+        self._thread.start()
+        logger.info("📤 Dispatcher de fulfillment iniciado (%s envios simultâneos)", self.concurrency)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def notify(self):
+        """Acorda o dispatcher após novas transições no mesmo processo."""
+        self._wakeup.set()
+
+    def drain_once(self) -> int:
+        """Reserva e envia um lote. Retorna quantos itens foram processados."""
+        items = self.outbox.claim(self._worker_id, self.batch_size)
+        if items:
+            executor = self._executor or ThreadPoolExecutor(max_workers=self.concurrency)
+            try:
+                list(executor.map(self._deliver, items))
+            finally:
+                if executor is not self._executor:
+                    executor.shutdown()
+        return len(items)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.drain_once()
+            except Exception as e:
+                logger.error("❌ Erro ao drenar outbox de fulfillment: %s", e)
+                processed = 0
+
+            if not processed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _deliver(self, item: Dict[str, Any]):
+        started = time.perf_counter()
+        try:
+            self.send(item)
+            self.outbox.complete(item)
+            self._count("sent")
+            DELIVERY_SECONDS.labels(item["transition"], "sent").observe(time.perf_counter() - started)
+        except Exception as e:
+            self._count("failed")
+            error_msg = str(e)
+            try:
+                dead = self.outbox.fail(item, error_msg)
+            except Exception as fail_error:
+                logger.error("❌ Erro ao reagendar fulfillment do pedido %s: %s", item["order_id"], fail_error)
+                return
+            DELIVERY_SECONDS.labels(item["transition"], "dead" if dead else "retry").observe(time.perf_counter() - started)
+            if dead:
+                logger.error("💀 Fulfillment '%s' do pedido %s movido para dead-letter após %s tentativas: %s", item["transition"], item["order_id"], item["attempts"], error_msg)
+                if self.on_dead:
+                    try:
+                        self.on_dead(item, e)
+                    except Exception as callback_error:
+                        logger.error("❌ Erro no tratamento do fulfillment do pedido %s em dead-letter: %s", item["order_id"], callback_error)
+            else:
+                logger.warning("⚠️  Fulfillment '%s' do pedido %s falhou (tentativa %s/%s): %s", item["transition"], item["order_id"], item["attempts"], self.outbox.max_attempts, error_msg)
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def status(self) -> Dict[str, Any]:
+        """Resumo para o endpoint /health."""
+        with self._lock:
+            counters = {"sent": self.sent, "failed": self.failed}
+        return {**counters, "concurrency": self.concurrency, "items": self.outbox.stats()}
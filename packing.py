@@ -0,0 +1,223 @@
+"""
+Peso, dimensões e cubagem do pacote a partir dos itens do pedido.
+
+O catálogo local de SKUs (tabela product_catalog) guarda peso e dimensões
+de cada produto e variação da Bagy, atualizado em lote pela listagem de
+produtos; o cálculo nunca faz uma chamada à API por item. Itens fora do
+catálogo usam o peso informado no pedido e não entram no volume.
+
+Montagem da caixa: comprimento e largura são os maiores lados dos itens,
+a altura cresce até caber o volume somado (quantidade × dimensões), com os
+mínimos aceitos pelas transportadoras. Sem nenhum item com dimensões, vale o
+pacote fixo (DEFAULT_PACKAGE). O peso é o real, arredondado ao grama: a
+Frenet recebe as dimensões e cada transportadora aplica a própria cubagem.
+"""
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from db import Database
+
+logger = logging.getLogger(__name__)
+
+# Pacote fixo (altura, largura, comprimento em cm), usado quando nenhum item tem dimensões
+DEFAULT_PACKAGE = (10, 15, 20)
+# Dimensões mínimas aceitas pelas transportadoras (altura, largura, comprimento em cm)
+MIN_DIMENSIONS = (2, 11, 16)
+DEFAULT_ITEM_WEIGHT_GRAMS = 500
+MIN_WEIGHT_GRAMS = 100
+
+
+class ProductDimensions(NamedTuple):
+    """Peso (g) e dimensões (cm) de um SKU; dimensões 0 = desconhecidas."""
+
+    weight_grams: float
+    height: float
+    width: float
+    length: float
+
+
+class Package(NamedTuple):
+    """Pacote calculado para um pedido."""
+
+    weight_kg: float
+    height: int
+    width: int
+    length: int
+    cubage_cm3: int
+    estimated: bool  # algum item sem dimensões no catálogo (ou pacote fixo)
+
+    @property
+    def dimensions(self) -> Tuple[int, int, int]:
+        return self.height, self.width, self.length
+
+
+CatalogLookup = Callable[[str], Optional[ProductDimensions]]
+
+
+def _number(value: Any) -> float:
+    try:
+        return max(float(value or 0), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def item_lines(items: Iterable[Dict[str, Any]], lookup: Optional[CatalogLookup] = None) -> List[Tuple[float, float, float, float, float, bool]]:
+    """
+    Linhas (quantidade, peso g, maior lado, lado do meio, menor lado, com dimensões) dos itens.
+
+    O catálogo tem prioridade sobre o peso informado no pedido.
+    """
+    lines = []
+    for item in items:
+        quantity = max(_number(item.get("quantity", 1)), 1.0)
+        product = lookup(item["sku"]) if lookup and item.get("sku") else None
+        if product is not None:
+            weight = product.weight_grams or _number(item.get("weight")) or DEFAULT_ITEM_WEIGHT_GRAMS
+            sides = sorted((product.height, product.width, product.length), reverse=True)
+        else:
+            weight = _number(item.get("weight", DEFAULT_ITEM_WEIGHT_GRAMS))
+            sides = [0.0, 0.0, 0.0]
+        lines.append((quantity, weight, sides[0], sides[1], sides[2], sides[2] > 0))
+    return lines
+
+
+def _package(weight_grams: float, longest: float, middle: float, shortest: float, volume: float,
+             any_known: bool, all_known: bool) -> Package:
+    if any_known:
+        length = max(math.ceil(longest), MIN_DIMENSIONS[2])
+        width = max(math.ceil(middle), MIN_DIMENSIONS[1])
+        height = max(math.ceil(max(shortest, volume / (length * width))), MIN_DIMENSIONS[0])
+    else:
+        height, width, length = DEFAULT_PACKAGE
+    weight_kg = max(round(weight_grams), MIN_WEIGHT_GRAMS) / 1000
+    return Package(weight_kg, height, width, length, height * width * length, not all_known)
+
+
+def pack_items(items: Sequence[Dict[str, Any]], lookup: Optional[CatalogLookup] = None) -> Package:
+    """Pacote de um pedido (itens no formato de build_order_data, peso em gramas)."""
+    lines = item_lines(items, lookup)
+    known = [line for line in lines if line[5]]
+    return _package(
+        sum(quantity * weight for quantity, weight, *_ in lines),
+        max((line[2] for line in known), default=0.0),
+        max((line[3] for line in known), default=0.0),
+        max((line[4] for line in known), default=0.0),
+        sum(line[0] * line[2] * line[3] * line[4] for line in known),
+        bool(known),
+        bool(lines) and len(known) == len(lines),
+    )
+
+
+def products_from_response(data: Any) -> List[Tuple[str, ProductDimensions]]:
+    """
+    SKUs de uma página da listagem de produtos da Bagy (produtos e variações).
+
+    Peso em kg e dimensões em cm (depth = comprimento); variações sem medidas herdam as do produto.
+    """
+    if isinstance(data, dict):
+        data = data.get("data") or data.get("products") or []
+    products = []
+    for product in data if isinstance(data, list) else []:
+        base = ProductDimensions(
+            _number(product.get("weight")) * 1000,
+            _number(product.get("height")),
+            _number(product.get("width")),
+            _number(product.get("depth") or product.get("length")),
+        )
+        if product.get("sku"):
+            products.append((str(product["sku"]), base))
+        for variation in product.get("variations") or []:
+            if not variation.get("sku"):
+                continue
+            products.append((str(variation["sku"]), ProductDimensions(
+                _number(variation.get("weight")) * 1000 or base.weight_grams,
+                _number(variation.get("height")) or base.height,
+                _number(variation.get("width")) or base.width,
+                _number(variation.get("depth") or variation.get("length")) or base.length,
+            )))
+    return products
+
+
+class ProductCatalog:
+    """Peso e dimensões por SKU na tabela product_catalog, com cópia em memória recarregada a cada `ttl` segundos."""
+
+    def __init__(self, database: Database, ttl: float = 300):
+        self.database = database
+        self.ttl = ttl
+        self._products: Dict[str, ProductDimensions] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.last_refresh: Optional[Dict[str, Any]] = None
+        self.init()
+
+    def init(self):
+        """Cria a tabela do catálogo se necessário."""
+        self.database.execute("""
+        CREATE TABLE IF NOT EXISTS product_catalog (
+            sku TEXT PRIMARY KEY,
+            weight_grams REAL NOT NULL,
+            height REAL NOT NULL,
+            width REAL NOT NULL,
+            length REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )""")
+
+    def get(self, sku: str) -> Optional[ProductDimensions]:
+        """Medidas do SKU (None se não estiver no catálogo)."""
+        if time.monotonic() - self._loaded_at > self.ttl:
+            self.reload()
+        return self._products.get(sku)
+
+    def reload(self):
+        """Recarrega a cópia em memória a partir da tabela (uma query para o catálogo inteiro)."""
+        with self._lock:
+            rows = self.database.fetchall("SELECT sku, weight_grams, height, width, length FROM product_catalog")
+            self._products = {sku: ProductDimensions(*dims) for sku, *dims in rows}
+            self._loaded_at = time.monotonic()
+
+    def upsert_many(self, products: Iterable[Tuple[str, ProductDimensions]]) -> int:
+        """Grava ou atualiza SKUs; participa da transação em andamento, se houver."""
+        now = time.time()
+        rows = [(sku, *dims, now) for sku, dims in products]
+        if rows:
+            self.database.executemany("""
+            INSERT INTO product_catalog(sku, weight_grams, height, width, length, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(sku) DO UPDATE SET
+                weight_grams = excluded.weight_grams, height = excluded.height, width = excluded.width,
+                length = excluded.length, updated_at = excluded.updated_at
+            """, rows)
+        return len(rows)
+
+    def refresh(self, fetch_page: Callable[[int], Any], page_size: int, should_continue=None) -> Dict[str, Any]:
+        """
+        Atualiza o catálogo página a página (fetch_page(página) → resposta da listagem de produtos).
+
+        Para na primeira página com menos de `page_size` produtos ou se should_continue() retornar False.
+        """
+        started = time.perf_counter()
+        pages = skus = 0
+        page = 1
+        while should_continue is None or should_continue():
+            data = fetch_page(page)
+            raw = (data.get("data") or data.get("products") or []) if isinstance(data, dict) else (data or [])
+            skus += self.upsert_many(products_from_response(raw))
+            pages += 1
+            if len(raw) < page_size:
+                break
+            page += 1
+        self.reload()
+        self.last_refresh = {
+            "at": time.time(),
+            "pages": pages,
+            "skus": skus,
+            "duration_seconds": round(time.perf_counter() - started, 3),
+        }
+        return self.last_refresh
+
+    def stats(self) -> Dict[str, Any]:
+        """Resumo para o endpoint /health."""
+        return {"skus": len(self._products), "last_refresh": self.last_refresh}
@@ -0,0 +1,156 @@
+"""
+Normalização de pedidos da Bagy e montagem do payload da Frenet Shipments.
+
+Usado tanto no envio à Frenet quanto no fallback local, para que os dois
+caminhos gravem os mesmos dados. Cada pedido é lido uma vez (build_order_data)
+e o payload é montado a partir dos dados já limpos; os logs usam argumentos
+preguiçosos, formatados só quando o nível está habilitado.
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+from packing import DEFAULT_PACKAGE, Package, pack_items
+
+logger = logging.getLogger(__name__)
+
+# Usado quando o pedido não traz itens (mesmo formato de build_order_data, peso em gramas)
+DEFAULT_ITEMS: List[Dict[str, Any]] = [{"sku": None, "name": "Produto", "quantity": 1, "weight": 1, "price": 0}]
+
+# Dimensões do pacote quando nenhum item tem medidas no catálogo (cm)
+PACKAGE_HEIGHT, PACKAGE_WIDTH, PACKAGE_LENGTH = DEFAULT_PACKAGE
+
+
+# Limpeza dos campos: para strings curtas como CEP e telefone, replace() encadeado
+# é mais rápido que str.translate (que resolve cada caractere pela tabela)
+def clean_zipcode(value: Any) -> str:
+    return (value or "").replace("-", "").replace(".", "").strip()
+
+
+def clean_phone(value: Any) -> str:
+    return (value or "").replace("(", "").replace(")", "").replace("-", "").replace(" ", "").strip()
+
+
+def clean_document(value: Any) -> str:
+    return (value or "").replace(".", "").replace("-", "").strip()
+
+
+def normalize_order_data(pedido: Dict[str, Any]) -> Dict[str, Any]:
+    """Normaliza dados do pedido - suporta formato direto e formato com 'event'/'data'."""
+    # Se o webhook vier com estrutura {"event": "...", "data": {...}}
+    if "event" in pedido and "data" in pedido:
+        logger.info("📦 Formato webhook com event: %s", pedido.get("event"))
+        return pedido["data"]
+
+    # Formato direto (pedido completo no root)
+    return pedido
+
+
+def build_order_data(pedido: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extrai do pedido da Bagy os dados gravados no banco (cliente, endereço, itens e valores).
+
+    CEP, telefone e CPF/documento já saem sem pontuação.
+    """
+    cust = pedido.get("customer") or {}
+    addr = pedido.get("address") or pedido.get("shipping_address") or {}
+    items = pedido.get("items") or []
+
+    invoice_value = float(pedido.get("total", 0)) or sum(
+        float(it.get("price", 0)) * int(it.get("quantity", 1)) for it in items
+    )
+
+    return {
+        "order_id": pedido.get("id"),
+        "order_code": pedido.get("code"),
+        "customer": {
+            "name": cust.get("name", ""),
+            "cpf": clean_document(cust.get("cpf") or cust.get("document")),
+            "email": cust.get("email", ""),
+            "phone": clean_phone(cust.get("phone")),
+        },
+        "address": {
+            "zipcode": clean_zipcode(addr.get("zipcode")),
+            "street": addr.get("street", addr.get("address", "")),
+            "number": addr.get("number", "S/N"),
+            "complement": addr.get("complement", ""),
+            "neighborhood": addr.get("district", addr.get("neighborhood", "")),
+            "city": addr.get("city", ""),
+            "state": addr.get("state", ""),
+        },
+        "items": [
+            {
+                "sku": it.get("sku"),
+                "name": it.get("name", "Produto"),
+                "quantity": it.get("quantity", 1),
+                "weight": it.get("weight", 500),
+                "price": it.get("price", 0),
+            }
+            for it in items
+        ],
+        "total_value": invoice_value,
+        "shipping_cost": float(pedido.get("shipping_cost", 0)),
+    }
+
+
+def order_from_data(order_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Pedido no formato da Bagy a partir de build_order_data() (reenvio de um pedido salvo no banco).
+
+    build_order_data(order_from_data(dados)) devolve os mesmos campos de `dados`. Frete 0
+    não é repassado, para que o envio use o valor padrão como na primeira tentativa.
+    """
+    return {
+        "id": order_data.get("order_id"),
+        "code": order_data.get("order_code"),
+        "customer": dict(order_data.get("customer") or {}),
+        "address": dict(order_data.get("address") or {}),
+        "items": list(order_data.get("items") or []),
+        "total": order_data.get("total_value", 0),
+        **({"shipping_cost": order_data["shipping_cost"]} if order_data.get("shipping_cost") else {}),
+    }
+
+
+def build_shipment_payload(order_data: Dict[str, Any], shipping_quote_value: float,
+                           package: Optional[Package] = None) -> Dict[str, Any]:
+    """
+    Payload da API Frenet Shipments a partir de build_order_data().
+
+    `package` vem de packing (com o catálogo de SKUs); sem ele, o peso é a soma de
+    quantidade × peso dos itens e as dimensões são as do pacote fixo.
+    """
+    customer = order_data["customer"]
+    address = order_data["address"]
+    items = order_data["items"] or DEFAULT_ITEMS
+    package = package or pack_items(order_data["items"])
+
+    # Baseado na documentação: https://docs.frenet.com.br/docs/shipments-whitelabel
+    return {
+        "OrderNumber": str(order_data["order_code"]),
+        "RecipientDocument": customer["cpf"],
+        "RecipientName": customer["name"] or "Cliente",
+        "RecipientEmail": customer["email"],
+        "RecipientPhone": customer["phone"],
+        "RecipientZipCode": address["zipcode"],
+        "RecipientAddress": address["street"],
+        "RecipientAddressNumber": address["number"],
+        "RecipientAddressComplement": address["complement"],
+        "RecipientAddressDistrict": address["neighborhood"],
+        "RecipientCity": address["city"],
+        "RecipientState": address["state"],
+        "RecipientCountry": "BR",
+        "PackageHeight": package.height,
+        "PackageWidth": package.width,
+        "PackageLength": package.length,
+        "PackageWeight": package.weight_kg,
+        "InvoiceValue": order_data["total_value"],
+        "ShippingQuoteValue": shipping_quote_value,
+        "Items": [
+            {
+                "SKU": it["sku"] or f"ITEM-{idx}",
+                "Description": it["name"],
+                "Quantity": int(it["quantity"]),
+                "Price": float(it["price"]),
+            }
+            for idx, it in enumerate(items, 1)
+        ],
+    }
@@ -0,0 +1,216 @@
+"""
+Cotação de frete com cache por faixa de CEP.
+
+Cada cotação é identificada pela faixa de destino (prefixo do CEP), pela
+faixa de peso e pela classe de dimensões do pacote. Peso e dimensões são
+arredondados para cima até o limite da faixa, e é esse limite que vai para
+a Frenet: o preço cacheado vale para qualquer pacote da faixa sem cobrar
+menos que o frete real.
+
+- camada 1: TTLCache em memória (LRU), respostas em microssegundos
+- camada 2 (opcional): tabela shipping_quotes no SQLite, compartilhada
+  entre workers e preservada em restarts
+- consultas simultâneas da mesma chave fazem uma única chamada (SingleFlight)
+- se a Frenet falhar, uma cotação vencida há menos de `stale_ttl` segundos
+  ainda é servida (marcada como `stale`)
+"""
+import json
+import logging
+import math
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import metrics
+from cache import SingleFlight, TTLCache
+from db import Database
+
+logger = logging.getLogger(__name__)
+
+QUOTE_REQUESTS = metrics.counter(
+    "bagy_frenet_quote_requests_total",
+    "Cotações de frete por origem da resposta (memory, database, api, stale, error)",
+    ["source"],
+)
+
+_NON_DIGITS = re.compile(r"\D")
+
+Dimensions = Tuple[int, int, int]
+# fetch(cep do destinatário, peso em kg, (altura, largura, comprimento) em cm) -> serviços
+QuoteFetcher = Callable[[str, float, Dimensions], List[Dict[str, Any]]]
+
+
+class QuoteKey(NamedTuple):
+    """Faixa de cotação: prefixo do CEP, peso (g) e dimensões (cm) no limite superior da faixa."""
+
+    cep_prefix: str
+    weight_grams: int
+    dimensions: Dimensions
+
+    def __str__(self) -> str:
+        return f"{self.cep_prefix}:{self.weight_grams}:{'x'.join(map(str, self.dimensions))}"
+
+
+def clean_cep(cep: Any) -> str:
+    """CEP só com dígitos; ValueError se não tiver 8 dígitos."""
+    digits = _NON_DIGITS.sub("", str(cep or ""))
+    if len(digits) != 8:
+        raise ValueError(f"CEP inválido: {cep}")
+    return digits
+
+
+def services_from_response(data: Any) -> List[Dict[str, Any]]:
+    """Serviços disponíveis de uma resposta da cotação da Frenet, do mais barato para o mais caro."""
+    if isinstance(data, dict):
+        # A API da Frenet usa "ShippingSevicesArray" (sic)
+        data = data.get("ShippingSevicesArray") or data.get("ShippingServicesArray") or data.get("services") or []
+    services = []
+    for item in data if isinstance(data, list) else []:
+        if item.get("Error") or item.get("ShippingPrice") in (None, ""):
+            continue
+        services.append({
+            "service_code": item.get("ServiceCode"),
+            "service": item.get("ServiceDescription"),
+            "carrier": item.get("Carrier"),
+            "price": round(float(item["ShippingPrice"]), 2),
+            "delivery_days": int(item["DeliveryTime"]) if str(item.get("DeliveryTime") or "").isdigit() else None,
+        })
+    services.sort(key=lambda service: service["price"])
+    return services
+
+
+class QuoteEngine:
+    """Cotações por faixa (CEP, peso, dimensões) com cache em memória e, opcionalmente, no SQLite."""
+
+    def __init__(self, fetch: QuoteFetcher, database: Optional[Database] = None, ttl: float = 21600,
+                 cache_size: int = 50000, cep_prefix: int = 5, weight_step: float = 0.5,
+                 dimension_step: int = 5, stale_ttl: float = 604800):
+        self.fetch = fetch
+        self.database = database
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.cep_prefix = max(1, min(int(cep_prefix), 8))
+        self.weight_step_grams = max(1, round(weight_step * 1000))
+        self.dimension_step = max(1, int(dimension_step))
+        self._cache = TTLCache(ttl=ttl, maxsize=cache_size)
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+        self.counters = {"memory": 0, "database": 0, "api": 0, "stale": 0, "error": 0}
+        if database is not None:
+            self.init()
+
+    def init(self):
+        """Cria a tabela de cotações se necessário."""
+        with self.database.transaction():
+            self.database.execute("""
+            CREATE TABLE IF NOT EXISTS shipping_quotes (
+                key TEXT PRIMARY KEY,
+                services TEXT NOT NULL,
+                quoted_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )""")
+            self.database.execute("""
+            CREATE INDEX IF NOT EXISTS idx_shipping_quotes_expires ON shipping_quotes(expires_at)
+            """)
+
+    def key_for(self, cep: Any, weight_kg: float, dimensions: Dimensions) -> QuoteKey:
+        """Faixa de uma cotação; as dimensões são ordenadas (a orientação do pacote não muda a faixa)."""
+        weight_grams = max(1, math.ceil(float(weight_kg) * 1000))
+        weight_bucket = math.ceil(weight_grams / self.weight_step_grams) * self.weight_step_grams
+        step = self.dimension_step
+        dims = sorted((max(1, math.ceil(float(d) / step)) * step for d in dimensions), reverse=True)
+        return QuoteKey(clean_cep(cep)[:self.cep_prefix], weight_bucket, tuple(dims))
+
+    def quote(self, cep: Any, weight_kg: float, dimensions: Dimensions) -> Dict[str, Any]:
+        """
+        Cotação para o destino, peso (kg) e dimensões (cm).
+
+        Retorna {"key", "source", "services", "quoted_at"}. Levanta ValueError para
+        CEP inválido e a exceção da Frenet se não houver cotação, nem vencida, para a faixa.
+        """
+        recipient = clean_cep(cep)
+        key = self.key_for(recipient, weight_kg, dimensions)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return self._result(key, "memory", cached)
+
+        def load() -> Tuple[str, Dict[str, Any]]:
+            entry = self._load(key)
+            if entry is not None:
+                self._cache.set(key, entry, ttl=entry["expires_at"] - time.time())
+                return "database", entry
+            try:
+                # A faixa é cotada no limite superior: o preço vale para qualquer pacote dela
+                services = self.fetch(recipient, key.weight_grams / 1000, tuple(reversed(key.dimensions)))
+            except Exception:
+                stale = self._load(key, stale=True)
+                if stale is None:
+                    raise
+                logger.warning("⚠️ Cotação %s servida vencida (Frenet indisponível)", key)
+                return "stale", stale
+            entry = {"services": services, "quoted_at": time.time(), "expires_at": time.time() + self.ttl}
+            self._save(key, entry)
+            self._cache.set(key, entry)
+            return "api", entry
+
+        try:
+            (source, entry), _ = self._flight.do(key, load)
+        except Exception:
+            self._count("error")
+            raise
+        return self._result(key, source, entry)
+
+    def _result(self, key: QuoteKey, source: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        self._count(source)
+        return {"key": str(key), "source": source, "services": entry["services"], "quoted_at": entry["quoted_at"]}
+
+    def _load(self, key: QuoteKey, stale: bool = False) -> Optional[Dict[str, Any]]:
+        if self.database is None:
+            return None
+        now = time.time()
+        row = self.database.fetchone(
+            "SELECT services, quoted_at, expires_at FROM shipping_quotes WHERE key = ? AND expires_at > ?",
+            (str(key), now - self.stale_ttl if stale else now),
+        )
+        if not row:
+            return None
+        return {"services": json.loads(row[0]), "quoted_at": row[1], "expires_at": row[2]}
+
+    def _save(self, key: QuoteKey, entry: Dict[str, Any]):
+        if self.database is None:
+            return
+        self._purge_expired(entry["quoted_at"])
+        self.database.execute("""
+        INSERT INTO shipping_quotes(key, services, quoted_at, expires_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET
+            services = excluded.services, quoted_at = excluded.quoted_at, expires_at = excluded.expires_at
+        """, (str(key), json.dumps(entry["services"], ensure_ascii=False, separators=(",", ":")),
+              entry["quoted_at"], entry["expires_at"]))
+
+    def _purge_expired(self, now: float):
+        """Remove cotações vencidas há mais de stale_ttl, no máximo uma vez por hora."""
+        with self._lock:
+            if now - self._purged_at < 3600:
+                return
+            self._purged_at = now
+        cur = self.database.execute("DELETE FROM shipping_quotes WHERE expires_at <= ?", (now - self.stale_ttl,))
+        if cur.rowcount:
+            logger.info("🧹 %s cotações de frete vencidas removidas", cur.rowcount)
+
+    def _count(self, source: str):
+        with self._lock:
+            self.counters[source] += 1
+        QUOTE_REQUESTS.labels(source).inc()
+
+    def stats(self) -> Dict[str, Any]:
+        """Resumo para o endpoint /health."""
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            **counters,
+            "persistent": self.database is not None,
+            "in_flight": len(self._flight.in_flight()),
+            "cache": self._cache.stats(),
+        }
@@ -0,0 +1,86 @@
+"""
+Controle de taxa para chamadas externas (Frenet, Bagy).
+
+- TokenBucket: limita requisições por segundo com rajada configurável (rate 0 = sem limite)
+- HostThrottle: combina limite de concorrência e token bucket por host
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """Token bucket thread-safe: `rate` tokens por segundo, até `capacity` acumulados (rate 0 = sem limite)."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate < 0:
+            raise ValueError("rate não pode ser negativo")
+        self.rate = float(rate)
+        self.unlimited = self.rate == 0
+        self.capacity = float(capacity if capacity is not None else max(rate, 1.0))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Consome tokens se disponíveis, sem bloquear."""
+        if self.unlimited:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Bloqueia até haver tokens disponíveis. Retorna o tempo total de espera (s)."""
+        waited = 0.0
+        if self.unlimited:
+            return waited
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class HostThrottle:
+    """Limita concorrência e taxa de requisições por host (netloc da URL); rate 0 limita só a concorrência."""
+
+    def __init__(self, max_concurrent: int, rate: float, burst: Optional[float] = None):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.rate = rate
+        self.burst = burst
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _limits_for(self, host: str):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_concurrent)
+                self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return self._semaphores[host], self._buckets[host]
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        """Reserva uma vaga de concorrência e um token para o host da URL."""
+        host = urlparse(url).netloc or url
+        semaphore, bucket = self._limits_for(host)
+        with semaphore:
+            bucket.acquire()
+            yield
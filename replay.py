@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Reenvio em lote de pedidos para a Frenet Shipments (backfill / replay).
+
+Com a Frenet fora do ar, os pedidos ficam no fallback local (status 'pending'
+sem `frenet_response`) ou com status 'error'. Este comando seleciona esses
+pedidos na tabela orders, por status e período de criação, ou lê um arquivo
+JSONL com pedidos da Bagy (um por linha, no formato do webhook), e os envia
+de novo com send_to_frenet_shipments, em paralelo e com limite de envios por
+segundo. Pedidos do banco sem dados completos são buscados na Bagy.
+
+Cada pedido concluído é registrado na tabela replay_checkpoints com o nome da
+execução (`--name`): o mesmo comando, rodado de novo depois de uma interrupção
+(Ctrl+C, queda ou `--max-failures`), pula os pedidos já enviados e tenta de
+novo só os que falharam.
+
+    python replay.py --status pending,error --from 2026-10-01 --to 2026-10-02
+    python replay.py --input pedidos.jsonl --name carga-outubro --rate 10 --concurrency 4
+    python replay.py --status error --dry-run
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import metrics
+from db import Database
+from logconfig import SUMMARY
+from payload import normalize_order_data, order_from_data
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+REPLAYED_TOTAL = metrics.counter(
+    "bagy_frenet_orders_replayed_total",
+    "Pedidos reenviados à Frenet pelo replay por resultado (sent, failed)",
+    ["outcome"],
+)
+
+# (ID do pedido na Bagy, pedido no formato da Bagy ou None para buscar na Bagy)
+ReplayItem = Tuple[str, Optional[Dict[str, Any]]]
+
+
+class ReplayResult(NamedTuple):
+    """Resultado do reenvio de um pedido."""
+
+    order_id: str
+    outcome: str  # "sent" ou "failed"
+    order_data: Optional[Dict[str, Any]]
+    error: Optional[str]
+
+
+class ReplayCheckpoint:
+    """Pedidos já processados por uma execução do replay (tabela replay_checkpoints)."""
+
+    def __init__(self, database: Database, name: str):
+        self.database = database
+        self.name = name
+        self.init()
+
+    def init(self):
+        """Cria a tabela de checkpoints se necessário."""
+        self.database.execute("""
+        CREATE TABLE IF NOT EXISTS replay_checkpoints (
+            name TEXT NOT NULL,
+            order_id TEXT NOT NULL,
+            outcome TEXT NOT NULL,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (name, order_id)
+        )""")
+
+    def sent_ids(self) -> Set[str]:
+        """Pedidos já enviados nesta execução (pulados ao retomar)."""
+        rows = self.database.fetchall(
+            "SELECT order_id FROM replay_checkpoints WHERE name = ? AND outcome = 'sent'", (self.name,)
+        )
+        return {row[0] for row in rows}
+
+    def record_many(self, results: Sequence[ReplayResult]):
+        """Grava o resultado de cada pedido; participa da transação em andamento, se houver."""
+        now = time.time()
+        self.database.executemany("""
+        INSERT INTO replay_checkpoints(name, order_id, outcome, error, updated_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(name, order_id) DO UPDATE SET
+            outcome = excluded.outcome, error = excluded.error,
+            attempts = attempts + 1, updated_at = excluded.updated_at
+        """, [(self.name, r.order_id, r.outcome, r.error, now) for r in results])
+
+    def reset(self) -> int:
+        """Apaga o checkpoint desta execução (o próximo replay começa do zero)."""
+        return self.database.execute("DELETE FROM replay_checkpoints WHERE name = ?", (self.name,)).rowcount
+
+    def stats(self) -> Dict[str, int]:
+        """Pedidos por resultado nesta execução."""
+        rows = self.database.fetchall(
+            "SELECT outcome, COUNT(*) FROM replay_checkpoints WHERE name = ? GROUP BY outcome", (self.name,)
+        )
+        return {outcome: count for outcome, count in rows}
+
+
+def _order_filter(statuses: Sequence[str], date_from: Optional[str], date_to: Optional[str],
+                  include_sent: bool) -> Tuple[str, List[Any]]:
+    where = [f"status IN ({','.join('?' for _ in statuses)})"]
+    params: List[Any] = list(statuses)
+    if date_from:
+        where.append("created_at >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("created_at <= ?")
+        params.append(date_to)
+    if not include_sent:
+        # Pedidos aceitos pela Frenet guardam a resposta (o ID pode faltar nela); o fallback local não
+        where.append("(order_data_json IS NULL OR json_extract(order_data_json, '$.frenet_response') IS NULL)")
+    return " AND ".join(where), params
+
+
+def count_orders(database: Database, statuses: Sequence[str], date_from: Optional[str] = None,
+                 date_to: Optional[str] = None, include_sent: bool = False) -> int:
+    """Quantos pedidos select_orders vai devolver."""
+    where, params = _order_filter(statuses, date_from, date_to, include_sent)
+    return database.fetchone(f"SELECT COUNT(*) FROM main.orders WHERE {where}", params)[0]
+
+
+def select_orders(database: Database, statuses: Sequence[str], date_from: Optional[str] = None,
+                  date_to: Optional[str] = None, include_sent: bool = False, page_size: int = 500) -> Iterator[ReplayItem]:
+    """
+    Pedidos da tabela orders com os status informados, criados entre date_from e date_to, do mais antigo
+    para o mais recente. Lidos em páginas por (created_at, id); sem `include_sent`, pedidos já criados na
+    Frenet ficam de fora.
+    """
+    where, params = _order_filter(statuses, date_from, date_to, include_sent)
+    last: Tuple[str, int] = ("", 0)
+    while True:
+        rows = database.fetchall(f"""
+        SELECT bagy_order_id, order_data_json, created_at, id FROM main.orders
+        WHERE {where} AND (created_at, id) > (?, ?)
+        ORDER BY created_at, id
+        LIMIT ?
+        """, [*params, *last, page_size])
+        for order_id, order_data_json, *_ in rows:
+            order_data = json.loads(order_data_json) if order_data_json else {}
+            if (order_data.get("address") or {}).get("zipcode") and order_data.get("customer"):
+                yield order_id, {**order_from_data(order_data), "id": order_id}
+            else:
+                # Só a transição de status foi gravada (ex.: job esgotado na fila): busca na Bagy
+                yield order_id, None
+        if len(rows) < page_size:
+            return
+        last = (rows[-1][2], rows[-1][3])
+
+
+def read_jsonl(path: str) -> Iterator[ReplayItem]:
+    """Pedidos da Bagy de um arquivo JSONL (pedido direto ou {"event", "data"}); linhas inválidas são ignoradas."""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                pedido = normalize_order_data(json.loads(line))
+                order_id = str(pedido["id"])
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning("⚠️  %s:%s ignorada: %s", path, line_number, e)
+                continue
+            yield order_id, pedido
+
+
+def count_jsonl(path: str) -> int:
+    with open(path, encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def order_saver(database: Database, db_save: Callable[..., None],
+                db_save_many: Callable[[List[Tuple]], None]) -> Callable[[List[ReplayResult]], None]:
+    """
+    Gravação dos resultados: enviado → 'pending' com os dados da Frenet, como no webhook. Falha → só
+    last_error/retry_count, sem mudar o status (um pedido do fallback continua no fallback); pedidos
+    que ainda não estão no banco (JSONL) entram como 'error'.
+    """
+    def save(results: List[ReplayResult]):
+        for result in results:
+            if result.outcome == "sent":
+                db_save(result.order_id, tracking=None, status="pending", order_data=result.order_data)
+        failed = [r for r in results if r.outcome == "failed"]
+        if not failed:
+            return
+        placeholders = ",".join("?" for _ in failed)
+        existing = {row[0] for row in database.fetchall(
+            f"SELECT bagy_order_id FROM main.orders WHERE bagy_order_id IN ({placeholders})", [r.order_id for r in failed]
+        )}
+        db_save_many([(r.order_id, None, None if r.order_id in existing else "error", r.error) for r in failed])
+    return save
+
+
+class ReplayRunner:
+    """
+    Reenvia pedidos com `concurrency` threads e no máximo `rate` envios por segundo (0 = sem limite).
+
+    Os resultados são gravados pela thread que chama run(), em lotes de `flush_size`, junto com o
+    checkpoint (`save(resultados)` e checkpoint na mesma transação). Depois de `max_failures` falhas
+    seguidas (ex.: Frenet fora do ar de novo) a execução para, para ser retomada mais tarde.
+    """
+
+    def __init__(self, send: Callable[[Dict[str, Any]], Dict[str, Any]], checkpoint: ReplayCheckpoint,
+                 save: Callable[[List[ReplayResult]], None], fetch: Optional[Callable[[str], Dict[str, Any]]] = None,
+                 concurrency: int = 8, rate: float = 20.0, max_failures: int = 50,
+                 progress_interval: float = 10.0, flush_size: int = 50):
+        self.send = send
+        self.checkpoint = checkpoint
+        self.save = save
+        self.fetch = fetch
+        self.concurrency = max(1, int(concurrency))
+        self.bucket = TokenBucket(rate) if rate > 0 else None
+        self.max_failures = max_failures
+        self.progress_interval = progress_interval
+        self.flush_size = max(1, flush_size)
+        self.counters = {"sent": 0, "failed": 0, "skipped": 0}
+        self._consecutive_failures = 0
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Para de enviar novos pedidos (os que já estão em andamento terminam)."""
+        self._stop.set()
+
+    def _replay_one(self, order_id: str, pedido: Optional[Dict[str, Any]]) -> Optional[ReplayResult]:
+        """Envia um pedido; None se a execução parou antes do envio (o pedido fica para a próxima)."""
+        try:
+            if pedido is None:
+                if self.fetch is None:
+                    raise ValueError("Pedido sem dados no banco")
+                pedido = self.fetch(order_id)
+            if self.bucket:
+                self.bucket.acquire()
+            if self._stop.is_set():
+                return None
+            return ReplayResult(order_id, "sent", self.send(pedido), None)
+        except Exception as e:
+            return ReplayResult(order_id, "failed", None, str(e) or type(e).__name__)
+
+    def _collect(self, finished: Iterable[Future], buffer: List[ReplayResult]):
+        for future in finished:
+            if future.cancelled():
+                continue
+            result = future.result()
+            if result is None:
+                continue
+            buffer.append(result)
+            self.counters[result.outcome] += 1
+            REPLAYED_TOTAL.labels(result.outcome).inc()
+            if result.outcome == "failed":
+                self._consecutive_failures += 1
+                logger.warning("❌ Pedido %s não reenviado: %s", result.order_id, result.error)
+            else:
+                self._consecutive_failures = 0
+        if self.max_failures and self._consecutive_failures >= self.max_failures and not self._stop.is_set():
+            logger.error("🛑 %s falhas seguidas: replay interrompido (rode de novo para retomar)", self._consecutive_failures)
+            self.stop()
+
+    def _flush(self, buffer: List[ReplayResult]):
+        if not buffer:
+            return
+        with self.checkpoint.database.transaction():
+            self.save(buffer)
+            self.checkpoint.record_many(buffer)
+        buffer.clear()
+
+    def _report(self, started: float, total: Optional[int], final: bool = False) -> Dict[str, Any]:
+        elapsed = time.monotonic() - started
+        processed = self.counters["sent"] + self.counters["failed"]
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        report: Dict[str, Any] = {
+            **self.counters,
+            "processed": processed,
+            "total": total,
+            "duration_seconds": round(elapsed, 3),
+            "orders_per_second": round(rate, 2),
+        }
+        remaining = total - processed - self.counters["skipped"] if total is not None else None
+        if remaining is not None and rate > 0 and not final:
+            report["eta_seconds"] = round(max(remaining, 0) / rate)
+        logger.log(
+            SUMMARY, "🔁 Replay %s: %s/%s | ✅ %s enviados | ❌ %s falhas | ⏭️  %s pulados | %.1f pedidos/s%s",
+            self.checkpoint.name, processed + self.counters["skipped"], total if total is not None else "?",
+            self.counters["sent"], self.counters["failed"], self.counters["skipped"], rate,
+            f" | ETA {report['eta_seconds']}s" if "eta_seconds" in report else ""
+        )
+        return report
+
+    def run(self, orders: Iterable[ReplayItem], total: Optional[int] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Reenvia os pedidos (lidos sob demanda, no máximo 2 × concurrency em andamento) e retorna o
+        relatório final. Ctrl+C para de enviar, espera os envios em andamento e grava o checkpoint.
+        """
+        done = self.checkpoint.sent_ids()
+        started = last_report = last_flush = time.monotonic()
+        pending: Set[Future] = set()
+        buffer: List[ReplayResult] = []
+        submitted = 0
+        interrupted = False
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="Replay")
+        try:
+            for order_id, pedido in orders:
+                if self._stop.is_set() or (limit is not None and submitted >= limit):
+                    break
+                if order_id in done:
+                    self.counters["skipped"] += 1
+                    continue
+                done.add(order_id)  # pedidos repetidos na entrada são enviados uma vez
+                while len(pending) >= self.concurrency * 2:
+                    finished, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                    self._collect(finished, buffer)
+                pending.add(executor.submit(self._replay_one, order_id, pedido))
+                submitted += 1
+                now = time.monotonic()
+                if len(buffer) >= self.flush_size or (buffer and now - last_flush >= 1.0):
+                    self._flush(buffer)
+                    last_flush = now
+                if now - last_report >= self.progress_interval:
+                    self._report(started, total)
+                    last_report = now
+            while pending:
+                finished, pending = wait(pending, timeout=self.progress_interval, return_when=FIRST_COMPLETED)
+                self._collect(finished, buffer)
+                if len(buffer) >= self.flush_size:
+                    self._flush(buffer)
+                if time.monotonic() - last_report >= self.progress_interval:
+                    self._report(started, total)
+                    last_report = time.monotonic()
+        except KeyboardInterrupt:
+            interrupted = True
+            logger.warning("⏹️  Replay interrompido: aguardando os envios em andamento...")
+            self.stop()
+            executor.shutdown(wait=True, cancel_futures=True)
+            self._collect(pending, buffer)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            self._flush(buffer)
+        report = self._report(started, total, final=True)
+        return {"name": self.checkpoint.name, **report, "interrupted": interrupted or self._stop.is_set()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_argument_group("pedidos")
+    source.add_argument("--status", default="pending,error", help="status na tabela orders (separados por vírgula)")
+    source.add_argument("--from", dest="date_from", help="criados a partir de (AAAA-MM-DD ou AAAA-MM-DD HH:MM:SS)")
+    source.add_argument("--to", dest="date_to", help="criados até (AAAA-MM-DD inclui o dia inteiro)")
+    source.add_argument("--include-sent", action="store_true", help="inclui pedidos já aceitos pela Frenet")
+    source.add_argument("--input", help="arquivo JSONL com pedidos da Bagy (no lugar da tabela orders)")
+    source.add_argument("--refetch", action="store_true", help="busca cada pedido do banco de novo na Bagy")
+    run = parser.add_argument_group("execução")
+    run.add_argument("--name", help="nome do checkpoint (padrão: derivado da seleção)")
+    run.add_argument("--restart", action="store_true", help="apaga o checkpoint e começa do zero")
+    run.add_argument("--concurrency", type=int, help="envios simultâneos (padrão: REPLAY_CONCURRENCY)")
+    run.add_argument("--rate", type=float, help="envios por segundo, 0 = sem limite (padrão: REPLAY_RATE_LIMIT)")
+    run.add_argument("--limit", type=int, help="no máximo N pedidos nesta execução")
+    run.add_argument("--max-failures", type=int, default=50, help="falhas seguidas antes de parar (0 = nunca)")
+    run.add_argument("--progress", type=float, default=10.0, help="intervalo do relatório de progresso (s)")
+    run.add_argument("--dry-run", action="store_true", help="só conta os pedidos selecionados")
+    run.add_argument("--verbose", action="store_true", help="log completo de cada envio (padrão: LOG_LEVEL=QUIET)")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        os.environ.setdefault("LOG_LEVEL", "QUIET")
+    import main as app
+
+    statuses = [status.strip() for status in args.status.split(",") if status.strip()]
+    date_from = app.parse_date_arg(args.date_from)
+    date_to = app.parse_date_arg(args.date_to, end_of_day=True)
+    name = args.name or (
+        f"jsonl:{os.path.basename(args.input)}" if args.input
+        else f"orders:{','.join(statuses)}:{date_from or '-'}:{date_to or '-'}"
+    )
+    checkpoint = ReplayCheckpoint(app.database, name)
+    if args.restart:
+        logger.log(SUMMARY, "🧹 Checkpoint %s apagado (%s pedidos)", name, checkpoint.reset())
+
+    if args.input:
+        orders: Iterable[ReplayItem] = read_jsonl(args.input)
+        total = count_jsonl(args.input)
+    else:
+        orders = select_orders(app.database, statuses, date_from, date_to, args.include_sent)
+        total = count_orders(app.database, statuses, date_from, date_to, args.include_sent)
+        if args.refetch:
+            orders = ((order_id, None) for order_id, _ in orders)
+
+    if args.dry_run:
+        already = len(checkpoint.sent_ids())
+        print(json.dumps({"name": name, "selected": total, "already_sent": already, "checkpoint": checkpoint.stats()}))
+        return
+
+    runner = ReplayRunner(
+        app.send_to_frenet_shipments, checkpoint, order_saver(app.database, app.db_save, app.db_save_many), fetch=app.bagy_get_order,
+        concurrency=args.concurrency or app.REPLAY_CONCURRENCY,
+        rate=app.REPLAY_RATE_LIMIT if args.rate is None else args.rate,
+        max_failures=args.max_failures, progress_interval=args.progress
+    )
+    logger.log(SUMMARY, "🔁 Replay %s: %s pedidos selecionados | %s threads | %s envios/s",
+               name, total, runner.concurrency, f"{runner.bucket.rate:g}" if runner.bucket else "sem limite de")
+    report = runner.run(orders, total=total, limit=args.limit)
+    print(json.dumps(report, ensure_ascii=False))
+    return report
+
+
+if __name__ == "__main__":
+    result = main()
+    # Código 1 se a execução parou antes do fim ou algum pedido falhou (rode de novo para retomar)
+    sys.exit(1 if result and (result["interrupted"] or result["failed"]) else 0)
@@ -0,0 +1,224 @@
+"""
+Políticas de resiliência para as chamadas externas (Bagy, Frenet).
+
+- HttpError: erro HTTP com status e Retry-After
+- is_retryable: separa falhas transitórias (timeout, conexão, 408/425/429/5xx)
+  de erros definitivos (4xx de validação, configuração)
+- CircuitBreaker: abre após falhas seguidas e rejeita chamadas (fail fast)
+  até `reset_timeout`; depois libera uma chamada de teste (half-open)
+- RetryPolicy: backoff exponencial com jitter, respeitando Retry-After,
+  só para erros transitórios, com contadores para o /health e o /metrics
+"""
+import email.utils
+import logging
+import random
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RESILIENCE_EVENTS = metrics.counter(
+    "bagy_frenet_resilience_events_total",
+    "Chamadas, retries, falhas e aberturas de circuito por política",
+    ["policy", "event"],
+)
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class HttpError(Exception):
+    """Resposta HTTP de erro de uma API externa."""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_response(cls, prefix: str, response: requests.Response) -> "HttpError":
+        return cls(
+            f"{prefix} [HTTP {response.status_code}]: {response.text}",
+            response.status_code,
+            parse_retry_after(response.headers.get("Retry-After")),
+        )
+
+
+class CircuitOpenError(Exception):
+    """Chamada rejeitada sem ir à rede: o circuito do endpoint está aberto."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuito '{name}' aberto (nova tentativa em {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After em segundos (aceita número ou data HTTP)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, moment.timestamp() - time.time())
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True para falhas transitórias, que valem uma nova tentativa."""
+    if isinstance(error, HttpError):
+        return error.status_code in RETRYABLE_STATUS
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in RETRYABLE_STATUS
+    return isinstance(error, (requests.Timeout, requests.ConnectionError))
+
+
+class CircuitBreaker:
+    """Circuit breaker por endpoint: closed → open (após falhas seguidas) → half_open → closed."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Levanta CircuitOpenError se a chamada não deve ir à rede."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            elapsed = time.monotonic() - self.opened_at
+            if self.state == self.OPEN and elapsed >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+            self.rejected += 1
+            retry_in = max(self.reset_timeout - elapsed, 0.0)
+        raise CircuitOpenError(self.name, retry_in)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("✅ Circuito '%s' fechado novamente", self.name)
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    RESILIENCE_EVENTS.labels(self.name, "circuit_opened").inc()
+                    logger.warning("🔌 Circuito '%s' aberto após %s falhas seguidas", self.name, self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+
+
+class RetryPolicy:
+    """Executa chamadas com retry seletivo, backoff exponencial com jitter e circuit breaker opcional."""
+
+    def __init__(self, name: str, max_attempts: int = 3, base_delay: float = 1.0, max_delay: float = 30.0,
+                 breaker: Optional[CircuitBreaker] = None, sleep: Callable[[float], None] = time.sleep):
+        self.name = name
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+        self.sleep = sleep
+        self.counters = {"calls": 0, "successes": 0, "retries": 0, "failures": 0, "fatal": 0, "short_circuited": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+        RESILIENCE_EVENTS.labels(self.name, name).inc()
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        """Espera antes da próxima tentativa: Retry-After, se houver; senão backoff exponencial com full jitter."""
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        self._count("calls")
+        for attempt in range(1, self.max_attempts + 1):
+            if self.breaker:
+                try:
+                    self.breaker.before_call()
+                except CircuitOpenError:
+                    self._count("short_circuited")
+                    raise
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                retryable = is_retryable(e)
+                if self.breaker:
+                    # 4xx e erros de validação mostram que o endpoint está respondendo
+                    self.breaker.record_failure() if retryable else self.breaker.record_success()
+                if not retryable:
+                    self._count("fatal")
+                    raise
+                if attempt >= self.max_attempts:
+                    self._count("failures")
+                    logger.error("❌ Todas as %s tentativas falharam para %s: %s", self.max_attempts, self.name, e)
+                    raise
+                delay = self.backoff(attempt, e)
+                self._count("retries")
+                logger.warning("⚠️  Tentativa %s/%s falhou para %s: %s. Tentando novamente em %.1fs...", attempt, self.max_attempts, self.name, e, delay)
+                self.sleep(delay)
+            else:
+                if self.breaker:
+                    self.breaker.record_success()
+                self._count("successes")
+                return result
+
+    def __call__(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Uso como decorador."""
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return self.call(func, *args, **kwargs)
+        wrapper.policy = self
+        return wrapper
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            result: Dict[str, Any] = {"max_attempts": self.max_attempts, **self.counters}
+        if self.breaker:
+            result["breaker"] = self.breaker.status()
+        return result
+
+
+def resilience_status(policies: List[RetryPolicy]) -> Dict[str, Any]:
+    """Estado de cada política (retries e circuit breaker) para o /health."""
+    return {policy.name: policy.status() for policy in policies}
@@ -0,0 +1,49 @@
+"""
+Fixtures dos testes unitários.
+
+- `database`: banco SQLite novo por teste (arquivo temporário)
+- `app`: o módulo main importado uma vez, com banco e arquivo morto temporários,
+  sem rastreio em background e sem rede (tokens fictícios)
+"""
+import logging
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import Database  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path):
+    return Database(str(tmp_path / "test.db"))
+
+
+@pytest.fixture(scope="session")
+def app():
+    workdir = tempfile.mkdtemp(prefix="bagy-frenet-tests-")
+    os.environ.update({
+        "DB_PATH": os.path.join(workdir, "main.db"),
+        "BAGY_TOKEN": "test",
+        "FRENET_TOKEN": "test",
+        "BAGY_BASE": "http://127.0.0.1:9",
+        "TRACKER_ENABLED": "false",
+        "ARCHIVE_ENABLED": "true",
+        "CATALOG_REFRESH_INTERVAL": "0",
+    })
+    import main
+    logging.getLogger().setLevel(logging.WARNING)
+    return main
+
+
+@pytest.fixture
+def order_ids(request):
+    """Prefixo único por teste para os pedidos gravados no banco compartilhado de `app`."""
+    prefix = request.node.name.replace("[", "-").replace("]", "")
+
+    def make(count):
+        return [f"{prefix}-{i}" for i in range(count)]
+    return make
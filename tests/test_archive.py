@@ -0,0 +1,66 @@
+def seed(app, order_ids, day):
+    """Pedidos de um dia só (isolados dos demais testes pelo filtro de data), metade arquivada."""
+    ids = order_ids(10)
+    for i, order_id in enumerate(ids):
+        app.db_save(order_id, tracking=f"BR{i}", status="delivered" if i % 2 else "created")
+        app.database.execute(
+            "UPDATE orders SET created_at = ?, updated_at = ? WHERE bagy_order_id = ?",
+            (f"{day} 10:00:{i:02d}", f"{day} 12:00:00", order_id)
+        )
+    moved = app.order_archive.archive_batch(f"{day} 23:59:59", f"{day} 23:59:59", limit=100)
+    assert moved["moved"] == {"delivered": 5}
+    return ids
+
+
+def list_all(app, day, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        orders, cursor = app.db_list_orders(
+            limit=limit, cursor=cursor, date_from=f"{day} 00:00:00", date_to=f"{day} 23:59:59",
+            fields=["bagy_order_id", "status"], **filters
+        )
+        pages.append([order["bagy_order_id"] for order in orders])
+        if not cursor:
+            return pages
+
+
+def test_union_pagination_interleaves_hot_and_archived(app, order_ids):
+    ids = seed(app, order_ids, "2001-01-01")
+    pages = list_all(app, "2001-01-01", limit=3)
+    assert [len(page) for page in pages] == [3, 3, 3, 1]
+    assert [order_id for page in pages for order_id in page] == ids[::-1]
+
+
+def test_archived_status_filter(app, order_ids):
+    ids = seed(app, order_ids, "2001-01-02")
+    pages = list_all(app, "2001-01-02", limit=2, status="delivered")
+    assert [order_id for page in pages for order_id in page] == ids[1::2][::-1]
+    assert app.order_archive.status_of(ids[1]) == "delivered"
+    assert app.database.fetchone("SELECT COUNT(*) FROM main.orders WHERE bagy_order_id = ?", (ids[1],))[0] == 0
+
+
+def test_order_back_in_hot_table_is_listed_once(app, order_ids):
+    ids = seed(app, order_ids, "2001-01-03")
+    # Pedido arquivado que voltou para a tabela quente (ex.: novo webhook)
+    app.db_save(ids[1], tracking="BR1", status="error")
+    app.database.execute("UPDATE orders SET created_at = ? WHERE bagy_order_id = ?", ("2001-01-03 10:00:01", ids[1]))
+
+    listed = [order_id for page in list_all(app, "2001-01-03", limit=4) for order_id in page]
+    assert listed == ids[::-1]
+    orders, _ = app.db_list_orders(date_from="2001-01-03 10:00:01", date_to="2001-01-03 10:00:01",
+                                   fields=["bagy_order_id", "status"])
+    assert [order["status"] for order in orders] == ["error"]
+
+
+def test_age_counts_from_last_update(app, order_ids):
+    recent, old = order_ids(2)
+    for order_id, updated_at in ((recent, app.db_timestamp()), (old, "2001-01-04 12:00:00")):
+        app.db_save(order_id, tracking="BR1", status="delivered")
+        app.database.execute(
+            "UPDATE orders SET created_at = '2001-01-04 10:00:00', updated_at = ? WHERE bagy_order_id = ?",
+            (updated_at, order_id)
+        )
+    # Criado há muito tempo, mas entregue agora: continua na tabela quente
+    app.order_archive.archive_batch("2001-01-04 23:59:59", "2001-01-04 23:59:59", limit=100)
+    assert app.order_archive.status_of(recent) is None
+    assert app.order_archive.status_of(old) == "delivered"
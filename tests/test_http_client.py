@@ -0,0 +1,18 @@
+from http_client import HttpClient
+
+
+def test_reset_headers_replaces_session_headers():
+    headers = {"Authorization": "Bearer a", "X-Store": "1"}
+    client = HttpClient("test", lambda: dict(headers))
+    client._ensure_headers()
+    assert client.session.headers["X-Store"] == "1"
+
+    # Token rotacionado e header removido da configuração
+    headers.clear()
+    headers["Authorization"] = "Bearer b"
+    client.reset_headers()
+    client._ensure_headers()
+    assert client.session.headers["Authorization"] == "Bearer b"
+    assert "X-Store" not in client.session.headers
+    assert "User-Agent" in client.session.headers
+    client.close()
@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from idempotency import IdempotencyInProgress, IdempotencyStore
+
+
+def test_key_is_stable_across_key_order():
+    assert IdempotencyStore.key_for(1, {"a": 1, "b": 2}) == IdempotencyStore.key_for(1, {"b": 2, "a": 1})
+    assert IdempotencyStore.key_for(1, {"a": 1}) != IdempotencyStore.key_for(2, {"a": 1})
+
+
+def test_run_processes_once_and_replays(database):
+    store = IdempotencyStore(database)
+    calls = []
+
+    def process():
+        calls.append(1)
+        return {"ok": True}, 200
+
+    assert store.run("k", "1", process) == ({"ok": True}, 200, False)
+    assert store.run("k", "1", process) == ({"ok": True}, 200, True)
+    # Outro processo (cache vazio) lê a resposta do banco
+    assert IdempotencyStore(database).run("k", "1", process) == ({"ok": True}, 200, True)
+    assert len(calls) == 1
+
+
+def test_server_errors_and_exceptions_are_not_stored(database):
+    store = IdempotencyStore(database)
+    assert store.run("k", "1", lambda: ({"error": "x"}, 503))[2] is False
+    with pytest.raises(RuntimeError):
+        store.run("k", "1", lambda: (_ for _ in ()).throw(RuntimeError("falhou")))
+    assert store.run("k", "1", lambda: ({"ok": True}, 200)) == ({"ok": True}, 200, False)
+
+
+def test_claim_held_by_another_process(database):
+    other = IdempotencyStore(database)
+    assert other._claim("k", "1")
+    with pytest.raises(IdempotencyInProgress):
+        IdempotencyStore(database).run("k", "1", lambda: ({"ok": True}, 200))
+
+
+def test_expired_claim_can_be_taken_over(database):
+    other = IdempotencyStore(database, lock_seconds=0)
+    assert other._claim("k", "1")
+    time.sleep(0.01)
+    store = IdempotencyStore(database)
+    assert store.run("k", "1", lambda: ({"ok": True}, 201)) == ({"ok": True}, 201, False)
+
+
+def test_concurrent_deliveries_are_coalesced(database):
+    store = IdempotencyStore(database)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def process():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"ok": True}, 200
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(store.run("k", "1", process)))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.append(store.run("k", "1", process)))
+    second.start()
+    time.sleep(0.05)
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert len(calls) == 1
+    assert sorted(replayed for _, _, replayed in results) == [False, True]
+
+
+def test_forget_allows_reprocessing(database):
+    store = IdempotencyStore(database)
+    store.run("k", "1", lambda: ({"n": 1}, 200))
+    store.forget("k")
+    assert store.run("k", "1", lambda: ({"n": 2}, 200)) == ({"n": 2}, 200, False)
@@ -0,0 +1,46 @@
+import time
+
+from leader import LeaderLease
+
+
+def test_single_leader_and_renewal(database):
+    first = LeaderLease(database, "tracker", ttl=60)
+    second = LeaderLease(database, "tracker", ttl=60)
+
+    assert first.acquire()
+    assert first.epoch == 1
+    assert not second.acquire()
+    assert not second.held()
+
+    # Renovar não muda o epoch
+    assert first.acquire()
+    assert first.epoch == 1
+    assert first.held()
+    assert database.fetchone("SELECT holder FROM leases WHERE name = 'tracker'")[0] == first.holder_id
+
+
+def test_expired_lease_is_taken_over_with_new_epoch(database):
+    first = LeaderLease(database, "tracker", ttl=1)
+    second = LeaderLease(database, "tracker", ttl=60)
+    assert first.acquire()
+    database.execute("UPDATE leases SET expires_at = ? WHERE name = 'tracker'", (time.time() - 1,))
+
+    assert second.acquire()
+    assert second.epoch == 2
+    # O antigo líder não renova um lease que já é de outro
+    assert not first.acquire()
+    assert not first.held()
+
+
+def test_release_hands_over_immediately(database):
+    first = LeaderLease(database, "archive", ttl=60)
+    second = LeaderLease(database, "archive", ttl=60)
+    assert first.acquire()
+    first.release()
+    assert not first.held()
+    assert second.acquire()
+
+
+def test_leases_are_independent_by_name(database):
+    assert LeaderLease(database, "tracker").acquire()
+    assert LeaderLease(database, "archive").acquire()
@@ -0,0 +1,57 @@
+import json
+
+import metrics
+from metrics import MetricsStore, Registry
+
+
+def counter_total(snapshot, name):
+    return sum(snapshot[name]["samples"].values())
+
+
+def test_retired_live_process_is_not_counted_twice(database):
+    registry = Registry()
+    requests = registry.counter("test_requests_total", "Requisições")
+    latency = registry.histogram("test_latency_seconds", "Latência", buckets=(0.1, 1.0))
+    worker = MetricsStore(database, registry)
+    reader = MetricsStore(database, Registry())
+    # Dois workers no mesmo processo de teste: identificações distintas
+    worker.process_id, reader.process_id = "host:1:1", "host:2:2"
+
+    requests.inc(5)
+    latency.observe(0.05)
+    worker.flush()
+    # O worker ficou sem gravar por mais de stale_after (ex.: banco travado): a linha vai para 'retired'
+    database.execute("UPDATE metrics_snapshots SET updated_at = 0 WHERE process = ?", (worker.process_id,))
+    assert counter_total(reader.collect(), "test_requests_total") == 5
+    assert database.fetchone("SELECT 1 FROM metrics_snapshots WHERE process = ?", (worker.process_id,)) is None
+
+    requests.inc(2)
+    latency.observe(0.5)
+    worker.flush()
+    merged = reader.collect()
+    assert counter_total(merged, "test_requests_total") == 7
+    [buckets] = merged["test_latency_seconds"]["samples"].values()
+    assert buckets[:3] == [1, 1, 0]
+
+    # Retirado de novo: o baseline acompanha o que já foi incorporado
+    database.execute("UPDATE metrics_snapshots SET updated_at = 0 WHERE process = ?", (worker.process_id,))
+    reader.collect()
+    requests.inc(1)
+    worker.flush()
+    assert counter_total(reader.collect(), "test_requests_total") == 8
+
+
+def test_restarted_process_keeps_totals(database):
+    registry = Registry()
+    registry.counter("test_jobs_total", "Jobs").inc(3)
+    old = MetricsStore(database, registry)
+    old.flush()
+    database.execute("UPDATE metrics_snapshots SET updated_at = 0 WHERE process = ?", (old.process_id,))
+
+    fresh = Registry()
+    fresh.counter("test_jobs_total", "Jobs").inc(1)
+    new = MetricsStore(database, fresh)
+    new.process_id = "outro-host:1:1"
+    assert counter_total(new.collect(), "test_jobs_total") == 4
+    retired = database.fetchone("SELECT snapshot FROM metrics_snapshots WHERE process = ?", (metrics.RETIRED,))
+    assert counter_total(json.loads(retired[0]), "test_jobs_total") == 3
@@ -0,0 +1,133 @@
+from outbox import FulfillmentOutbox, OutboxDispatcher
+
+
+def rows(outbox):
+    return {
+        order_id: (transition, status, bool(shipped_pending))
+        for order_id, transition, status, shipped_pending in outbox.database.fetchall(
+            "SELECT order_id, transition, status, shipped_pending FROM fulfillment_outbox"
+        )
+    }
+
+
+def test_repeated_transitions_are_ignored(database):
+    outbox = FulfillmentOutbox(database)
+    assert outbox.enqueue_many([("A", "shipped", "BR1"), ("A", "shipped", "BR1")]) == 1
+    assert outbox.enqueue_many([("B", "delivered", "BR2")]) == 1
+    assert outbox.enqueue_many([("B", "shipped", "BR2"), ("B", "delivered", "BR2")]) == 0
+    assert rows(outbox) == {"A": ("shipped", "pending", False), "B": ("delivered", "pending", False)}
+
+
+def test_delivered_keeps_unsent_shipped_due(database):
+    outbox = FulfillmentOutbox(database)
+    outbox.enqueue_many([("A", "shipped", "BR1"), ("A", "delivered", None)])
+
+    [item] = outbox.claim("w", 10)
+    assert item["transition"] == "delivered"
+    assert item["shipped_pending"] is True
+    assert item["tracking_code"] == "BR1"
+
+    outbox.shipped_sent("A")
+    assert rows(outbox)["A"] == ("delivered", "sending", False)
+
+
+def test_complete_during_supersede_keeps_newer_transition(database):
+    outbox = FulfillmentOutbox(database)
+    outbox.enqueue("A", "shipped", "BR1")
+    [shipped] = outbox.claim("w", 10)
+
+    # 'delivered' chega enquanto o 'shipped' está sendo enviado
+    outbox.enqueue("A", "delivered", "BR1")
+    assert rows(outbox)["A"] == ("delivered", "pending", True)
+
+    outbox.complete(shipped)
+    # O shipped foi aceito: a entrega continua pendente, sem reenviar o shipped
+    assert rows(outbox)["A"] == ("delivered", "pending", False)
+
+
+def test_fail_during_supersede_does_not_touch_newer_transition(database):
+    outbox = FulfillmentOutbox(database)
+    outbox.enqueue("A", "shipped", "BR1")
+    [shipped] = outbox.claim("w", 10)
+    outbox.enqueue("A", "delivered", "BR1")
+
+    assert outbox.fail(shipped, "timeout") is False
+    assert rows(outbox)["A"] == ("delivered", "pending", True)
+
+
+def test_claim_is_exclusive_until_visibility_expires(database):
+    outbox = FulfillmentOutbox(database, visibility_timeout=0)
+    outbox.enqueue("A", "delivered", "BR1")
+    assert len(outbox.claim("w1", 10)) == 1
+    # Visibilidade expirada (processo morto): o item volta a ser reservável
+    [item] = outbox.claim("w2", 10)
+    assert item["attempts"] == 2
+
+    hidden = FulfillmentOutbox(database, visibility_timeout=60)
+    hidden.enqueue("B", "delivered", "BR2")
+    assert [i["order_id"] for i in hidden.claim("w1", 10)] == ["A", "B"]
+    assert hidden.claim("w2", 10) == []
+
+
+def test_dead_letter_and_reenqueue(database):
+    outbox = FulfillmentOutbox(database, max_attempts=1, retry_delay=0)
+    outbox.enqueue("A", "delivered", "BR1")
+    [item] = outbox.claim("w", 10)
+    assert outbox.fail(item, "HTTP 500") is True
+    assert outbox.stats()["dead"] == 1
+
+    # A mesma transição sai da dead-letter ao ser registrada de novo
+    assert outbox.enqueue("A", "delivered", "BR1")
+    assert rows(outbox)["A"] == ("delivered", "pending", False)
+
+
+def test_existing_table_gets_shipped_pending_column(database):
+    database.execute("""
+    CREATE TABLE fulfillment_outbox (
+        order_id TEXT PRIMARY KEY, transition TEXT NOT NULL, rank INTEGER NOT NULL, tracking_code TEXT,
+        status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, available_at REAL NOT NULL,
+        last_error TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP, updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )""")
+    outbox = FulfillmentOutbox(database)
+    outbox.enqueue_many([("A", "shipped", "BR1"), ("A", "delivered", "BR1")])
+    assert rows(outbox)["A"] == ("delivered", "pending", True)
+
+
+def test_dispatcher_sends_and_retries(database):
+    outbox = FulfillmentOutbox(database, retry_delay=0)
+    outbox.enqueue_many([("A", "delivered", "BR1"), ("B", "delivered", "BR2")])
+    sent = []
+
+    def send(item):
+        if item["order_id"] == "B" and item["attempts"] == 1:
+            raise RuntimeError("HTTP 503")
+        sent.append(item["order_id"])
+
+    dispatcher = OutboxDispatcher(outbox, send, concurrency=2)
+    assert dispatcher.drain_once() == 2
+    assert dispatcher.drain_once() == 1
+    assert sorted(sent) == ["A", "B"]
+    assert outbox.stats() == {"pending": 0, "sending": 0, "dead": 0}
+    assert dispatcher.status()["failed"] == 1
+
+
+def test_send_fulfillment_sends_superseded_shipped_first(app, order_ids, monkeypatch):
+    [order_id] = order_ids(1)
+    calls = []
+    monkeypatch.setattr(app, "bagy_mark_shipped", lambda oid, code: calls.append(("shipped", oid, code)))
+    monkeypatch.setattr(app, "bagy_mark_delivered", lambda oid: calls.append(("delivered", oid)))
+    app.fulfillment_outbox.enqueue_many([(order_id, "shipped", "BR1"), (order_id, "delivered", "BR1")])
+
+    [item] = [i for i in app.fulfillment_outbox.claim("test", 1000) if i["order_id"] == order_id]
+    app.send_fulfillment(item)
+    assert calls == [("shipped", order_id, "BR1"), ("delivered", order_id)]
+
+    # Se o delivered falhar, a nova tentativa não repete o shipped
+    app.fulfillment_outbox.fail(item, "HTTP 503")
+    app.database.execute("UPDATE fulfillment_outbox SET available_at = 0 WHERE order_id = ?", (order_id,))
+    [retry] = [i for i in app.fulfillment_outbox.claim("test", 1000) if i["order_id"] == order_id]
+    assert retry["shipped_pending"] is False
+    calls.clear()
+    app.send_fulfillment(retry)
+    app.fulfillment_outbox.complete(retry)
+    assert calls == [("delivered", order_id)]
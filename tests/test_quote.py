@@ -0,0 +1,19 @@
+import json
+
+
+def test_invalid_frenet_response_falls_back(app, monkeypatch):
+    def broken(cep, weight, dimensions):
+        raise json.JSONDecodeError("Expecting value", "", 0)
+
+    monkeypatch.setattr(app.quote_engine, "quote", broken)
+    response = app.app.test_client().get("/quote?cep=01310-100&weight=1")
+    assert response.status_code == 503
+    assert response.get_json()["fallback"] == {"carrier": app.FORCE_CARRIER_NAME, "price": app.FORCE_VALUE}
+
+
+def test_invalid_parameters_are_rejected(app, monkeypatch):
+    monkeypatch.setattr(app.quote_engine, "quote", lambda *args: {})
+    client = app.app.test_client()
+    assert client.get("/quote?cep=123&weight=1").status_code == 400
+    assert client.get("/quote?cep=01310-100&weight=abc").status_code == 400
+    assert client.get("/quote?cep=01310-100&weight=1").get_json()["cep"] == "01310100"
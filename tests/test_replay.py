@@ -0,0 +1,107 @@
+import threading
+
+from replay import ReplayCheckpoint, ReplayResult, ReplayRunner, count_orders, order_saver, select_orders
+
+
+def seed(app, order_ids, day, count, order_data=None):
+    ids = order_ids(count)
+    for i, order_id in enumerate(ids):
+        app.db_save(order_id, tracking=None, status="pending", order_data=order_data)
+        app.database.execute(
+            "UPDATE orders SET created_at = ? WHERE bagy_order_id = ?", (f"{day} 10:00:{i:02d}", order_id)
+        )
+    return ids
+
+
+def orders(app, day, **kwargs):
+    return select_orders(app.database, ["pending", "error"], f"{day} 00:00:00", f"{day} 23:59:59", **kwargs)
+
+
+def selection(app, day, **kwargs):
+    return [order_id for order_id, _ in orders(app, day, **kwargs)]
+
+
+class FakeFrenet:
+    """send() do replay: responde como a Frenet e conta os envios por pedido."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def __call__(self, pedido):
+        if pedido["id"] in self.fail:
+            raise RuntimeError("Erro Frenet [HTTP 503]")
+        with self._lock:
+            self.sent.append(pedido["id"])
+        return {"order_id": pedido["id"], "frenet_response": {}}
+
+
+def runner(app, send, name, **kwargs):
+    save = order_saver(app.database, app.db_save, app.db_save_many)
+    return ReplayRunner(send, ReplayCheckpoint(app.database, name), save, fetch=lambda order_id: {"id": order_id},
+                        concurrency=2, rate=0, progress_interval=3600, **kwargs)
+
+
+def test_selection_excludes_orders_accepted_by_frenet(app, order_ids):
+    fallback = seed(app, order_ids, "2002-01-01", 2)
+    # Aceito pela Frenet sem OrderId na resposta: ainda assim não é reenviado
+    accepted = order_ids(3)[2]
+    app.db_save(accepted, tracking=None, status="pending", order_data={"frenet_response": {}, "frenet_order_id": None})
+    app.database.execute("UPDATE orders SET created_at = '2002-01-01 11:00:00' WHERE bagy_order_id = ?", (accepted,))
+
+    assert selection(app, "2002-01-01") == fallback
+    assert selection(app, "2002-01-01", include_sent=True) == [*fallback, accepted]
+    assert count_orders(app.database, ["pending"], "2002-01-01 00:00:00", "2002-01-01 23:59:59") == 2
+
+
+def test_selection_pages_in_creation_order(app, order_ids):
+    ids = seed(app, order_ids, "2002-01-02", 7)
+    assert selection(app, "2002-01-02", page_size=3) == ids
+
+
+def test_checkpoint_resumes_without_resending(app, order_ids):
+    day = "2002-01-03"
+    ids = seed(app, order_ids, day, 6)
+    send = FakeFrenet()
+
+    # Interrompido após 3 pedidos; a retomada inclui os já aceitos pela Frenet e depende do checkpoint
+    first = runner(app, send, f"resume-{day}").run(orders(app, day, include_sent=True), limit=3)
+    assert first["sent"] == 3
+    second = runner(app, send, f"resume-{day}").run(orders(app, day, include_sent=True))
+    assert second["sent"] == 3
+    assert second["skipped"] == 3
+    assert sorted(send.sent) == sorted(ids)
+    assert ReplayCheckpoint(app.database, f"resume-{day}").stats() == {"sent": 6}
+    # Enviados saem do fallback: a próxima seleção sem --include-sent não os devolve
+    assert selection(app, day) == []
+
+
+def test_failures_keep_status_and_stop_after_max_failures(app, order_ids):
+    day = "2002-01-04"
+    ids = seed(app, order_ids, day, 4)
+    send = FakeFrenet(fail=ids)
+    report = runner(app, send, f"fail-{day}", max_failures=2, flush_size=1).run(orders(app, day))
+    assert report["interrupted"] is True
+    assert report["failed"] >= 2
+    rows = app.database.fetchall(
+        "SELECT status, retry_count, last_error FROM orders WHERE bagy_order_id IN (?, ?, ?, ?)", ids
+    )
+    # Só as tentativas feitas contam; o pedido continua no fallback ('pending')
+    assert sum(retries for _, retries, _ in rows) == report["failed"]
+    assert {(status, error) for status, retries, error in rows if retries} == {("pending", "Erro Frenet [HTTP 503]")}
+
+
+def test_saver_creates_unknown_orders_as_error(app, order_ids):
+    existing, unknown, sent = order_ids(3)
+    app.db_save(existing, tracking=None, status="error")
+    save = order_saver(app.database, app.db_save, app.db_save_many)
+    save([
+        ReplayResult(existing, "failed", None, "timeout"),
+        ReplayResult(unknown, "failed", None, "timeout"),
+        ReplayResult(sent, "sent", {"frenet_response": {"OrderId": "F1"}}, None),
+    ])
+    status = dict(app.database.fetchall(
+        "SELECT bagy_order_id, status FROM orders WHERE bagy_order_id IN (?, ?, ?)", (existing, unknown, sent)
+    ))
+    assert status == {existing: "error", unknown: "error", sent: "pending"}
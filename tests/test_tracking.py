@@ -0,0 +1,129 @@
+import threading
+import time
+
+from ratelimit import HostThrottle, TokenBucket
+from resilience import CircuitOpenError
+from tracker import TrackingEngine
+from tracking_events import Observation, TrackingEventLog, classify
+
+
+def observation(events_hash, status="em trânsito", category="in_transit"):
+    return Observation(status, category, events_hash, 1)
+
+
+def order_row(app, order_id):
+    return app.database.fetchone(
+        "SELECT status, retry_count, last_error FROM orders WHERE bagy_order_id = ?", (order_id,)
+    )
+
+
+def test_classify_matches_whole_phrases():
+    assert classify("Objeto entregue ao destinatário") == "delivered"
+    assert classify("Entregue após tentativa anterior") == "delivered"
+    assert classify("Objeto entregue no endereço alternativo") == "delivered"
+    assert classify("Objeto não entregue - endereço incorreto") == "exception"
+    assert classify("Destinatário ausente") == "exception"
+    assert classify("Objeto devolvido ao remetente") == "exception"
+    assert classify("Objeto em trânsito - excelente") == "in_transit"
+    assert classify("") == "unknown"
+
+
+def test_event_log_keeps_returning_hash(database):
+    database.execute("CREATE TABLE orders (bagy_order_id TEXT, status TEXT)")
+    log = TrackingEventLog(database)
+    a, b = observation("a"), observation("b")
+    assert log.append([("X", "BR1", a), ("X", "BR1", a)]) == 1
+    assert log.append([("X", "BR1", b), ("X", "BR1", a)]) == 2
+    seqs = database.fetchall("SELECT events_hash, seq FROM tracking_events WHERE bagy_order_id = 'X' ORDER BY id")
+    assert seqs == [("a", 1), ("b", 2), ("a", 3)]
+
+
+def test_event_log_migrates_hash_keyed_table(database):
+    database.execute("""
+    CREATE TABLE tracking_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, bagy_order_id TEXT NOT NULL, tracking_code TEXT,
+        status TEXT NOT NULL, category TEXT NOT NULL, events_hash TEXT NOT NULL,
+        event_count INTEGER NOT NULL DEFAULT 0, observed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        processed_at TEXT, UNIQUE(bagy_order_id, events_hash)
+    )""")
+    database.executemany(
+        "INSERT INTO tracking_events(bagy_order_id, status, category, events_hash) VALUES (?, 's', 'in_transit', ?)",
+        [("X", "a"), ("Y", "a"), ("X", "b")],
+    )
+    log = TrackingEventLog(database)
+    assert database.fetchall("SELECT bagy_order_id, seq FROM tracking_events ORDER BY id") == [("X", 1), ("Y", 1), ("X", 2)]
+    assert log.append([("X", "BR1", observation("a"))]) == 1
+
+
+def test_row_leasing_is_exclusive(app, order_ids):
+    ids = order_ids(3)
+    for order_id in ids:
+        app.db_save(order_id, tracking=f"BR-{order_id}", status="shipped")
+
+    first = {order_id for order_id, _ in app.db_claim_pending("worker-1", 1000, 60)}
+    second = {order_id for order_id, _ in app.db_claim_pending("worker-2", 1000, 60)}
+    assert set(ids) <= first
+    assert not set(ids) & second
+    assert not set(ids) & {order_id for order_id, _ in app.db_pending()}
+
+    # Reserva vencida (worker morreu): o pedido volta para a fila
+    app.database.execute("UPDATE orders SET lease_until = ? WHERE bagy_order_id = ?", (app.db_timestamp(-1), ids[0]))
+    assert ids[0] in {order_id for order_id, _ in app.db_claim_pending("worker-2", 1000, 60)}
+
+
+def test_track_batch_records_failed_lookups(app, order_ids, monkeypatch):
+    found, failed, open_circuit = order_ids(3)
+    for order_id in (found, failed, open_circuit):
+        app.db_save(order_id, tracking=f"BR-{order_id}", status="shipped")
+    monkeypatch.setattr(app, "frenet_track_many", lambda codes: {
+        f"BR-{found}": observation("x", "objeto entregue ao destinatário", "delivered"),
+        f"BR-{failed}": RuntimeError("Erro Frenet rastreio [HTTP 500]"),
+        f"BR-{open_circuit}": CircuitOpenError("frenet_tracking", 10),
+    })
+    monkeypatch.setattr(app.fulfillment_dispatcher, "notify", lambda: None)
+
+    delivered, errors = app.track_batch([(o, f"BR-{o}") for o in (found, failed, open_circuit)])
+    assert (delivered, errors) == (1, 2)
+    assert order_row(app, found)[0] == "delivered"
+    assert order_row(app, failed) == ("shipped", 1, "Erro Frenet rastreio [HTTP 500]")
+    # Circuito aberto: não conta tentativa, para não aposentar o rastreio durante a indisponibilidade
+    assert order_row(app, open_circuit) == ("shipped", 0, None)
+
+
+def test_delivery_without_movement_enqueues_shipped_first(app, order_ids, monkeypatch):
+    [order_id] = order_ids(1)
+    app.db_save(order_id, tracking="BR1", status="created")
+    monkeypatch.setattr(app.fulfillment_dispatcher, "notify", lambda: None)
+
+    app.db_apply_observations([(order_id, "BR1", observation("x", "objeto entregue", "delivered"))])
+    row = app.database.fetchone(
+        "SELECT transition, shipped_pending FROM fulfillment_outbox WHERE order_id = ?", (order_id,)
+    )
+    assert row == ("delivered", 1)
+
+
+def test_sweep_stops_when_leadership_is_lost():
+    checked = []
+    lock = threading.Lock()
+
+    def check(order_id, code):
+        time.sleep(0.005)
+        with lock:
+            checked.append(order_id)
+        return False
+
+    engine = TrackingEngine(check, concurrency=2)
+    try:
+        result = engine.sweep([(i, "BR") for i in range(100)], should_continue=lambda: len(checked) < 5)
+    finally:
+        engine.shutdown()
+    assert result["stopped"] is True
+    assert result["checked"] == len(checked) < 100
+
+
+def test_zero_rate_is_unlimited():
+    bucket = TokenBucket(0)
+    assert all(bucket.try_acquire() for _ in range(1000))
+    assert bucket.acquire() == 0.0
+    with HostThrottle(2, 0).slot("http://frenet.local/tracking"):
+        pass
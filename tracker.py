@@ -0,0 +1,245 @@
+"""
+Motor de rastreio concorrente.
+
+Executa a verificação dos pedidos pendentes em um pool de threads com
+concorrência configurável. O controle de taxa por host fica a cargo da
+função de verificação (ver ratelimit.HostThrottle).
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SWEEP_SECONDS = metrics.histogram(
+    "bagy_frenet_tracking_sweep_duration_seconds",
+    "Duração das varreduras de rastreio",
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+SWEEP_ORDERS = metrics.counter(
+    "bagy_frenet_tracking_orders_total",
+    "Pedidos verificados nas varreduras de rastreio por resultado",
+    ["result"],
+)
+
+# check(order_id, tracking_code) -> True se o pedido foi entregue
+CheckFn = Callable[[str, str], bool]
+# on_error(order_id, tracking_code, exception)
+ErrorFn = Callable[[str, str, Exception], None]
+# check_batch([(order_id, tracking_code), ...]) -> (entregues, erros)
+BatchFn = Callable[[List[Tuple[str, str]]], Tuple[int, int]]
+# claim() -> próximo lote reservado para este worker ([] quando não há mais pedidos livres)
+ClaimFn = Callable[[], List[Tuple[str, str]]]
+
+
+class TrackingEngine:
+    """Executa varreduras de rastreio em paralelo e registra métricas da última varredura."""
+
+    def __init__(self, check: CheckFn, on_error: Optional[ErrorFn] = None, concurrency: int = 8):
+        self.check = check
+        self.on_error = on_error
+        self.concurrency = max(1, int(concurrency))
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="TrackingEngine")
+        self._lock = threading.Lock()
+        self.last_sweep: Dict[str, Any] = {}
+        self.total_sweeps = 0
+
+    def _run_one(self, order_id: str, code: str) -> bool:
+        try:
+            return bool(self.check(order_id, code))
+        except Exception as e:
+            if self.on_error:
+                try:
+                    self.on_error(order_id, code, e)
+                except Exception as callback_error:
+                    logger.error("❌ Erro ao registrar falha do pedido %s: %s", order_id, callback_error)
+            raise
+
+    def map(self, fn: Callable[[Any], Any], items: Iterable[Any]) -> List[Any]:
+        """Executa fn sobre os itens no pool do motor (fan-out), preservando a ordem."""
+        return list(self._executor.map(fn, items))
+
+    def sweep(self, orders: Iterable[Tuple[str, str]],
+              should_continue: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+        """
+        Verifica todos os pedidos e retorna duração e vazão da varredura.
+
+        Se should_continue() retornar False (ex.: liderança perdida), os pedidos
+        ainda não iniciados são pulados; os já em andamento terminam.
+        """
+        started = time.monotonic()
+        stop = threading.Event()
+
+        def run(order_id: str, code: str) -> Optional[bool]:
+            if stop.is_set() or (should_continue is not None and not should_continue()):
+                stop.set()
+                return None
+            return self._run_one(order_id, code)
+
+        futures = [self._executor.submit(run, order_id, code) for order_id, code in orders]
+
+        delivered = errors = skipped = 0
+        for future in as_completed(futures):
+            try:
+                outcome = future.result()
+            except Exception:
+                errors += 1
+                continue
+            if outcome is None:
+                skipped += 1
+            elif outcome:
+                delivered += 1
+
+        result = self._record(started, len(futures) - skipped, delivered, errors)
+        result["stopped"] = stop.is_set()
+        return result
+
+    def sweep_batches(self, orders: List[Tuple[str, str]], batch_size: int, check_batch: BatchFn,
+                      should_continue: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+        """
+        Verifica os pedidos em lotes de batch_size; cada lote é tratado por check_batch.
+
+        Se should_continue() retornar False (ex.: liderança perdida), a varredura
+        para antes do próximo lote; os pedidos restantes continuam vencidos.
+        """
+        started = time.monotonic()
+        delivered = errors = batches = checked = 0
+        stopped = False
+        for i in range(0, len(orders), batch_size):
+            if should_continue is not None and not should_continue():
+                stopped = True
+                break
+            batch = orders[i:i + batch_size]
+            checked += len(batch)
+            batches += 1
+            try:
+                batch_delivered, batch_errors = check_batch(batch)
+                delivered += batch_delivered
+                errors += batch_errors
+            except Exception as e:
+                logger.error("❌ Erro ao verificar lote de %s pedidos: %s", len(batch), e)
+                errors += len(batch)
+
+        result = self._record(started, checked, delivered, errors)
+        result["batches"] = batches
+        result["stopped"] = stopped
+        return result
+
+    def sweep_claimed(self, claim: ClaimFn, check_batch: BatchFn,
+                      should_continue: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+        """
+        Reserva e verifica lotes com claim() até a fila de pedidos vencidos esvaziar.
+
+        Usado quando vários processos dividem a varredura: cada lote é reservado
+        atomicamente no banco, então nenhum pedido é verificado por dois workers.
+        """
+        started = time.monotonic()
+        delivered = errors = batches = checked = 0
+        stopped = False
+        while True:
+            if should_continue is not None and not should_continue():
+                stopped = True
+                break
+            try:
+                batch = claim()
+            except Exception as e:
+                logger.error("❌ Erro ao reservar lote de rastreio: %s", e)
+                break
+            if not batch:
+                break
+            batches += 1
+            checked += len(batch)
+            try:
+                batch_delivered, batch_errors = check_batch(batch)
+                delivered += batch_delivered
+                errors += batch_errors
+            except Exception as e:
+                logger.error("❌ Erro ao verificar lote de %s pedidos: %s", len(batch), e)
+                errors += len(batch)
+
+        result = self._record(started, checked, delivered, errors)
+        result["batches"] = batches
+        result["stopped"] = stopped
+        return result
+
+    def _record(self, started: float, checked: int, delivered: int, errors: int) -> Dict[str, Any]:
+        duration = time.monotonic() - started
+        SWEEP_SECONDS.observe(duration)
+        SWEEP_ORDERS.labels("delivered").inc(delivered)
+        SWEEP_ORDERS.labels("error").inc(errors)
+        SWEEP_ORDERS.labels("in_transit").inc(max(checked - delivered - errors, 0))
+        result = {
+            "checked": checked,
+            "delivered": delivered,
+            "errors": errors,
+            "duration_seconds": round(duration, 3),
+            "throughput_per_second": round(checked / duration, 2) if duration > 0 else 0.0,
+            "concurrency": self.concurrency,
+            "finished_at": time.time(),
+        }
+        with self._lock:
+            self.last_sweep = result
+            self.total_sweeps += 1
+        return result
+
+    def status(self) -> Dict[str, Any]:
+        """Resumo para o endpoint /health."""
+        with self._lock:
+            return {
+                "concurrency": self.concurrency,
+                "total_sweeps": self.total_sweeps,
+                "last_sweep": dict(self.last_sweep),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AdaptiveSchedule:
+    """
+    Calcula o intervalo até a próxima consulta de rastreio de um pedido.
+
+    - logo após a postagem: consultas espaçadas (nada costuma mudar)
+    - perto do prazo típico de entrega: consultas no intervalo mínimo
+    - depois do prazo, ou após muitas respostas iguais: intervalo cresce até o máximo
+    - status de saída para entrega/retirada: sempre o intervalo mínimo
+    """
+
+    URGENT_KEYWORDS = ("saiu para entrega", "out for delivery", "aguardando retirada", "tentativa de entrega")
+
+    def __init__(self, min_interval: float, max_interval: float, expected_transit_days: float = 5,
+                 unchanged_step: int = 3, jitter: float = 0.1):
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max(max_interval, min_interval))
+        self.expected_transit = expected_transit_days * 86400
+        self.unchanged_step = max(1, int(unchanged_step))
+        self.jitter = jitter
+
+    def next_delay(self, age_seconds: float, status: Optional[str], unchanged_checks: int = 0) -> float:
+        """Segundos até a próxima consulta, dada a idade do envio e o histórico de status."""
+        status = (status or "").lower()
+        if any(keyword in status for keyword in self.URGENT_KEYWORDS):
+            return self.min_interval
+
+        window_start = self.expected_transit * 0.5
+        window_end = self.expected_transit * 1.5
+        if age_seconds < window_start:
+            # Recém-postado: espera até metade do tempo restante para a janela de entrega
+            delay = (window_start - age_seconds) / 2
+        elif age_seconds <= window_end:
+            delay = self.min_interval
+        else:
+            # Atrasado: dobra o intervalo a cada dia além da janela
+            days_late = (age_seconds - window_end) / 86400
+            delay = self.min_interval * (2 ** min(days_late, 10))
+
+        delay *= 2 ** min(unchanged_checks // self.unchanged_step, 10)
+        if self.jitter:
+            # Espalha as consultas para evitar rajadas no mesmo instante
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        return min(max(delay, self.min_interval), self.max_interval)
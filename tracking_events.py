@@ -0,0 +1,215 @@
+"""
+Log de mudanças de rastreio.
+
+Cada resposta de rastreio vira uma `Observation`: status atual, categoria
+(delivered, exception, in_transit, unknown) e um hash da lista de eventos
+da transportadora. Só uma mudança nesse hash gera uma linha na tabela
+`tracking_events` (única por pedido + sequência); respostas iguais à anterior
+não geram evento nenhum, mas um hash que volta (A → B → A) é uma nova mudança.
+
+As linhas nascem com `processed_at` NULL e são consumidas em ordem pelo
+rastreio (`unprocessed` / `mark_processed`): só essas mudanças atualizam o
+pedido, enfileiram a Bagy e disparam alertas.
+"""
+import hashlib
+import json
+import logging
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import metrics
+from db import Database
+
+logger = logging.getLogger(__name__)
+
+EVENTS_TOTAL = metrics.counter(
+    "bagy_frenet_tracking_events_total",
+    "Mudanças de rastreio processadas por categoria",
+    ["category"],
+)
+UNCHANGED_TOTAL = metrics.counter(
+    "bagy_frenet_tracking_unchanged_total",
+    "Respostas de rastreio idênticas à anterior (descartadas sem processar)",
+)
+
+# Frases inteiras verificadas antes da entrega: "não entregue" é exceção, não entrega,
+# mas "entregue após tentativa anterior" ou "entregue no endereço alternativo" são entregas
+EXCEPTION_PHRASES = (
+    "não entregue", "nao entregue", "não foi entregue", "nao foi entregue",
+    "entrega não efetuada", "entrega nao efetuada", "falha na entrega", "falha de entrega",
+    "devolvido", "devolvida", "em devolução", "em devolucao", "devolução ao remetente", "devolucao ao remetente",
+    "extraviado", "extraviada", "extravio", "roubado", "roubada", "roubo", "avariado", "avariada", "avaria",
+    "recusado", "recusada", "destinatário ausente", "destinatario ausente", "ausente",
+    "endereço incorreto", "endereco incorreto", "endereço insuficiente", "endereco insuficiente",
+    "endereço não localizado", "endereco nao localizado", "endereço inexistente", "endereco inexistente",
+    "retido pela fiscalização", "retido pela fiscalizacao", "retido na fiscalização", "retido na fiscalizacao",
+    "atrasado", "atraso na entrega", "exceção", "excecao", "exception",
+)
+DELIVERED_PHRASES = ("entregue", "delivered", "finalizado")
+
+
+def _phrase_pattern(phrases: Tuple[str, ...]) -> "re.Pattern[str]":
+    """Regex que casa qualquer das frases como palavras inteiras (a mais longa primeiro)."""
+    alternatives = "|".join(re.escape(phrase) for phrase in sorted(phrases, key=len, reverse=True))
+    return re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)")
+
+
+EXCEPTION_PATTERN = _phrase_pattern(EXCEPTION_PHRASES)
+DELIVERED_PATTERN = _phrase_pattern(DELIVERED_PHRASES)
+
+
+class Observation(NamedTuple):
+    """Resultado de uma consulta de rastreio."""
+
+    status: str
+    category: str
+    events_hash: str
+    event_count: int
+
+
+def classify(status: str) -> str:
+    """Categoria de um status da transportadora: delivered, exception, in_transit ou unknown."""
+    status = (status or "").lower()
+    if not status:
+        return "unknown"
+    if EXCEPTION_PATTERN.search(status):
+        return "exception"
+    if DELIVERED_PATTERN.search(status):
+        return "delivered"
+    return "in_transit"
+
+
+def events_hash(events: Any) -> str:
+    """Hash curto e estável da lista de eventos (independe da ordem das chaves)."""
+    raw = json.dumps(events, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def observation_from_response(data: Dict[str, Any]) -> Observation:
+    """Monta a Observation de uma resposta de rastreio da Frenet (item do lote ou consulta individual)."""
+    status = str(data.get("CurrentStatus") or data.get("Status") or "").lower()
+    events = data.get("TrackingEvents") or data.get("Events") or data.get("events")
+    if not isinstance(events, list) or not events:
+        # Sem lista de eventos: o próprio status identifica a mudança
+        events = [status]
+    return Observation(status, classify(status), events_hash(events), len(events))
+
+
+class TrackingEventLog:
+    """Tabela compacta de mudanças de rastreio, numeradas por pedido (`seq`) e sem repetições consecutivas."""
+
+    def __init__(self, database: Database):
+        self.database = database
+        self.init()
+
+    def init(self):
+        """Cria a tabela de eventos se necessário."""
+        with self.database.transaction():
+            self.database.execute("""
+            CREATE TABLE IF NOT EXISTS tracking_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bagy_order_id TEXT NOT NULL,
+                tracking_code TEXT,
+                status TEXT NOT NULL,
+                category TEXT NOT NULL,
+                events_hash TEXT NOT NULL,
+                event_count INTEGER NOT NULL DEFAULT 0,
+                seq INTEGER NOT NULL DEFAULT 1,
+                observed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                processed_at TEXT,
+                UNIQUE(bagy_order_id, seq)
+            )""")
+            existing = {row[1] for row in self.database.fetchall("PRAGMA table_info(tracking_events)")}
+            if "seq" not in existing:
+                self._migrate_seq()
+            self.database.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tracking_events_unprocessed ON tracking_events(id) WHERE processed_at IS NULL
+            """)
+
+    def _migrate_seq(self):
+        """Recria a tabela antiga (única por pedido + hash) numerando as mudanças de cada pedido."""
+        self.database.execute("ALTER TABLE tracking_events RENAME TO tracking_events_old")
+        self.database.execute("DROP INDEX IF EXISTS idx_tracking_events_unprocessed")
+        self.init()
+        self.database.execute("""
+        INSERT INTO tracking_events(id, bagy_order_id, tracking_code, status, category, events_hash,
+                                    event_count, seq, observed_at, processed_at)
+        SELECT id, bagy_order_id, tracking_code, status, category, events_hash, event_count,
+               ROW_NUMBER() OVER (PARTITION BY bagy_order_id ORDER BY id), observed_at, processed_at
+        FROM tracking_events_old
+        """)
+        self.database.execute("DROP TABLE tracking_events_old")
+        logger.info("🛠️  Tabela tracking_events migrada para chave (pedido, sequência)")
+
+    def append(self, changes: Iterable[Tuple[str, Optional[str], Observation]]) -> int:
+        """
+        Registra mudanças (order_id, tracking_code, observation).
+
+        Participa da transação em andamento, se houver. Cada mudança recebe a próxima
+        sequência do pedido; uma mudança com o mesmo hash da última registrada é
+        ignorada. Retorna quantas linhas foram criadas.
+        """
+        rows = [
+            (order_id, code, obs.status, obs.category, obs.events_hash, obs.event_count)
+            for order_id, code, obs in changes
+        ]
+        if not rows:
+            return 0
+        with self.database.transaction() as con:
+            before = con.total_changes
+            self.database.executemany("""
+            INSERT OR IGNORE INTO tracking_events(bagy_order_id, tracking_code, status, category, events_hash, event_count, seq)
+            SELECT ?1, ?2, ?3, ?4, ?5, ?6, COALESCE(MAX(seq), 0) + 1
+            FROM tracking_events WHERE bagy_order_id = ?1
+            HAVING COALESCE((SELECT events_hash FROM tracking_events
+                             WHERE bagy_order_id = ?1 ORDER BY seq DESC LIMIT 1), '') != ?5
+            """, rows)
+            return con.total_changes - before
+
+    def unprocessed(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Mudanças ainda não processadas, em ordem de chegada, com o status atual do pedido."""
+        rows = self.database.fetchall("""
+        SELECT e.id, e.bagy_order_id, e.tracking_code, e.status, e.category, o.status
+        FROM tracking_events e
+        LEFT JOIN orders o ON o.bagy_order_id = e.bagy_order_id
+        WHERE e.processed_at IS NULL
+        ORDER BY e.id
+        LIMIT ?
+        """, (limit,))
+        return [
+            {"id": event_id, "order_id": order_id, "tracking_code": code, "status": status,
+             "category": category, "order_status": order_status}
+            for event_id, order_id, code, status, category, order_status in rows
+        ]
+
+    def mark_processed(self, events: List[Dict[str, Any]]):
+        """Marca as mudanças (itens de `unprocessed`) como processadas; participa da transação em andamento."""
+        if not events:
+            return
+        self.database.executemany(
+            "UPDATE tracking_events SET processed_at = CURRENT_TIMESTAMP WHERE id = ?",
+            [(event["id"],) for event in events],
+        )
+        for event in events:
+            EVENTS_TOTAL.labels(event["category"]).inc()
+
+    def history(self, order_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Mudanças de rastreio de um pedido, da mais recente para a mais antiga."""
+        rows = self.database.fetchall("""
+        SELECT status, category, event_count, observed_at, processed_at
+        FROM tracking_events WHERE bagy_order_id = ?
+        ORDER BY id DESC LIMIT ?
+        """, (order_id, limit))
+        return [
+            {"status": status, "category": category, "event_count": count,
+             "observed_at": observed_at, "processed_at": processed_at}
+            for status, category, count, observed_at, processed_at in rows
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        """Total de mudanças registradas e pendentes de processamento (para /health)."""
+        total = self.database.fetchone("SELECT COALESCE(MAX(id), 0) FROM tracking_events")[0]
+        pending = self.database.fetchone(
+            "SELECT COUNT(*) FROM tracking_events WHERE processed_at IS NULL"
+        )[0]
+        return {"total": total, "unprocessed": pending}